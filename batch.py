@@ -0,0 +1,233 @@
+"""
+batch mode: audit many files in one run.
+
+run:
+    python batch.py "drops/2024-06-*/*.csv" incoming/ --workers 8 --report report.json
+    python batch.py incoming/ --report report.csv --auto-fix
+    python batch.py incoming/ --ai
+
+globs (** works) and directories (searched recursively for csv / tsv / parquet /
+arrow / feather files, compressed csv too; a .txt only counts when it is
+named on its own) are expanded into one list of
+files. the local read / profile / rule work runs in a process pool, so there
+is one interpreter per worker instead of one per file. files are handed out
+largest first and every worker takes the next file as soon as it is free,
+so one huge file does not end up last with everyone else idle. a file that
+fails is written to datasight_error.log (main.log_error) and the batch goes
+on. the report has the rule findings per file. gemini is only asked with
+--ai: after the local pass, every audited file's metadata goes to
+core.scheduler.audit_many (rate limited, small files packed into one prompt,
+answers cached) and its summary is added to the file's result.
+"""
+
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from core.audit import audit_local
+from core.readers import EXTENSIONS
+from main import log_error
+
+COMPRESSED = (".gz", ".bz2", ".zip", ".xz", ".zst")
+# read as csv when named on the command line, but too common (readme, notes,
+# requirements) to pick up from a folder or a glob
+EXPLICIT_ONLY = {".txt"}
+
+
+def is_data_file(path):
+    name = os.path.basename(path).lower()
+    if name.startswith(("fixed_", ".")):
+        return False
+    for suffix in COMPRESSED:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    extension = os.path.splitext(name)[1]
+    return extension in EXTENSIONS and extension not in EXPLICIT_ONLY
+
+
+def collect_files(patterns, exclude=()):
+    """
+    expand globs and directories into a sorted list of files (no repeats).
+    a file named as it is is always taken, globs and directories only find
+    data files (so not .txt, fixed_* or dotfiles).
+    exclude = paths to leave out, e.g. the report of this run (a report.csv
+    in a scanned folder would otherwise be audited next time).
+    """
+    skip = {os.path.abspath(path) for path in exclude if path}
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for folder, _, names in os.walk(pattern):
+                found.update(os.path.join(folder, name) for name in names if is_data_file(name))
+        elif os.path.isfile(pattern):
+            found.add(pattern)
+        else:
+            found.update(path for path in glob.glob(pattern, recursive=True)
+                         if os.path.isfile(path) and is_data_file(path))
+    return sorted(os.path.normpath(path) for path in found if os.path.abspath(path) not in skip)
+
+
+def largest_first(files):
+    return sorted(files, key=lambda path: -os.path.getsize(path))
+
+
+def audit_summary(path, options, ai=False):
+    """audit one file in a worker. returns a small summary (metadata only with ai) to send back."""
+    start = time.perf_counter()
+    result = audit_local(path, **options)
+    by_rule = {}
+    for item in result["audit_trail"]:
+        by_rule[item["rule"]] = by_rule.get(item["rule"], 0) + (item.get("count") or 0)
+    summary = {
+        "file": path,
+        "status": "ok",
+        "bytes": os.path.getsize(path),
+        "rows": result["rows"],
+        "columns": result["columns"],
+        "findings": len(result["audit_trail"]),
+        "by_rule": by_rule,
+        "audit_trail": result["audit_trail"],
+        "fixed_file": result["fixed_file"],
+        "seconds": round(time.perf_counter() - start, 4),
+        "error": None,
+    }
+    if ai:
+        summary["metadata"] = result["metadata"]
+    return summary
+
+
+def failed(path, error):
+    return {"file": path, "status": "failed", "bytes": os.path.getsize(path) if os.path.exists(path) else None,
+            "rows": None, "columns": None, "findings": None, "by_rule": {}, "audit_trail": [],
+            "fixed_file": None, "seconds": None, "error": f"{type(error).__name__}: {error}"}
+
+
+def run_batch(patterns, workers=None, report=None, quiet=False, ai=False, api_key=None, **options):
+    """
+    audit every file matched by patterns. options go to core.audit.audit_local
+    (auto_fix, chunksize, sample, ...). returns the report dict and writes it
+    to `report` (.json or .csv) if given.
+    ai = also get a gemini summary per file (audit_many, needs api_key).
+    """
+    files = largest_first(collect_files(patterns, exclude=[report]))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files) or 1))
+    started = datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+    results = []
+
+    def done(path, get):
+        try:
+            results.append(get())
+        except Exception as e:
+            # one bad file should not stop the batch
+            log_error(e)
+            results.append(failed(path, e))
+        if not quiet:
+            r = results[-1]
+            note = f"{r['rows']} rows, {r['findings']} findings" if r["status"] == "ok" else r["error"]
+            print(f"[{len(results)}/{len(files)}] {r['status']} {path} ({note})")
+
+    if workers == 1:
+        for path in files:
+            done(path, lambda: audit_summary(path, options, ai))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(audit_summary, path, options, ai): path for path in files}
+            for future in as_completed(futures):
+                done(futures[future], future.result)
+
+    results.sort(key=lambda r: r["file"])
+    ai_stats = ai_summaries(results, api_key, quiet) if ai else None
+    totals = {}
+    for r in results:
+        for rule, count in r["by_rule"].items():
+            totals[rule] = totals.get(rule, 0) + count
+    summary = {
+        "started": started,
+        "seconds": round(time.perf_counter() - start, 3),
+        "workers": workers,
+        "files": len(results),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "rows": sum(r["rows"] or 0 for r in results),
+        "bytes": sum(r["bytes"] or 0 for r in results),
+        "by_rule": totals,
+        "results": results,
+    }
+    if ai_stats is not None:
+        summary["ai"] = ai_stats
+    if report:
+        write_report(summary, report)
+    return summary
+
+
+def ai_summaries(results, api_key, quiet=False):
+    """ask gemini about every audited file at once, fills in each result's ai_summary. returns the scheduler stats."""
+    from core.cache import default_cache
+    from core.scheduler import audit_many
+    jobs = {r["file"]: r.pop("metadata") for r in results if "metadata" in r}
+    if not quiet:
+        print(f"asking gemini about {len(jobs)} files...")
+    summaries, stats = audit_many(jobs, api_key, cache=default_cache()) if jobs else ({}, {})
+    for r in results:
+        r["ai_summary"] = summaries.get(r["file"])
+    return stats
+
+
+def write_report(summary, path):
+    """one json file with everything, or one csv line per file (counts per rule as columns)."""
+    if path.lower().endswith(".csv"):
+        rules = sorted(summary["by_rule"])
+        fields = ["file", "status", "bytes", "rows", "columns", "findings", *rules, "fixed_file", "seconds", "error",
+                  *(["ai_summary"] if "ai" in summary else [])]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fields, extrasaction="ignore")
+            writer.writeheader()
+            for r in summary["results"]:
+                writer.writerow({**r, **{rule: r["by_rule"].get(rule, 0) for rule in rules}})
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, default=str)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="audit many files (globs or directories) in a process pool")
+    parser.add_argument("paths", nargs="+", help="files, globs (quote them) or directories")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per cpu)")
+    parser.add_argument("--report", default="datasight_report.json", help="report path, .json or .csv")
+    parser.add_argument("--auto-fix", action="store_true", help="write fixed_<file> next to every file")
+    parser.add_argument("--chunksize", type=int, default=None, help="stream each file this many rows at a time")
+    parser.add_argument("--sample", type=int, default=None, help="audit a random sample of this many rows per file")
+    parser.add_argument("--sample-mode", choices=["reservoir", "blocks"], default=None)
+    parser.add_argument("--no-duplicates", action="store_true", help="skip the duplicate row check")
+    parser.add_argument("--outliers", choices=["mad", "iqr", "off"], default=None, help="outlier method (default mad), off to skip")
+    parser.add_argument("--output-format", choices=["csv", "parquet", "arrow", "feather"], default=None)
+    parser.add_argument("--compress", choices=["gzip", "zstd"], default=None)
+    parser.add_argument("--ai", action="store_true", help="also ask gemini for a summary of every file")
+    args = parser.parse_args()
+    api_key = None
+    if args.ai:
+        from main import ensure_api_key
+        api_key = ensure_api_key()
+        if not api_key:
+            sys.exit(1)
+    summary = run_batch(args.paths, args.workers, args.report, ai=args.ai, api_key=api_key,
+                        auto_fix=args.auto_fix, chunksize=args.chunksize,
+                        sample=args.sample, sample_mode=args.sample_mode,
+                        duplicates=False if args.no_duplicates else None,
+                        outliers=False if args.outliers == "off" else args.outliers,
+                        out_format=args.output_format, compression=args.compress)
+    if not summary["files"]:
+        print("no csv / parquet / arrow / feather files matched")
+        sys.exit(1)
+    print(f"\n{summary['ok']} of {summary['files']} files audited, {summary['failed']} failed, "
+          f"{summary['rows']} rows in {summary['seconds']}s with {summary['workers']} workers")
+    print(f"report: {args.report}")
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1 @@
+"""benchmark harness: synthetic data generator and stage timings."""
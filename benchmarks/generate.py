@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+synthetic messy csv generator for benchmarks.
+
+every file has the columns the rule pass knows about (id, age, salary,
+email, signup_date, city) plus numeric filler columns up to the width you
+ask for. nulls, outliers, bad emails and bad dates are mixed in at the
+given rates. rows are written in chunks, so 100M rows does not need
+100M rows of memory.
+
+run: python -m benchmarks.generate --rows 1000000 --columns 50 --out bench.csv
+"""
+
+import numpy as np
+import pandas as pd
+
+BASE_COLUMNS = ["id", "age", "salary", "email", "signup_date", "city"]
+CITIES = np.array(["oslo", "lima", "pune", "austin", "lagos", "kyoto", "leeds", "quito"])
+DEFAULT_RATES = {"null_rate": 0.05, "outlier_rate": 0.01, "bad_email_rate": 0.02, "bad_date_rate": 0.02}
+WRITE_CHUNK_ROWS = 500_000
+
+
+def _mask(rng, rows, rate):
+    return rng.random(rows) < rate if rate else np.zeros(rows, dtype=bool)
+
+
+def make_chunk(start, rows, columns=len(BASE_COLUMNS), seed=0, null_rate=0.05,
+               outlier_rate=0.01, bad_email_rate=0.02, bad_date_rate=0.02):
+    """rows [start, start + rows) of a messy table. same seed + start = same rows."""
+    rng = np.random.default_rng([seed, start])
+    ids = np.arange(start, start + rows)
+    text_ids = pd.Series(ids).astype(str)
+
+    age = rng.integers(18, 80, rows).astype("float64")
+    odd = _mask(rng, rows, outlier_rate)
+    age[odd] = rng.choice([-5.0, 150.0, 999.0], odd.sum())
+    salary = rng.normal(60_000, 15_000, rows).clip(5_000).round(2)
+    salary[_mask(rng, rows, outlier_rate)] = -1.0
+
+    email = ("user" + text_ids + "@example.com").to_numpy(dtype=object)
+    bad = _mask(rng, rows, bad_email_rate)
+    email[bad] = ("user" + text_ids[bad] + "example.com").to_numpy(dtype=object)
+
+    days = pd.to_datetime("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, rows), unit="D")
+    dates = days.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    dates[_mask(rng, rows, bad_date_rate)] = "2023-02-30"
+
+    data = {
+        "id": ids,
+        "age": age,
+        "salary": salary,
+        "email": email,
+        "signup_date": dates,
+        "city": CITIES[rng.integers(0, len(CITIES), rows)].astype(object),
+    }
+    for i in range(max(0, columns - len(BASE_COLUMNS))):
+        data[f"f{i}"] = rng.normal(0, 1, rows).round(4)
+    df = pd.DataFrame(data)
+    if columns < len(BASE_COLUMNS):
+        df = df[BASE_COLUMNS[:max(1, columns)]]
+    if null_rate:
+        for col in df.columns[1:]:
+            df.loc[_mask(rng, rows, null_rate), col] = None
+    return df
+
+
+def make_messy(rows, columns=len(BASE_COLUMNS), seed=0, **rates):
+    """the whole table in memory (small sizes only)."""
+    return make_chunk(0, rows, columns, seed, **rates)
+
+
+def write_messy(path, rows, columns=len(BASE_COLUMNS), seed=0, chunk_rows=WRITE_CHUNK_ROWS, **rates):
+    """write a messy csv chunk by chunk. returns the path."""
+    # wide tables get smaller chunks so one chunk stays around the same size
+    chunk_rows = max(1_000, chunk_rows * len(BASE_COLUMNS) // max(columns, len(BASE_COLUMNS)))
+    written = 0
+    while True:
+        n = min(chunk_rows, rows - written)
+        chunk = make_chunk(written, n, columns, seed, **rates)
+        chunk.to_csv(path, index=False, mode="w" if written == 0 else "a", header=written == 0)
+        written += n
+        if written >= rows:
+            return path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="write a synthetic messy csv")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=len(BASE_COLUMNS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench.csv")
+    for name, value in DEFAULT_RATES.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=float, default=value)
+    args = parser.parse_args()
+    rates = {name: getattr(args, name) for name in DEFAULT_RATES}
+    write_messy(args.out, args.rows, args.columns, args.seed, **rates)
+    print(f"wrote {args.out}: {args.rows} rows × {args.columns} columns")
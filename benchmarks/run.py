@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+time each stage of an audit on synthetic messy data, against a local stub
+gemini endpoint (no api key or quota needed), and write the results as json.
+
+run:
+    python -m benchmarks.run --rows 100000 --columns 20 --out results.json
+    python -m benchmarks.run --rows 10000000 --mode stream --chunksize 500000
+    python -m benchmarks.run --rows 100000 --compare results.json --out new.json
+
+stages (memory mode): read_csv, get_metadata, rule_pass, ai_audit (prompt +
+stub call, cache off), auto_fix (fit + apply the fix plan), write_csv.
+stages (stream mode): stream_scan (metadata + rules chunk by chunk),
+stream_ai_audit and stream_fix (fix plan fitted and applied chunk by chunk).
+each stage runs --repeat times; min and median seconds are reported.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate import BASE_COLUMNS, DEFAULT_RATES, write_messy
+from core.audit import scan_file, write_fixed
+from core.data_processor import get_metadata
+from core.fixes import build_fix_plan
+from core.interpreter import get_ai_audit
+from core.rules import run_rules
+from stub_gemini import start_stub
+
+
+def _time(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _record(results, stage, times, rows):
+    best = min(times)
+    results.append({
+        "stage": stage,
+        "seconds_min": round(best, 6),
+        "seconds_median": round(statistics.median(times), 6),
+        "rows_per_s": round(rows / best) if best else None,
+        "repeat": len(times),
+    })
+    print(f"  {stage:<14} {best * 1000:10.1f} ms   {results[-1]['rows_per_s'] or 0:>14,} rows/s")
+
+
+def bench_memory(path, rows, repeat, out_dir):
+    results = []
+    times, df = _time(lambda: pd.read_csv(path), repeat)
+    _record(results, "read_csv", times, rows)
+    times, metadata = _time(lambda: get_metadata(df), repeat)
+    _record(results, "get_metadata", times, rows)
+    times, (trail, _) = _time(lambda: run_rules(df), repeat)
+    _record(results, "rule_pass", times, rows)
+    get_ai_audit(metadata, "bench-key", audit_trail=trail, cache=None)  # warm up the client once
+    times, _ = _time(lambda: get_ai_audit(metadata, "bench-key", audit_trail=trail, cache=None), repeat)
+    _record(results, "ai_audit", times, rows)
+    times, fixed = _time(lambda: build_fix_plan(trail).fit(df).apply(df.copy()), repeat)
+    _record(results, "auto_fix", times, rows)
+    out_file = os.path.join(out_dir, "fixed.csv")
+    times, _ = _time(lambda: fixed.to_csv(out_file, index=False), repeat)
+    _record(results, "write_csv", times, rows)
+    return results
+
+
+def bench_stream(path, rows, repeat, out_dir, chunksize):
+    results = []
+    times, (_, metadata, engine) = _time(lambda: scan_file(path, chunksize=chunksize), repeat)
+    _record(results, "stream_scan", times, rows)
+    trail = engine.audit_trail()
+    get_ai_audit(metadata, "bench-key", audit_trail=trail, cache=None)
+    times, _ = _time(lambda: get_ai_audit(metadata, "bench-key", audit_trail=trail, cache=None), repeat)
+    _record(results, "stream_ai_audit", times, rows)
+    out_file = os.path.join(out_dir, "fixed.csv")
+    times, _ = _time(lambda: write_fixed(path, trail, chunksize=chunksize, out_file=out_file), repeat)
+    _record(results, "stream_fix", times, rows)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def compare(current, previous):
+    """print how each stage changed against an earlier results file."""
+    before = {r["stage"]: r["seconds_min"] for r in previous["results"]}
+    print("\ncompared with previous run")
+    for r in current["results"]:
+        old = before.get(r["stage"])
+        if old:
+            print(f"  {r['stage']:<14} {old * 1000:10.1f} ms -> {r['seconds_min'] * 1000:10.1f} ms"
+                  f"   ({old / r['seconds_min'] if r['seconds_min'] else float('inf'):.2f}x)")
+
+
+def run_benchmark(rows=100_000, columns=len(BASE_COLUMNS), mode="memory", repeat=3, chunksize=100_000,
+                  seed=0, data_file=None, **rates):
+    """generate data (unless data_file is given), time every stage, return the results dict."""
+    rates = {**DEFAULT_RATES, **rates}
+    server, stub, base_url = start_stub()
+    old_url = os.environ.get("GEMINI_BASE_URL")
+    os.environ["GEMINI_BASE_URL"] = base_url
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = data_file
+            if path is None:
+                path = os.path.join(tmp, "bench.csv")
+                start = time.perf_counter()
+                write_messy(path, rows, columns, seed, **rates)
+                print(f"generated {rows:,} rows × {columns} columns in {time.perf_counter() - start:.1f}s")
+            if mode in ("memory", "both"):
+                print("memory mode")
+                results = bench_memory(path, rows, repeat, tmp)
+            else:
+                results = []
+            if mode in ("stream", "both"):
+                print(f"stream mode (chunksize {chunksize:,})")
+                results += bench_stream(path, rows, repeat, tmp, chunksize)
+            size = os.path.getsize(path)
+    finally:
+        server.shutdown()
+        if old_url is None:
+            os.environ.pop("GEMINI_BASE_URL", None)
+        else:
+            os.environ["GEMINI_BASE_URL"] = old_url
+    return {
+        "params": {"rows": rows, "columns": columns, "mode": mode, "repeat": repeat,
+                   "chunksize": chunksize, "seed": seed, "file_bytes": size, **rates},
+        "environment": environment(),
+        "stub_calls": stub.calls,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="benchmark datasight on synthetic messy data")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=len(BASE_COLUMNS))
+    parser.add_argument("--mode", choices=["memory", "stream", "both"], default="memory")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", default=None, help="benchmark an existing csv instead of generating one")
+    parser.add_argument("--out", default="benchmark_results.json", help="write the results json here")
+    parser.add_argument("--compare", default=None, help="an earlier results json to compare against")
+    for name, value in DEFAULT_RATES.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=float, default=value)
+    args = parser.parse_args()
+    rows = args.rows
+    if args.file:
+        with open(args.file, "rb") as f:
+            rows = sum(1 for _ in f) - 1
+    result = run_benchmark(rows, args.columns, args.mode, args.repeat, args.chunksize, args.seed,
+                           data_file=args.file, **{name: getattr(args, name) for name in DEFAULT_RATES})
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nsaved {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
@@ -1,4 +1,6 @@
+import json
 import os
+import time
 from dotenv import load_dotenv
 
 # config.py = small knobs for the app
@@ -9,8 +11,125 @@ AUDIT_PROMPT = (
     "Identify outliers, logic errors, and missing values."
 )
 
+# the metadata is squeezed into about this many tokens before it goes in the prompt
+PROMPT_TOKEN_BUDGET = 2000
+
+# used when several small files are packed into one request.
+# every answer has to start with "=== FILE: <file name> ===" so it can be split
+# again. markdown headings (###) are left alone, the model uses those itself
+FILE_HEADING = "=== FILE: {name} ==="
+BATCH_AUDIT_PROMPT = (
+    "You are a Senior Data Auditor. Below is the metadata of several files. "
+    "Audit each file separately: identify outliers, logic errors, and missing values. "
+    "Start the answer for each file with a line '=== FILE: <file name> ===' and do not "
+    "use that line anywhere else.\n\n{files}"
+)
+
+# model_picker.py --probe results are trusted for this long
+MODEL_RANKING_TTL_SECONDS = 24 * 3600
+# probed models failing more often than this are not tried, and at most
+# this many candidates are (every extra one can cost a hedge or a failover)
+MODEL_MAX_ERROR_RATE = 0.2
+MODEL_MAX_CANDIDATES = 3
+
+def get_model_ranking_path():
+    load_dotenv()
+    return os.getenv("DATASIGHT_MODEL_RANKING", os.path.join(".datasight", "model_ranking.json")).strip()
+
+def load_model_ranking(path=None):
+    # probe results, best first, or [] if there are none or they expired
+    path = path or get_model_ranking_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if not isinstance(data, dict) or data.get("expires", 0) < time.time():
+        return []
+    return data.get("models", [])
+
 def get_model_candidates():
     # read .env at call time so changes apply immediately
     load_dotenv()
     env_model = os.getenv("GEMINI_MODEL", "").strip()
-    return [env_model] if env_model else ["gemini-2.0-flash"]
+    # GEMINI_MODEL wins, then the best probed models that mostly answered
+    ranked = [r["model"] for r in load_model_ranking() if r.get("error_rate", 1) <= MODEL_MAX_ERROR_RATE]
+    candidates = [env_model] + [m for m in ranked if m != env_model] if env_model else ranked
+    return candidates[:MODEL_MAX_CANDIDATES] or ["gemini-2.0-flash"]
+
+def get_http_options():
+    # GEMINI_BASE_URL points the client somewhere else (e.g. stub_gemini.py)
+    load_dotenv()
+    base_url = os.getenv("GEMINI_BASE_URL", "").strip()
+    return {"base_url": base_url} if base_url else None
+
+# async scheduler for many files at once (core/scheduler.py)
+SCHEDULER_CONCURRENCY = 8
+SCHEDULER_REQUESTS_PER_MINUTE = 60
+SCHEDULER_MAX_RETRIES = 6
+# metadata smaller than this (in prompt chars) can be packed with other files
+PACK_MAX_CHARS = 4000
+
+# hedging across the model candidates (core/hedging.py): if a model has not
+# answered by this percentile of its recent latency, ask the next one too
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_DELAY_S = 0.5
+# used until a model has a few calls behind it (or probe results)
+HEDGE_DEFAULT_DELAY_S = 8.0
+# extra calls allowed per first call, plus a small burst. 0 turns hedging off
+HEDGE_MAX_EXTRA = 0.1
+HEDGE_BURST = 2
+
+# gemini summary cache (sqlite). set DATASIGHT_CACHE=off to turn it off
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 1000
+
+def get_cache_path():
+    load_dotenv()
+    path = os.getenv("DATASIGHT_CACHE", os.path.join(".datasight", "llm_cache.sqlite")).strip()
+    return "" if path.lower() in ("", "off", "0", "false") else path
+
+def get_checkpoint_dir():
+    # where --incremental keeps per-file audit checkpoints
+    load_dotenv()
+    return os.getenv("DATASIGHT_CHECKPOINTS", os.path.join(".datasight", "checkpoints")).strip()
+
+# duplicate rows / keys (core/duplicates.py). fingerprints take 20 bytes a row;
+# past this many mb they are collapsed, then spilled to disk in hash partitions
+DUPLICATE_CHECK = True
+DUPLICATE_MEMORY_MB = 256
+DUPLICATE_PARTITIONS = 64
+
+def get_spill_dir():
+    load_dotenv()
+    return os.getenv("DATASIGHT_SPILL", os.path.join(".datasight", "spill")).strip()
+
+# statistical outliers (core/outliers.py). "mad" = robust z-score, "iqr" = tukey fences
+OUTLIER_CHECK = True
+OUTLIER_METHOD = "mad"
+OUTLIER_MAD_Z = 3.5
+OUTLIER_IQR_K = 3.0
+# columns (or groups) with fewer values than this are not judged
+OUTLIER_MIN_ROWS = 5
+OUTLIER_MAX_GROUPS = 1000
+# candidate rows held per column before they are pruned
+OUTLIER_BUFFER_ROWS = 100_000
+
+# auto-fix output (core/writer.py): rows per written chunk, gzip level, parquet codec
+WRITE_CHUNK_ROWS = 250_000
+WRITE_GZIP_LEVEL = 6
+WRITE_PARQUET_CODEC = "snappy"
+
+# sampling mode (core/sampling.py): default sample size, how many random
+# blocks to seek to in "blocks" mode, and the confidence of the intervals
+SAMPLE_ROWS = 100_000
+SAMPLE_MODE = "reservoir"
+SAMPLE_BLOCKS = 64
+SAMPLE_CONFIDENCE = 0.95
+
+# semantic types (core/semantic.py): a column whose name says nothing is an
+# email / date / phone / id column if this share of its first sample values
+# look like one. fewer non-null sample values than SEMANTIC_MIN_VALUES = no guess
+SEMANTIC_SAMPLE_ROWS = 1000
+SEMANTIC_MIN_SHARE = 0.8
+SEMANTIC_MIN_VALUES = 5
@@ -0,0 +1,191 @@
+"""
+the local (no gemini) part of an audit: read, profile, rule pass, auto-fix.
+main.run_audit prints around these, service.py runs them in worker processes.
+"""
+
+import os
+
+import pandas as pd
+
+import config
+from core.data_processor import DEFAULT_CHUNKSIZE, get_metadata, stream_metadata
+from core.duplicates import DuplicateFinder
+from core.fixes import build_fix_plan
+from core.ingest import read_lean
+from core.outliers import OutlierDetector
+from core.parallel import profile_file_parallel
+from core.profiling import stage
+from core.readers import (CSV, EXTENSIONS, PARQUET, detect_format, is_compressed, iter_frames,
+                          parquet_footer_stats, read_columns, read_frame)
+from core.rules import RuleEngine
+from core.sampling import SampleEstimate, draw_sample, sample_metadata
+from core.semantic import file_types
+from core.writer import output_path, split_name, write_chunks
+
+
+def scan_file(csv_file, chunksize=None, workers=None, columns=None, lean=False, profiler=None,
+              duplicates=None, dup_keys=None, outliers=None, group_by=None, sample=None, sample_mode=None):
+    """
+    profile a csv/parquet/arrow/feather file and run the rule engine over the same rows.
+    returns (df, metadata, engine). df is None in streaming/parallel mode.
+    columns = only decode these columns. for parquet the rest still get
+    row/null counts and min/max from the footer statistics.
+    lean = load a csv with compact dtypes (core/ingest.py); the memory
+    report is kept in df.attrs["memory"].
+    profiler = a core.profiling.StageProfiler to time read / metadata / rules.
+    streaming and parallel modes do all three at once, so they are one "scan" stage.
+    duplicates = look for repeated rows (default config.DUPLICATE_CHECK);
+    dup_keys = only compare these columns (e.g. ["email"]) instead of whole rows.
+    outliers = "mad", "iqr" or False (default config.OUTLIER_METHOD, if config.OUTLIER_CHECK);
+    group_by = judge outliers within each value of this column, e.g. "department".
+    sample = audit a random sample of this many rows (True = config.SAMPLE_ROWS)
+    instead of every row; sample_mode = "reservoir" or "blocks" (core/sampling.py).
+    the engine is then a SampleEstimate with estimated counts and intervals,
+    and the duplicate / outlier checks are skipped.
+    """
+    fmt = detect_format(csv_file)
+    if sample:
+        with stage(profiler, "sample") as rec:
+            frames, info = draw_sample(csv_file, None if sample is True else sample, sample_mode,
+                                       chunksize=chunksize, columns=columns)
+            metadata = sample_metadata(frames, info)
+            engine = SampleEstimate(frames, info, types=file_types(csv_file, columns, fmt))
+            rec.update(rows=info["rows"])
+        return None, metadata, engine
+    if duplicates is None:
+        duplicates = config.DUPLICATE_CHECK or bool(dup_keys)
+    if outliers is None:
+        outliers = (config.OUTLIER_CHECK or bool(group_by)) and config.OUTLIER_METHOD
+    engine = RuleEngine(duplicates=DuplicateFinder(dup_keys) if duplicates else None,
+                        outliers=OutlierDetector(outliers, group_by) if outliers else None)
+    df = None
+    parallel = workers and workers > 1 and fmt == CSV and not columns
+    if parallel and is_compressed(csv_file):
+        # byte ranges of a compressed file are not rows: stream it in one process instead
+        parallel, chunksize = False, chunksize or DEFAULT_CHUNKSIZE
+    if parallel or chunksize:
+        # the semantic types come from the head of the file, not from whatever chunk or range comes first
+        engine.set_types(file_types(csv_file, columns, fmt))
+        with stage(profiler, "scan") as rec:
+            if parallel:
+                # parallel mode: byte ranges of the file are profiled in a process pool
+                metadata = profile_file_parallel(csv_file, workers, chunksize or DEFAULT_CHUNKSIZE, engine=engine)
+            else:
+                # streaming mode: only one chunk is in memory at a time
+                metadata = stream_metadata(csv_file, chunksize, engine=engine, columns=columns)
+            rec["rows"] = metadata["row_count"]
+    else:
+        with stage(profiler, "read") as rec:
+            if lean and fmt == CSV and not columns:
+                df, report = read_lean(csv_file)
+                df.attrs["memory"] = report
+            else:
+                df = read_frame(csv_file, columns, fmt)
+            rec["rows"] = len(df)
+        with stage(profiler, "metadata", rows=len(df)):
+            metadata = get_metadata(df)
+        with stage(profiler, "rules", rows=len(df)):
+            engine.update(df)
+    if fmt == PARQUET:
+        with stage(profiler, "parquet_footer"):
+            add_footer_stats(metadata, engine, parquet_footer_stats(csv_file))
+    return df, metadata, engine
+
+
+def add_footer_stats(metadata, engine, footer):
+    """
+    fill in columns that were not decoded from parquet footer statistics,
+    so a projected read still reports nulls for every column.
+    metadata is the TableProfile from the scan.
+    """
+    metadata["row_count"] = metadata["row_count"] or footer["row_count"]
+    known = set(metadata.columns)
+    added = [(col, info) for col, info in footer["columns"].items() if col not in known and info["nulls"] is not None]
+    if added:
+        metadata.add_columns(
+            [col for col, _ in added], [info["dtype"] for _, info in added],
+            nulls=[info["nulls"] for _, info in added],
+            counts=[footer["row_count"] - info["nulls"] for _, info in added],
+            mins=[info["min"] for _, info in added], maxs=[info["max"] for _, info in added],
+        )
+    for col, info in added:
+        engine.add_count("missing_values", col, info["nulls"])
+    return metadata
+
+
+def fixed_path(csv_file):
+    folder, name = os.path.split(csv_file)
+    return os.path.join(folder, "fixed_" + name)
+
+
+def write_fixed(csv_file, audit_trail, df=None, chunksize=None, out_file=None, profiler=None,
+                out_format=None, compression=None, stats=None):
+    """
+    apply the audit trail's fixes and write the result. returns the output path.
+    every fix is compiled into one plan: fill values are worked out once,
+    then all columns are filled in a single pass. the output is written chunk
+    by chunk through core/writer.py (temp file + rename).
+    out_format = csv / parquet / arrow / feather (default: same as the input),
+    compression = gzip / zstd for csv output (default: same as the input).
+    stats = a dict to fill with rows, bytes, seconds and mb_per_s of the write.
+    """
+    plan = build_fix_plan(audit_trail)
+    fmt = detect_format(csv_file)
+    out_file = out_file or output_path(fixed_path(csv_file), out_format, compression)
+    out_format = out_format or EXTENSIONS.get(os.path.splitext(split_name(out_file)[0])[1].lower(), fmt)
+    size = chunksize or config.WRITE_CHUNK_ROWS
+    if df is not None and len(df.columns) < len(read_columns(csv_file, fmt)):
+        # a projected scan only decoded some columns, stream the whole file instead
+        df = None
+    if df is not None:
+        with stage(profiler, "fix", rows=len(df)):
+            # fills happen in place, a plain fix_function returns a new frame
+            df = plan.fit(df).apply(df)
+        # at least one (maybe empty) slice, so a csv always gets its header
+        chunks = (df.iloc[i:i + size] for i in range(0, max(len(df), 1), size))
+        name = "write"
+    else:
+        # streaming: one pass over just the columns that need fill values,
+        # then a second pass that fixes each chunk and hands it to the writer
+        if plan.columns:
+            with stage(profiler, "fix_fit"):
+                plan.fit_chunks(iter_frames(csv_file, size, columns=plan.columns, fmt=fmt))
+        chunks = (plan.apply(chunk) for chunk in iter_frames(csv_file, size, fmt=fmt))
+        name = "fix_write"
+    with stage(profiler, name) as rec:
+        result = write_chunks(chunks, out_file, out_format, compression)
+        rec.update(rows=result["rows"], bytes_written=result["bytes"], mb_per_s=result["mb_per_s"])
+    if stats is not None:
+        stats.update(result)
+    return out_file
+
+
+def public_trail(audit_trail):
+    """audit_trail without fix functions, safe to pickle or turn into json."""
+    return [{key: value for key, value in item.items() if not callable(value)} for item in audit_trail]
+
+
+def audit_local(csv_file, auto_fix=False, chunksize=None, workers=None, columns=None, lean=False,
+                duplicates=None, dup_keys=None, outliers=None, group_by=None, out_format=None, compression=None,
+                sample=None, sample_mode=None):
+    """everything except the gemini call, as plain data."""
+    df, metadata, engine = scan_file(csv_file, chunksize, workers, columns, lean, duplicates=duplicates,
+                                     dup_keys=dup_keys, outliers=outliers, group_by=group_by,
+                                     sample=sample, sample_mode=sample_mode)
+    trail = engine.audit_trail()
+    result = {
+        "file": csv_file,
+        "rows": metadata["row_count"],
+        "columns": len(metadata["columns"]),
+        "metadata": metadata,
+        "audit_trail": public_trail(trail),
+        "rule_timings": engine.timings,
+        "semantic_types": {col: kind["type"] for col, kind in (engine.types or {}).items()},
+        "fixed_file": None,
+        "write_stats": None,
+    }
+    if auto_fix and metadata["row_count"]:
+        result["write_stats"] = {}
+        result["fixed_file"] = write_fixed(csv_file, trail, df, chunksize, out_format=out_format,
+                                           compression=compression, stats=result["write_stats"])
+    return result
@@ -0,0 +1,123 @@
+"""
+on-disk cache for gemini summaries (sqlite).
+
+the key is a sha256 of the metadata (as sorted json), the model name and the
+final prompt text (so the rule findings and the token budget that shaped it
+count too), so re-auditing an unchanged file with the same prompt and model
+is answered from disk. entries expire after a ttl, and the least
+recently used ones are dropped once the cache holds too many.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import config
+
+
+def cache_key(metadata, model_name, prompt):
+    if hasattr(metadata, "to_dict"):
+        # a TableProfile, hash the plain dicts
+        metadata = metadata.to_dict()
+    payload = json.dumps(
+        {"metadata": metadata, "model": model_name, "prompt": prompt},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=1000, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, text TEXT, created REAL, last_used REAL)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _bump(self, db, name):
+        db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+
+    def get(self, key):
+        """cached text for key, or None. expired entries count as a miss."""
+        return self.get_first([key])[1]
+
+    def get_first(self, keys):
+        """
+        (key, text) for the first of keys that is cached, or (None, None).
+        one lookup, counted as one hit or one miss however many keys it tried
+        (e.g. the same prompt for every candidate model).
+        """
+        keys = list(keys)
+        now = self.clock()
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT key, text, created FROM responses WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+            fresh = {key: text for key, text, created in rows if now - created <= self.ttl_seconds}
+            expired = [(key,) for key, _, _ in rows if key not in fresh]
+            if expired:
+                db.executemany("DELETE FROM responses WHERE key = ?", expired)
+            for key in keys:
+                if key in fresh:
+                    db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._bump(db, "hits")
+                    return key, fresh[key]
+            self._bump(db, "misses")
+        return None, None
+
+    def put(self, key, text, model_name=""):
+        now = self.clock()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, text, now, now),
+            )
+            db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+            # lru eviction: keep only the most recently used entries
+            db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (self.max_entries,)
+            )
+
+    def stats(self):
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM counters")
+
+
+def default_cache():
+    """the cache set up in config.py, or None if caching is turned off."""
+    path = config.get_cache_path()
+    if not path:
+        return None
+    return ResponseCache(path, config.CACHE_TTL_SECONDS, config.CACHE_MAX_ENTRIES)
@@ -0,0 +1,171 @@
+"""
+incremental re-audit for append-only csv files.
+
+after an audit the mergeable state is pickled next to a fingerprint of the
+bytes it covered: the metadata accumulator and the rule engine, which are
+counts, sketches and a few examples. the one check that needs every row,
+repeated keys, keeps its fingerprints in sorted files next to the pickle
+(core.duplicates.FingerprintIndex) that are searched, not loaded. so a run
+reads and writes about the size of the appended rows, not of the file.
+
+the next run checks that the file still starts with those bytes, profiles
+only what was appended, and merges the two. if the prefix changed (or the
+header, or the file got shorter) it falls back to a full pass and writes a
+new checkpoint.
+
+the fingerprint hashes the length, the last TAIL_BYTES of the prefix in
+full and SAMPLED_BLOCKS blocks spread over the rest. that catches
+rewrites, truncation and edits near the end without re-reading the prefix,
+but not a same-size edit between the sampled blocks.
+"""
+
+import hashlib
+import os
+import pickle
+
+import config
+from core.data_processor import DEFAULT_CHUNKSIZE
+from core.duplicates import unused_runs
+from core.outliers import OutlierDetector
+from core.parallel import merge_accumulators, profile_range, read_header
+from core.readers import is_compressed
+from core.rules import RULES, DuplicateKeys, RuleEngine
+from core.semantic import file_types
+
+VERSION = 5
+BLOCK_SIZE = 4096
+SAMPLED_BLOCKS = 64
+TAIL_BYTES = 1024 * 1024
+
+
+def fingerprint(path, end):
+    """hash of the length, the last TAIL_BYTES and sampled blocks of bytes [0, end)."""
+    digest = hashlib.sha256(str(end).encode())
+    tail = max(0, end - TAIL_BYTES)
+    offsets = {0}
+    offsets.update(tail * i // (SAMPLED_BLOCKS + 1) for i in range(1, SAMPLED_BLOCKS + 1))
+    with open(path, "rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            digest.update(f.read(max(0, min(BLOCK_SIZE, tail - offset))))
+        f.seek(tail)
+        while f.tell() < end:
+            digest.update(f.read(min(BLOCK_SIZE * 16, end - f.tell())))
+    return digest.hexdigest()
+
+
+def checkpoint_path(csv_file, folder=None):
+    folder = folder or config.get_checkpoint_dir()
+    name = hashlib.sha256(os.path.abspath(csv_file).encode()).hexdigest()[:32]
+    return os.path.join(folder, name + ".pkl")
+
+
+def index_folder(csv_file, folder=None):
+    """where the repeated-key fingerprints of a checkpoint live."""
+    return checkpoint_path(csv_file, folder)[:-len(".pkl")] + "-keys"
+
+
+def _keep_indexes(engine, folder):
+    """move the key fingerprints out of the engine into index files; returns the indexes."""
+    return [index for rule in engine.rules if isinstance(rule, DuplicateKeys) for index in rule.keep_index(folder)]
+
+
+def load_checkpoint(csv_file, folder=None):
+    try:
+        with open(checkpoint_path(csv_file, folder), "rb") as f:
+            state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    return state if state.get("version") == VERSION else None
+
+
+def save_checkpoint(csv_file, state, folder=None):
+    path = checkpoint_path(csv_file, folder)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)  # a crash mid-write never leaves half a checkpoint
+    return path
+
+
+def _stale_reason(csv_file, state, size, columns, outliers):
+    if state is None:
+        return "no checkpoint"
+    if state["columns"] != columns:
+        return "header changed"
+    if state["outliers"] != outliers:
+        return "outlier options changed"
+    if size < state["end"]:
+        return "file got shorter"
+    if fingerprint(csv_file, state["end"]) != state["fingerprint"]:
+        return "already audited rows changed"
+    return None
+
+
+def _data_start(csv_file):
+    with open(csv_file, "rb") as f:
+        f.readline()
+        return f.tell()
+
+
+def _ends_with_newline(csv_file, size):
+    with open(csv_file, "rb") as f:
+        f.seek(max(0, size - 1))
+        return f.read(1) in (b"\n", b"")
+
+
+def incremental_scan(csv_file, chunksize=None, folder=None, rules=None, outliers=None, group_by=None):
+    """
+    returns (metadata, engine, info). info has mode ("incremental" or
+    "full"), reason (why a full pass was needed), new_bytes and new_rows.
+    outliers / group_by work like in core.audit.scan_file: the detector's
+    sketches and candidates are kept in the checkpoint, and only the new
+    rows go through it.
+    """
+    if is_compressed(csv_file):
+        raise ValueError(f"incremental scans need an uncompressed csv, not {csv_file}")
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    if outliers is None:
+        outliers = (config.OUTLIER_CHECK or bool(group_by)) and config.OUTLIER_METHOD
+    detector = OutlierDetector(outliers, group_by) if outliers else None
+    spec = detector.spec() if detector is not None else None
+    size = os.path.getsize(csv_file)
+    columns = read_header(csv_file)
+    state = load_checkpoint(csv_file, folder)
+    reason = _stale_reason(csv_file, state, size, columns, spec)
+    names = list(rules) if rules is not None else list(RULES)
+    if reason:
+        start, partials = _data_start(csv_file), []
+        # semantic types come from the head of the file and are kept, so
+        # appended rows are checked like the first ones were
+        types = file_types(csv_file)
+    else:
+        start, partials = state["end"], [(state["acc"], state["engine"])]
+        names = [rule.name for rule in state["engine"].rules]
+        types = state["types"]
+    new_rows = 0
+    if size > start or not partials:
+        acc, engine = profile_range(csv_file, start, size, columns, chunksize, names, outliers=spec, types=types)
+        new_rows = acc.row_count
+        partials.append((acc, engine))
+    merged_engine = RuleEngine(names, outliers=detector, types=types)
+    merged = merge_accumulators(partials, merged_engine)
+    if _ends_with_newline(csv_file, size):
+        # a half-written last line would be counted twice next time, so only
+        # checkpoint when the file ends on a full row
+        keys = index_folder(csv_file, folder)
+        indexes = _keep_indexes(merged_engine, keys)
+        save_checkpoint(csv_file, {
+            "version": VERSION, "end": size, "fingerprint": fingerprint(csv_file, size),
+            "columns": columns, "acc": merged, "engine": merged_engine, "types": types, "outliers": spec,
+        }, folder)
+        # only now that the new checkpoint points at the new runs
+        unused_runs(keys, indexes)
+    info = {
+        "mode": "full" if reason else "incremental",
+        "reason": reason,
+        "new_bytes": size - start,
+        "new_rows": new_rows,
+    }
+    return merged.result(), merged_engine, info
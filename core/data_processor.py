@@ -1,3 +1,215 @@
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
+
+from core.profile import QUANTILES, TableProfile
+from core.readers import iter_frames
+from core.sketches import HyperLogLog, KLLSketch
+
+HEAD_ROWS = 3
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _native(value):
+    # numpy scalars -> plain python so the dict prints and serializes cleanly
+    return value.item() if hasattr(value, "item") else value
+
+
+# dtype names repeat across thousands of columns, parse each name once
+@lru_cache(maxsize=None)
+def _dtype_kind(name):
+    if pd.api.types.is_float_dtype(name):
+        return "float"
+    if pd.api.types.is_integer_dtype(name):
+        return "int"
+    return "number" if pd.api.types.is_numeric_dtype(name) else "other"
+
+
+def _merge_dtype(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    a_num, b_num = _dtype_kind(a) != "other", _dtype_kind(b) != "other"
+    if a_num and b_num:
+        return "float64"
+    # numbers mixed with text read back as text
+    if a_num != b_num:
+        return b if a_num else a
+    return "object"
+
+
+def _final_dtype(stat, nulls):
+    # mirror what pandas picks when it reads the whole column at once
+    dtype = stat["dtype"] or stat["null_dtype"]
+    if nulls and dtype in ("bool", "boolean"):
+        return "object"
+    if nulls and _dtype_kind(dtype) == "int":
+        return "float64"
+    return dtype
+
+
+class MetadataAccumulator:
+    """
+    folds dataframe chunks into the same summary get_metadata builds.
+    update() takes one chunk at a time, merge() combines two accumulators,
+    result() gives back the metadata as a core.profile.TableProfile (reads
+    like the old dict). memory stays at one chunk.
+    distinct counts and quantiles come from fixed-size sketches, so they are
+    estimates on big columns.
+    """
+
+    def __init__(self, head_rows=HEAD_ROWS):
+        self.head_rows = head_rows
+        self.columns = None
+        self.row_count = 0
+        self.null_counts = {}
+        self.stats = {}
+        self.distinct = {}
+        self.quantiles = {}
+        self.head = None
+
+    def _start(self, columns):
+        self.columns = list(columns)
+        self.null_counts = {col: 0 for col in self.columns}
+        self.stats = {col: {"dtype": None, "null_dtype": None, "count": 0} for col in self.columns}
+        self.distinct = {col: HyperLogLog() for col in self.columns}
+
+    def update(self, df):
+        if self.columns is None:
+            self._start(df.columns)
+        self.row_count += len(df)
+        for col, count in df.isnull().sum().items():
+            self.null_counts[col] += int(count)
+        counts = df.count().tolist()
+        dtypes = df.dtypes.tolist()
+        # plain int / float columns are done together: one hash call and one
+        # min / max / sum per dtype instead of a handful of calls per column
+        fast = [i for i, dtype in enumerate(dtypes) if isinstance(dtype, np.dtype) and dtype.kind in "iuf" and counts[i]]
+        if fast:
+            self._update_numeric(df, fast, dtypes)
+        done = set(fast)
+        for i, col in enumerate(self.columns):
+            series = df[col] if i not in done else None
+            dtype = dtypes[i]
+            stat = self.stats[col]
+            count = counts[i]
+            if stat["null_dtype"] is None:
+                stat["null_dtype"] = str(dtype)
+            # an all-null chunk says nothing about the real column type
+            if count:
+                stat["dtype"] = _merge_dtype(stat["dtype"], str(dtype))
+            stat["count"] += count
+            if not count or i in done:
+                continue
+            self.distinct[col].update(series)
+            if pd.api.types.is_numeric_dtype(series.dtype):
+                self._fold_numeric(stat, _native(series.min()), _native(series.max()), _native(series.sum()))
+                if not pd.api.types.is_bool_dtype(series.dtype):
+                    sketch = self.quantiles.setdefault(col, KLLSketch())
+                    sketch.update(series.dropna().to_numpy(dtype="float64"))
+        self._fold_head(df)
+        return self
+
+    def _update_numeric(self, df, positions, dtypes):
+        block = df.iloc[:, positions]
+        values = block.to_numpy(dtype="float64")
+        # same hashes as sketches.hash_values, for every column in one go
+        hashes = pd.util.hash_array(values.ravel(order="F")).reshape(values.shape, order="F")
+        ranges = {}
+        for dtype in {dtypes[i] for i in positions}:
+            same = [j for j, i in enumerate(positions) if dtypes[i] == dtype]
+            part = block.iloc[:, same]
+            for j, lo, hi, total in zip(same, part.min().tolist(), part.max().tolist(), part.sum().tolist()):
+                ranges[j] = (lo, hi, total)
+        for j, i in enumerate(positions):
+            col = self.columns[i]
+            present = ~np.isnan(values[:, j])
+            self.distinct[col].update_hashes(hashes[present, j])
+            self._fold_numeric(self.stats[col], *ranges[j])
+            self.quantiles.setdefault(col, KLLSketch()).update(values[present, j])
+
+    def merge(self, other):
+        if other.columns is None:
+            return self
+        if self.columns is None:
+            self._start(other.columns)
+        self.row_count += other.row_count
+        for col, count in other.null_counts.items():
+            self.null_counts[col] += count
+        for col, theirs in other.stats.items():
+            stat = self.stats[col]
+            stat["dtype"] = _merge_dtype(stat["dtype"], theirs["dtype"])
+            if stat["null_dtype"] is None:
+                stat["null_dtype"] = theirs["null_dtype"]
+            stat["count"] += theirs["count"]
+            if "sum" in theirs:
+                self._fold_numeric(stat, theirs["min"], theirs["max"], theirs["sum"])
+            self.distinct[col].merge(other.distinct[col])
+            if col in other.quantiles:
+                self.quantiles.setdefault(col, KLLSketch()).merge(other.quantiles[col])
+        if other.head is not None:
+            self._fold_head(other.head)
+        return self
+
+    def _fold_numeric(self, stat, lo, hi, total):
+        if "sum" not in stat:
+            stat.update(min=lo, max=hi, sum=total)
+            return
+        stat["min"] = min(stat["min"], lo)
+        stat["max"] = max(stat["max"], hi)
+        stat["sum"] += total
+
+    def _fold_head(self, df):
+        # keep only the first few rows ever seen
+        if self.head is None:
+            self.head = df.head(self.head_rows)
+        elif len(self.head) < self.head_rows:
+            self.head = pd.concat([self.head, df.head(self.head_rows - len(self.head))])
+
+    def result(self):
+        columns = self.columns or []
+        dtypes = [_final_dtype(self.stats[col], self.null_counts[col]) for col in columns]
+        profile = TableProfile(
+            columns, dtypes,
+            nulls=[self.null_counts[col] for col in columns],
+            counts=[self.stats[col]["count"] for col in columns],
+            distinct=[self.distinct[col].estimate() for col in columns],
+            row_count=self.row_count,
+        )
+        head = self.head
+        changed = {}
+        for i, col in enumerate(columns):
+            raw, dtype = self.stats[col], dtypes[i]
+            if "sum" in raw and _dtype_kind(dtype) != "other":
+                lo, hi = raw["min"], raw["max"]
+                if _dtype_kind(dtype) == "float":
+                    lo, hi = float(lo), float(hi)
+                profile.set_range(i, lo, hi, raw["sum"] / raw["count"])
+                if col in self.quantiles:
+                    profile.set_quantiles(i, self.quantiles[col].quantiles(list(QUANTILES.values())))
+            # chunks can disagree on dtype, so line the preview up with the final one
+            if head is not None and str(head[col].dtype) != dtype and dtype != "object":
+                changed[col] = dtype
+        if head is not None:
+            profile.head = head.astype(changed) if changed else head
+        return profile
+
+
 def get_metadata(df):
-    return {"columns": list(df.columns), "null_counts": df.isnull().sum().to_dict(), "head": df.head(3).to_dict()}
+    return MetadataAccumulator().update(df).result()
+
+
+def stream_metadata(csv_file, chunksize, engine=None, columns=None):
+    """
+    read a file chunk by chunk and build metadata without loading it all.
+    if a RuleEngine is passed, every chunk goes through it in the same pass.
+    columns limits which columns are read (csv usecols / arrow projection).
+    """
+    acc = MetadataAccumulator()
+    for chunk in iter_frames(csv_file, chunksize, columns=columns):
+        acc.update(chunk)
+        if engine is not None:
+            engine.update(chunk)
+    return acc.result()
@@ -0,0 +1,264 @@
+"""
+duplicate rows (or duplicate keys) without keeping the rows around.
+
+every row becomes a 64-bit fingerprint of its values (or of the key
+columns the user picked) plus its row number: 20 bytes a row. when the
+buffer outgrows the memory limit, repeated fingerprints are collapsed into
+one record with a count, and if that is still too big the records are
+spilled to disk in hash partitions (hash % partitions), so at the end every
+partition can be checked on its own. counts are exact up to 64-bit hash
+collisions (about 1 in 10**8 for a billion distinct rows).
+
+    finder = DuplicateFinder(keys=["email"])
+    for chunk in chunks:           # chunk.index = row numbers in the file
+        finder.update(chunk)
+    finder.finish()  # {"duplicates", "groups", "examples", "spilled", ...}
+
+for incremental runs the distinct fingerprints can be kept on disk in a
+FingerprintIndex, and the next run's finder counts rows that repeat one of
+them (finish(seen=index)) without loading the old rows again.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import config
+
+EXAMPLE_ROWS = 5
+RECORD = np.dtype([("hash", "<u8"), ("row", "<i8"), ("n", "<u4")])
+
+
+def row_fingerprints(df, keys=None):
+    """
+    (uint64 hash per row, bool mask of rows to check).
+    with keys, rows with a missing key value are skipped.
+    numbers hash the same whatever their int/float dtype, like sketches.hash_series.
+    """
+    missing = [key for key in keys or [] if key not in df.columns]
+    if missing:
+        raise ValueError(f"duplicate key columns not in the file: {', '.join(map(str, missing))}")
+    frame = df[list(keys)] if keys else df
+    if len(frame.columns) == 0:
+        return np.zeros(len(frame), dtype=np.uint64), np.zeros(len(frame), dtype=bool)
+    same_types = {
+        col: values.astype("float64")
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+        else values
+        for col, values in frame.items()
+    }
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(same_types), index=False).to_numpy(dtype=np.uint64)
+    keep = frame.notna().all(axis=1).to_numpy() if keys else np.ones(len(frame), dtype=bool)
+    return hashes, keep
+
+
+def _smallest(rows, extra):
+    return np.sort(np.concatenate([rows, extra]))[:EXAMPLE_ROWS]
+
+
+def collapse(records):
+    """
+    one record per fingerprint: the first row it was seen on and how many times.
+    returns (records, the smallest rows that repeat an earlier row).
+    """
+    ordered = records[np.lexsort((records["row"], records["hash"]))]
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = ordered["hash"][1:] != ordered["hash"][:-1]
+    kept = ordered[first]
+    if len(kept) < len(ordered):
+        kept["n"] = np.add.reduceat(ordered["n"], np.flatnonzero(first), dtype=np.uint64)
+    return kept, np.sort(ordered["row"][~first])[:EXAMPLE_ROWS]
+
+
+class DuplicateFinder:
+    """exact duplicate counts in bounded memory. mergeable, for chunks and worker processes."""
+
+    def __init__(self, keys=None, memory_mb=None, partitions=None, spill_dir=None):
+        self.keys = list(keys) if keys else None
+        self.memory_mb = config.DUPLICATE_MEMORY_MB if memory_mb is None else memory_mb
+        self.partitions = partitions or config.DUPLICATE_PARTITIONS
+        self.spill_dir = spill_dir or config.get_spill_dir()
+        self.folder = None          # temp folder with partition files, once spilled
+        self.buffer = []
+        self.buffered = 0
+        self.examples = np.empty(0, dtype=np.int64)
+        self.rows = 0
+        self.done = None
+
+    def spec(self, share=1):
+        """arguments for a finder in a worker process (memory split `share` ways)."""
+        return {"keys": self.keys, "memory_mb": self.memory_mb / share,
+                "partitions": self.partitions, "spill_dir": self.spill_dir}
+
+    def update(self, df):
+        if self.done is not None:
+            raise RuntimeError("duplicate check already finished")
+        hashes, keep = row_fingerprints(df, self.keys)
+        records = np.empty(int(keep.sum()), dtype=RECORD)
+        records["hash"] = hashes[keep]
+        records["row"] = df.index.to_numpy()[keep]
+        records["n"] = 1
+        self.rows += len(df)
+        self._add(records)
+        return self
+
+    def _add(self, records):
+        self.buffer.append(records)
+        self.buffered += records.nbytes
+        if self.buffered > self.memory_mb * 1024 * 1024:
+            kept, examples = collapse(np.concatenate(self.buffer))
+            self.examples = _smallest(self.examples, examples)
+            if kept.nbytes > self.memory_mb * 1024 * 1024 // 2:
+                # mostly distinct rows: collapsing did not help enough, go to disk
+                self._spill(kept)
+                self.buffer, self.buffered = [], 0
+            else:
+                self.buffer, self.buffered = [kept], kept.nbytes
+
+    def _spill(self, records):
+        if self.folder is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.folder = tempfile.mkdtemp(prefix="dups-", dir=self.spill_dir)
+        part = records["hash"] % np.uint64(self.partitions)
+        order = np.argsort(part, kind="stable")
+        records, part = records[order], part[order]
+        bounds = np.searchsorted(part, np.arange(self.partitions + 1, dtype=np.uint64))
+        for p in range(self.partitions):
+            if bounds[p] < bounds[p + 1]:
+                with open(os.path.join(self.folder, f"{p}.bin"), "ab") as f:
+                    f.write(records[bounds[p]:bounds[p + 1]].tobytes())
+
+    def _parts(self):
+        """the records, one hash partition at a time (all at once if nothing was spilled)."""
+        if self.folder is None:
+            if self.buffer:
+                yield np.concatenate(self.buffer)
+            return
+        if self.buffer:
+            self._spill(np.concatenate(self.buffer))
+            self.buffer, self.buffered = [], 0
+        for p in range(self.partitions):
+            path = os.path.join(self.folder, f"{p}.bin")
+            if os.path.exists(path):
+                yield np.fromfile(path, dtype=RECORD)
+
+    def merge(self, other, offset=0):
+        """fold in another finder. offset shifts its row numbers (for file ranges)."""
+        self.rows += other.rows
+        self.examples = _smallest(self.examples, other.examples + offset)
+        for records in other._parts():
+            records = records.copy()
+            records["row"] += offset
+            self._add(records)
+        other._discard()
+        return self
+
+    def finish(self, seen=None, distinct=False):
+        """
+        count the duplicates, delete any spill files, and return the result.
+        seen = FingerprintIndex of the rows before these: a row repeating one
+        of them counts too. distinct = also return the sorted fingerprints that
+        are not in seen yet (to add to the index). the first call decides.
+        with seen, groups counts the values of these rows that repeat, also
+        ones that were repeated before.
+        """
+        if self.done is None:
+            duplicates = groups = 0
+            examples = self.examples
+            fresh = []
+            for records in self._parts():
+                kept, repeats = collapse(records)
+                duplicates += int((kept["n"] - 1).sum())
+                groups += int((kept["n"] > 1).sum())
+                examples = _smallest(examples, repeats)
+                if seen is not None:
+                    # every row of a value seen before is a repeat, the first one too
+                    old = seen.contains(kept["hash"])
+                    duplicates += int(old.sum())
+                    groups += int((old & (kept["n"] == 1)).sum())
+                    examples = _smallest(examples, kept["row"][old])
+                    kept = kept[~old]
+                if distinct:
+                    fresh.append(kept["hash"])
+            self.done = {
+                "keys": self.keys, "rows": self.rows, "duplicates": duplicates, "groups": groups,
+                "examples": [int(row) for row in examples], "spilled": self.folder is not None,
+            }
+            if distinct:
+                self.done["distinct"] = np.sort(np.concatenate(fresh)) if fresh else np.empty(0, dtype=np.uint64)
+            self._discard()
+        elif distinct and "distinct" not in self.done:
+            raise RuntimeError("duplicate check already finished without keeping the fingerprints")
+        return self.done
+
+    def _discard(self):
+        if self.folder is not None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            self.folder = None
+        self.buffer, self.buffered = [], 0
+
+
+class FingerprintIndex:
+    """
+    distinct fingerprints on disk, as sorted .npy files ("runs") in a folder.
+    lookups memory map the runs, so only the pages searched are read. adding
+    writes a new run and merges the newest runs while they are of similar
+    size, so there are only about log2(runs added) of them. the files of the
+    old runs are left alone (a saved checkpoint may still point at them),
+    see unused_runs.
+    """
+
+    def __init__(self, folder, runs=()):
+        self.folder = folder
+        self.runs = list(runs)      # [(file name, fingerprints in it)]
+
+    def __len__(self):
+        return sum(size for _, size in self.runs)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.folder, name), mmap_mode="r")
+
+    def contains(self, hashes):
+        """bool mask: which of these fingerprints are in the index."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        found = np.zeros(len(hashes), dtype=bool)
+        for name, size in self.runs:
+            if size:
+                run = self._load(name)
+                at = np.minimum(np.searchsorted(run, hashes), size - 1)
+                found |= run[at] == hashes
+        return found
+
+    def add(self, hashes):
+        """a new index with these sorted fingerprints (none of them in this one) added."""
+        runs = list(self.runs)
+        if len(hashes):
+            runs.append(self._write(hashes))
+        while len(runs) > 1 and runs[-2][1] <= 2 * runs[-1][1]:
+            (older, _), (newer, _) = runs[-2], runs[-1]
+            merged = np.sort(np.concatenate([self._load(older), self._load(newer)]))
+            runs[-2:] = [self._write(merged)]
+        return FingerprintIndex(self.folder, runs)
+
+    def _write(self, hashes):
+        os.makedirs(self.folder, exist_ok=True)
+        name = uuid.uuid4().hex + ".npy"
+        np.save(os.path.join(self.folder, name), np.asarray(hashes, dtype=np.uint64))
+        return name, len(hashes)
+
+
+def unused_runs(folder, indexes):
+    """delete the run files in folder that none of these indexes use."""
+    if not os.path.isdir(folder):
+        return
+    used = {name for index in indexes for name, _ in index.runs}
+    for name in os.listdir(folder):
+        if name not in used:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
@@ -0,0 +1,102 @@
+"""
+auto-fix plan.
+
+audit_trail items can carry a 'fix' spec like
+{'action': 'fill', 'column': 'age', 'strategy': 'mode'}. build_fix_plan()
+collects them into one FixPlan. fit() works out every fill value once,
+apply() then fills all columns in one pass, so a wide file does not make
+one full copy of the frame per column. fit_chunks() and apply() also work
+chunk by chunk for streaming.
+"""
+
+import pandas as pd
+
+from core.sketches import FrequentItems
+
+# fill value for a column that has no values at all
+EMPTY_FILL = 0
+
+
+def mode_value(series):
+    mode = series.mode()
+    return mode.iloc[0] if not mode.empty else EMPTY_FILL
+
+
+def fill_with_mode(df, col):
+    """return a copy of df with missing values in col filled by its mode."""
+    return df.fillna({col: mode_value(df[col])})
+
+
+class FixPlan:
+    def __init__(self, fills=None, functions=None):
+        self.fills = dict(fills or {})       # column -> strategy
+        self.functions = list(functions or [])  # plain fix_function callables
+        self.values = {}                     # column -> fill value, set by fit
+
+    @property
+    def columns(self):
+        return list(self.fills)
+
+    def fit(self, df):
+        for col, strategy in self.fills.items():
+            _check_strategy(strategy)
+            self.values[col] = mode_value(df[col])
+        return self
+
+    def fit_chunks(self, chunks):
+        """work out fill values from an iterable of chunks (bounded memory)."""
+        sketches = {col: FrequentItems() for col in self.fills}
+        # smallest value seen, the mode when every value is distinct (and the
+        # sketch has pruned them all). keeps a text column filled with text
+        smallest = {}
+        for strategy in self.fills.values():
+            _check_strategy(strategy)
+        for chunk in chunks:
+            for col, sketch in sketches.items():
+                sketch.update(chunk[col])
+                smallest[col] = _smaller(smallest.get(col), chunk[col])
+        for col, sketch in sketches.items():
+            top = sketch.top()
+            if top is None:
+                top = smallest.get(col)
+            self.values[col] = EMPTY_FILL if top is None else top
+        return self
+
+    def apply(self, df):
+        """fill the fitted columns in place (column by column, no frame copy)."""
+        for col, value in self.values.items():
+            if col in df.columns and df[col].hasnans:
+                if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+                    df[col] = df[col].cat.add_categories([value])
+                df[col] = df[col].fillna(value)
+        for fix in self.functions:
+            df = fix(df)
+        return df
+
+
+def _smaller(current, series):
+    values = series.dropna()
+    if values.empty:
+        return current
+    try:
+        low = values.min()
+        return low if current is None or low < current else current
+    except TypeError:
+        return current if current is not None else values.iloc[0]
+
+
+def _check_strategy(strategy):
+    if strategy != "mode":
+        raise ValueError(f"unknown fill strategy: {strategy}")
+
+
+def build_fix_plan(audit_trail):
+    """collect fix specs (and leftover fix_functions) from an audit trail."""
+    plan = FixPlan()
+    for item in audit_trail:
+        spec = item.get('fix')
+        if spec and spec.get('action') == 'fill':
+            plan.fills[spec['column']] = spec.get('strategy', 'mode')
+        elif callable(item.get('fix_function')):
+            plan.functions.append(item['fix_function'])
+    return plan
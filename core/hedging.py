@@ -0,0 +1,307 @@
+"""
+hedged calls across the model candidates.
+
+the first model is asked first. if it has not answered after its usual
+latency (a percentile of its recent calls, config.HEDGE_PERCENTILE), the
+next candidate is asked too, and whichever answers first wins. the others
+are cancelled (async) or left to finish in daemon threads that do not hold
+up the exit (threads cannot be stopped). a model that fails hands over to
+the next one straight away, like before.
+
+calls that wait before they send (rate limits, a full semaphore, retry
+backoff) take a Clock and wrap just the request in it, so the hedge timer
+and the latency stats only count the time the model itself takes.
+
+extra calls cost quota, so hedges come out of a budget: at most
+config.HEDGE_MAX_EXTRA extra calls per first call, plus a small burst.
+HEDGE_MAX_EXTRA = 0 turns hedging off.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+import config
+
+SAMPLES_KEPT = 200
+MIN_SAMPLES = 5
+# how often to look again while a clocked call has not sent its request yet
+POLL_S = 0.05
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class LatencyStats:
+    """recent latencies and call counts per model (thread safe)."""
+
+    def __init__(self, samples=SAMPLES_KEPT):
+        self.samples = samples
+        self.latencies = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def _count(self, model_name, field):
+        counts = self.counts.setdefault(model_name, {"calls": 0, "errors": 0, "hedges": 0, "wins": 0})
+        counts[field] += 1
+
+    def started(self, model_name, hedge=False):
+        with self.lock:
+            self._count(model_name, "calls")
+            if hedge:
+                self._count(model_name, "hedges")
+
+    def finished(self, model_name, seconds, ok):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(model_name, deque(maxlen=self.samples)).append(seconds)
+            else:
+                self._count(model_name, "errors")
+
+    def won(self, model_name):
+        with self.lock:
+            self._count(model_name, "wins")
+
+    def percentile(self, model_name, q):
+        """latency percentile from recent calls, or None while there are too few."""
+        with self.lock:
+            values = list(self.latencies.get(model_name, ()))
+        return _percentile(values, q) if len(values) >= MIN_SAMPLES else None
+
+    def report(self):
+        with self.lock:
+            names = sorted(set(self.counts) | set(self.latencies))
+            data = {name: (dict(self.counts.get(name, {})), list(self.latencies.get(name, ()))) for name in names}
+        report = {}
+        for name, (counts, values) in data.items():
+            report[name] = {**counts,
+                            "p50_s": round(_percentile(values, 0.5), 4) if values else None,
+                            "p95_s": round(_percentile(values, 0.95), 4) if values else None}
+        return report
+
+
+class HedgeBudget:
+    """extra calls allowed = burst + max_extra × first calls so far."""
+
+    def __init__(self, max_extra=None, burst=None):
+        self.max_extra = config.HEDGE_MAX_EXTRA if max_extra is None else max_extra
+        self.burst = config.HEDGE_BURST if burst is None else burst
+        self.primary = 0
+        self.extra = 0
+        self.lock = threading.Lock()
+
+    def record_primary(self):
+        with self.lock:
+            self.primary += 1
+
+    def try_spend(self):
+        with self.lock:
+            if self.max_extra <= 0 or self.extra >= self.burst + self.max_extra * self.primary:
+                return False
+            self.extra += 1
+            return True
+
+
+# shared by every call in this process
+MODEL_STATS = LatencyStats()
+BUDGET = HedgeBudget()
+
+
+def latency_report():
+    return MODEL_STATS.report()
+
+
+def probed_latencies():
+    """p95 seconds per model from the model_picker.py probe ({} if it never ran)."""
+    return {r["model"]: r.get("p95_s") for r in config.load_model_ranking()}
+
+
+def hedge_delay(model_name, stats=None, probed=None):
+    """
+    seconds to wait for model_name before asking the next candidate too.
+    probed = probed_latencies(), read here if not given.
+    """
+    stats = stats or MODEL_STATS
+    seconds = stats.percentile(model_name, config.HEDGE_PERCENTILE)
+    if seconds is None:
+        # not enough calls yet: use the probe results from model_picker.py if there are any
+        probed = probed_latencies() if probed is None else probed
+        seconds = probed.get(model_name) or config.HEDGE_DEFAULT_DELAY_S
+    return max(config.HEDGE_MIN_DELAY_S, seconds)
+
+
+class HedgeFailed(RuntimeError):
+    """every candidate failed. errors is a list of (model_name, exception)."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{name}: {e}" for name, e in errors) or "no models to try")
+        self.errors = errors
+
+
+class Clock:
+    """
+    when one model's request started (and ended). `with clock:` around the
+    request itself; a retried call can enter it again. unclocked calls get
+    one that started at launch.
+    """
+
+    def __init__(self, start=None):
+        self.start = start
+        self.end = None
+
+    def __enter__(self):
+        self.start, self.end = time.perf_counter(), None
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+
+    def sending(self):
+        return self.start is not None and self.end is None
+
+    def seconds(self):
+        return (self.end or time.perf_counter()) - self.start if self.start is not None else 0.0
+
+
+class _Race:
+    """bookkeeping shared by the async and the thread version."""
+
+    def __init__(self, models, stats, budget, clocked):
+        self.queue = list(models)
+        self.stats = stats or MODEL_STATS
+        self.budget = budget or BUDGET
+        self.clocked = clocked
+        self.errors = []
+        self.can_hedge = True
+        self.delays = {}
+        self.probed = None
+        self.budget.record_primary()
+
+    def delay(self, model_name):
+        """hedge_delay, worked out once per model and race."""
+        if model_name not in self.delays:
+            if self.probed is None:
+                self.probed = probed_latencies()
+            self.delays[model_name] = hedge_delay(model_name, self.stats, self.probed)
+        return self.delays[model_name]
+
+    def timeout(self, running):
+        """how long to wait before hedging, None to wait for an answer."""
+        if not self.queue or not self.can_hedge:
+            return None
+        model_name, clock = list(running.values())[-1]
+        if not clock.sending():
+            # still waiting for its turn to send: the hedge timer has not started
+            return POLL_S
+        return max(0.0, self.delay(model_name) - clock.seconds())
+
+    def due(self, running):
+        """the newest call has been sending for longer than its hedge delay."""
+        model_name, clock = list(running.values())[-1]
+        return clock.sending() and clock.seconds() >= self.delay(model_name)
+
+    def next_model(self, hedge):
+        if not self.queue:
+            return None
+        if hedge and not self.budget.try_spend():
+            # out of budget for extra calls: wait for what is already running
+            self.can_hedge = False
+            return None
+        model_name = self.queue.pop(0)
+        self.stats.started(model_name, hedge)
+        return model_name
+
+    def start(self, model_name):
+        """(clock, the call's arguments) for a new call."""
+        if self.clocked:
+            clock = Clock()
+            return clock, (model_name, clock)
+        return Clock(time.perf_counter()), (model_name,)
+
+    def settle(self, model_name, clock, error, text):
+        """record the latency; True if this answer wins, otherwise note the failure."""
+        ok = error is None and bool(text)
+        self.stats.finished(model_name, clock.seconds(), ok)
+        if ok:
+            self.stats.won(model_name)
+            return True
+        self.errors.append((model_name, error or RuntimeError("empty answer")))
+        return False
+
+
+async def hedged_call(call, models, stats=None, budget=None, clocked=False):
+    """
+    call: async (model_name) -> text, or (model_name, clock) -> text with
+    clocked=True. returns (model_name, text) from the first model that
+    answers; raises HedgeFailed if none do. losers are cancelled.
+    """
+    race = _Race(models, stats, budget, clocked)
+    running = {}
+
+    def launch(hedge):
+        model_name = race.next_model(hedge)
+        if model_name:
+            clock, args = race.start(model_name)
+            running[asyncio.ensure_future(call(*args))] = (model_name, clock)
+
+    launch(False)
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, timeout=race.timeout(running), return_when=asyncio.FIRST_COMPLETED)
+            if not done and race.due(running):
+                launch(True)
+            for task in done:
+                model_name, clock = running.pop(task)
+                error = task.exception()
+                if race.settle(model_name, clock, error, None if error else task.result()):
+                    return model_name, task.result()
+            if done and race.queue and not running:
+                launch(False)
+    finally:
+        for task in running:
+            task.cancel()
+    raise HedgeFailed(race.errors)
+
+
+def hedged_call_sync(call, models, stats=None, budget=None, clocked=False):
+    """
+    same as hedged_call for blocking calls, each in its own daemon thread. a
+    losing call cannot be stopped: it finishes in the background, is ignored,
+    and does not keep the process from exiting.
+    """
+    race = _Race(models, stats, budget, clocked)
+    running = {}
+    finished = queue.Queue()
+
+    def attempt(key, args):
+        try:
+            finished.put((key, None, call(*args)))
+        except Exception as e:
+            finished.put((key, e, None))
+
+    def launch(hedge):
+        model_name = race.next_model(hedge)
+        if model_name:
+            clock, args = race.start(model_name)
+            # the clock tells the calls apart, even if a model is listed twice
+            running[clock] = (model_name, clock)
+            threading.Thread(target=attempt, args=(clock, args), daemon=True, name=f"hedge-{model_name}").start()
+
+    launch(False)
+    while running:
+        try:
+            key, error, text = finished.get(timeout=race.timeout(running))
+        except queue.Empty:
+            if race.due(running):
+                launch(True)
+            continue
+        model_name, clock = running.pop(key)
+        if race.settle(model_name, clock, error, text):
+            return model_name, text
+        if race.queue and not running:
+            launch(False)
+    raise HedgeFailed(race.errors)
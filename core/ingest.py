@@ -0,0 +1,180 @@
+"""
+memory-lean csv loading.
+
+pd.read_csv() keeps every number as 64 bits and every string as a python
+object. read_lean() looks at a sample first, picks compact dtypes, then
+reads the file in chunks with them:
+
+- ints and floats are downcast to the smallest type that holds the sample
+  (floats only if the values survive float32 exactly)
+- low-cardinality text becomes a category, other text a pyarrow string
+- if a later chunk does not fit (a bigger number, a null in an int column),
+  that column is widened and the chunks read so far are upcast. text in a
+  numeric column restarts the read with that column as text.
+"""
+
+import numpy as np
+import pandas as pd
+
+from core.readers import csv_separator
+
+SAMPLE_ROWS = 10_000
+CHUNK_ROWS = 100_000
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5  # unique / non-null values in the sample
+INT_TYPES = ("int8", "int16", "int32", "int64")
+UINT_TYPES = ("uint8", "uint16", "uint32", "uint64")
+
+
+def _string_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "object"
+    return pd.StringDtype("pyarrow")
+
+
+def _int_dtype(values):
+    lo, hi = values.min(), values.max()
+    for name in (UINT_TYPES if lo >= 0 else INT_TYPES):
+        info = np.iinfo(name)
+        if info.min <= lo and hi <= info.max:
+            return name
+    return str(values.dtype)
+
+
+def _float_dtype(values):
+    values = values.dropna().to_numpy(dtype="float64")
+    with np.errstate(over="ignore"):
+        exact = np.array_equal(values.astype("float32").astype("float64"), values)
+    return "float32" if exact else "float64"
+
+
+def _text_dtype(values):
+    values = values.dropna()
+    unique = values.nunique()
+    if unique <= CATEGORY_MAX_UNIQUE and unique <= max(1, len(values)) * CATEGORY_MAX_RATIO:
+        return "category"
+    return _string_dtype()
+
+
+def column_dtype(series):
+    """compact dtype for one sampled column."""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return _int_dtype(series) if len(series) else "int64"
+    if pd.api.types.is_float_dtype(series.dtype):
+        return _float_dtype(series)
+    return _text_dtype(series)
+
+
+def infer_schema(csv_file, sample_rows=SAMPLE_ROWS):
+    """{column: dtype} from the first sample_rows rows."""
+    sample = pd.read_csv(csv_file, nrows=sample_rows, sep=csv_separator(csv_file))
+    return {col: column_dtype(sample[col]) for col in sample.columns}
+
+
+def _is_text(dtype):
+    return str(dtype) in ("category", "object") or isinstance(dtype, pd.StringDtype)
+
+
+class SchemaBroken(Exception):
+    """a numeric column got text; the read has to start over."""
+
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+def _widen(dtype, values):
+    """a dtype that holds both the current schema type and this chunk's values."""
+    if pd.api.types.is_integer_dtype(values.dtype) and dtype in INT_TYPES + UINT_TYPES:
+        both = pd.Series([np.iinfo(dtype).min, np.iinfo(dtype).max, values.min(), values.max()])
+        return _int_dtype(both)
+    if dtype == "float32" and pd.api.types.is_float_dtype(values.dtype):
+        return _float_dtype(values)
+    return "float64"
+
+
+def _conform(chunk, schema, categories):
+    """cast a chunk to the schema, widening schema entries that do not fit."""
+    widened = []
+    for col in chunk.columns:
+        dtype, values = schema[col], chunk[col]
+        if _is_text(dtype):
+            if dtype == "category":
+                categories[col] = categories[col].union(values.cat.categories)
+            continue
+        if dtype == "bool":
+            if not pd.api.types.is_bool_dtype(values.dtype):
+                raise SchemaBroken(col)
+            continue
+        if not pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+            if values.notna().any():
+                raise SchemaBroken(col)
+            values = values.astype("float64")  # all missing in this chunk
+        if values.hasnans and dtype in INT_TYPES + UINT_TYPES:
+            # ints above 16 bits do not all fit in float32
+            small = np.dtype(dtype).itemsize <= 2
+            dtype = "float32" if small and _float_dtype(values) == "float32" else "float64"
+        elif not values.dropna().empty:
+            try:
+                cast = values.astype(dtype).to_numpy(dtype="float64")
+                fits = np.array_equal(cast, values.to_numpy(dtype="float64"), equal_nan=True)
+            except (ValueError, OverflowError, TypeError):
+                fits = False
+            if not fits:
+                dtype = _widen(dtype, values)
+        if dtype != schema[col]:
+            schema[col] = dtype
+            widened.append(col)
+        chunk[col] = values.astype(dtype)
+    return widened
+
+
+def _read(csv_file, schema, chunksize):
+    read_as = {col: ("category" if dtype == "category" else dtype) for col, dtype in schema.items() if _is_text(dtype)}
+    categories = {col: pd.Index([]) for col, dtype in schema.items() if dtype == "category"}
+    chunks = []
+    with pd.read_csv(csv_file, chunksize=chunksize, dtype=read_as, sep=csv_separator(csv_file)) as reader:
+        for chunk in reader:
+            for col in _conform(chunk, schema, categories):
+                for earlier in chunks:
+                    earlier[col] = earlier[col].astype(schema[col])
+            chunks.append(chunk)
+    for col, cats in categories.items():
+        # every chunk gets the same categories so concat keeps the dtype
+        dtype = pd.CategoricalDtype(cats)
+        for chunk in chunks:
+            chunk[col] = chunk[col].astype(dtype)
+    if not chunks:
+        return pd.read_csv(csv_file, sep=csv_separator(csv_file))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_lean(csv_file, sample_rows=SAMPLE_ROWS, chunksize=CHUNK_ROWS):
+    """
+    read a csv with compact dtypes. returns (df, report); report has
+    schema, widened (columns that broke the sampled type) and memory
+    (per column {"before", "after"} bytes, before = default read_csv estimate).
+    """
+    schema = infer_schema(csv_file, sample_rows)
+    sampled = dict(schema)
+    while True:
+        try:
+            df = _read(csv_file, schema, chunksize)
+            break
+        except SchemaBroken as e:
+            schema[e.column] = _string_dtype()
+    widened = [col for col in schema if schema[col] != sampled.get(col)]
+    return df, {"schema": schema, "widened": widened, "memory": memory_report(csv_file, df, sample_rows)}
+
+
+def memory_report(csv_file, df, sample_rows=SAMPLE_ROWS):
+    """per column bytes: default dtypes (scaled up from a sample) vs the lean frame."""
+    sample = pd.read_csv(csv_file, nrows=sample_rows, sep=csv_separator(csv_file))
+    scale = len(df) / max(1, len(sample))
+    before = sample.memory_usage(index=False, deep=True) * scale
+    after = df.memory_usage(index=False, deep=True)
+    return {col: {"before": int(before.get(col, 0)), "after": int(after[col])} for col in df.columns}
@@ -1,45 +1,130 @@
-from google import genai
+import threading
+import time
 import config
+from core.cache import cache_key, default_cache
+from core.hedging import HedgeFailed, hedged_call_sync
+from core.rules import metadata_findings, rules_summary
+from core.serializer import serialize_metadata
 
-def get_ai_audit(metadata, api_key, return_trail=False):
+_DEFAULT = object()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def make_client(api_key):
+    # imported here, the sdk is slow to import and rules-only runs never need it
+    from google import genai
+    return genai.Client(api_key=api_key, http_options=config.get_http_options())
+
+def get_client(api_key):
+    """shared client per key/endpoint, so long-running processes keep warm connections."""
+    key = (api_key, str(config.get_http_options()))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = make_client(api_key)
+        return _clients[key]
+
+def flagged_columns(audit_trail):
+    return [item["column"] for item in audit_trail or [] if item.get("column") is not None]
+
+def build_prompt(metadata, audit_trail=None):
+    """the audit prompt with the metadata in its compact, token-budgeted form."""
+    text, _ = serialize_metadata(metadata, flagged=flagged_columns(audit_trail))
+    return config.AUDIT_PROMPT.format(metadata=text)
+
+def describe_error(model_name, e):
+    """short, human readable reason a model call failed."""
+    msg = str(e)
+    if "RESOURCE_EXHAUSTED" in msg or "429" in msg:
+        return f"{model_name}: quota exhausted (try later or check billing)"
+    if "NOT_FOUND" in msg or "404" in msg:
+        return f"{model_name}: model not available for this api"
+    return f"{model_name}: {type(e).__name__}: {e}"
+
+def generate_text(client, model_name, prompt, on_text=None):
+    """one gemini call. with on_text, stream it and hand every piece over as it arrives."""
+    if on_text is None:
+        return client.models.generate_content(model=model_name, contents=prompt).text
+    pieces = []
+    for chunk in client.models.generate_content_stream(model=model_name, contents=prompt):
+        text = chunk.text or ""
+        if text:
+            pieces.append(text)
+            on_text(text)
+    return "".join(pieces)
+
+def get_ai_audit(metadata, api_key, return_trail=False, audit_trail=None, cache=_DEFAULT,
+                 on_text=None, metrics=None):
     """
     rule pass first, then ask gemini for a summary.
     if return_trail is true, return (audit_trail, summary).
+    audit_trail: findings from a RuleEngine run over the data. if not given,
+    only the missing-value findings from the metadata are used.
+    cache: a ResponseCache, or None to always call gemini. defaults to the one in config.
+    on_text: called with each piece of the summary as gemini streams it
+    (a cached summary arrives as one piece). the full summary is still returned.
+    metrics: a dict to fill with model, cached, ttft_s (time to first token) and total_s.
     """
-    client = genai.Client(api_key=api_key)
-    audit_trail = []
+    if cache is _DEFAULT:
+        cache = default_cache()
+    client = None
+    if audit_trail is None:
+        audit_trail = metadata_findings(metadata)
     summary = ""
     errors = []
-    # simple rule pass: missing values
-    nulls = metadata.get('null_counts', {})
-    for col, count in nulls.items():
-        if count > 0:
-            audit_trail.append({
-                'description': f"Column '{col}' has {count} missing values.",
-                'suggested_fix': f"Fill or drop missing values in '{col}'",
-                'fix_function': lambda df, c=col: df.fillna({c: df[c].mode()[0] if not df[c].mode().empty else 0})
-            })
-    # then ask gemini for a summary
-    for model_name in config.get_model_candidates():
+    started = time.perf_counter()
+    stats = {"model": None, "cached": False, "ttft_s": None, "total_s": None}
+
+    def first_token(text):
+        if stats["ttft_s"] is None:
+            stats["ttft_s"] = round(time.perf_counter() - started, 6)
+        if on_text is not None:
+            on_text(text)
+
+    # then ask gemini for a summary. a cached summary from any candidate will do,
+    # if it was asked with the same prompt (same findings, same token budget)
+    candidates = config.get_model_candidates()
+    prompt = build_prompt(metadata, audit_trail)
+    if cache and candidates:
+        keys = {cache_key(metadata, model_name, prompt): model_name for model_name in candidates}
+        key, summary = cache.get_first(keys)
+        summary = summary or ""
+        if summary:
+            stats.update(model=keys[key], cached=True)
+            first_token(summary)
+    if not summary and on_text is not None:
+        # streamed: one model at a time, a half-shown answer cannot be raced
+        for model_name in candidates:
+            try:
+                if client is None:
+                    client = get_client(api_key)
+                summary = generate_text(client, model_name, prompt, first_token)
+                stats["model"] = model_name
+                break
+            except Exception as e:
+                errors.append(describe_error(model_name, e))
+                if stats["ttft_s"] is not None:
+                    # part of the answer is already on screen, do not start over with another model
+                    summary = ""
+                    break
+    elif not summary:
+        # hedged: a slow model gets company from the next candidate (core/hedging.py)
         try:
-            response = client.models.generate_content(model=model_name, contents=config.AUDIT_PROMPT.format(metadata=metadata))
-            summary = response.text
-            break
+            client = get_client(api_key)
+            stats["model"], summary = hedged_call_sync(
+                lambda model_name: generate_text(client, model_name, prompt), candidates)
+            first_token(summary)
+        except HedgeFailed as e:
+            errors.extend(describe_error(model_name, err) for model_name, err in e.errors)
         except Exception as e:
-            msg = str(e)
-            if "RESOURCE_EXHAUSTED" in msg or "429" in msg:
-                errors.append(f"{model_name}: quota exhausted (try later or check billing)")
-            elif "NOT_FOUND" in msg or "404" in msg:
-                errors.append(f"{model_name}: model not available for this api")
-            else:
-                errors.append(f"{model_name}: {type(e).__name__}: {e}")
-            continue
+            errors.append(describe_error(candidates[0], e))
+    if summary and cache and not stats["cached"] and stats["model"]:
+        cache.put(cache_key(metadata, stats["model"], prompt), summary, stats["model"])
+    stats["total_s"] = round(time.perf_counter() - started, 6)
+    if metrics is not None:
+        metrics.update(stats)
     if not summary:
-        if audit_trail:
-            issues = "; ".join(item["description"] for item in audit_trail)
-            summary = f"ai summary unavailable. rule-based findings: {issues}"
-        else:
-            summary = "ai summary unavailable. rule-based findings: no missing values found."
+        summary = "ai summary unavailable. " + rules_summary(audit_trail)
         if errors:
             summary += "\nreasons:\n" + "\n".join(f"- {err}" for err in errors)
     if return_trail:
@@ -0,0 +1,254 @@
+"""
+statistical outliers in numeric columns, optionally within groups
+(e.g. salaries per department).
+
+two methods:
+- mad: robust z-score, 0.6745 * |x - median| / mad over config.OUTLIER_MAD_Z
+- iqr: below q1 - k * iqr or above q3 + k * iqr, k = config.OUTLIER_IQR_K
+
+one pass over chunks. every column (per group) has a kll sketch for the
+median / quartiles, and values outside a looser fence worked out from the
+sketch so far are kept as candidates (row, value). at the end the final
+fences come from the whole sketch and the candidates outside them are the
+outliers. a value is only missed if it sat inside the loose fence when its
+chunk was read and outside the final one, which takes a big drift in the
+data. if the candidates outgrow config.OUTLIER_BUFFER_ROWS they are pruned
+with the fences so far; if that is still too many, the least extreme are
+dropped but still counted.
+
+a count is marked approximate (the finding says "about") when the fences
+come from a sketch that has compacted, when candidates were cut with fences
+from only part of the values (several chunks or worker ranges), or when
+candidates were dropped. so the same file can get an exact count in memory
+and an approximate one streamed, but never two exact counts that disagree.
+
+    detector = OutlierDetector(group_by="department")
+    for chunk in chunks:           # chunk.index = row numbers in the file
+        detector.update(chunk)
+    detector.finish()  # {column: {"count", "rows", "low", "high", ...}}
+"""
+
+import numpy as np
+import pandas as pd
+
+import config
+from core.sketches import KLLSketch
+
+METHODS = ("mad", "iqr")
+MAD_SCALE = 0.6745
+# candidates are kept beyond this share of the real threshold
+SLACK = 0.75
+# smaller sketches per group, there can be a thousand of them per column
+GROUP_SKETCH_K = 64
+EXAMPLE_ROWS = 5
+
+
+def _weighted_quantile(items, weights, q):
+    cum = np.cumsum(weights)
+    return float(items[min(int(np.searchsorted(cum, q * cum[-1], side="left")), len(items) - 1)])
+
+
+def fences(sketch, method, threshold):
+    """(low, high) outside which a value is an outlier, or None (too few values or no spread)."""
+    if sketch.n < config.OUTLIER_MIN_ROWS:
+        return None
+    items, weights = sketch.weighted()
+    if method == "mad":
+        median = _weighted_quantile(items, weights, 0.5)
+        deviations = np.abs(items - median)
+        order = np.argsort(deviations, kind="stable")
+        mad = _weighted_quantile(deviations[order], weights[order], 0.5)
+        if not mad:
+            return None
+        half = threshold * mad / MAD_SCALE
+        return median - half, median + half
+    q1, q3 = _weighted_quantile(items, weights, 0.25), _weighted_quantile(items, weights, 0.75)
+    if q3 == q1:
+        return None
+    return q1 - threshold * (q3 - q1), q3 + threshold * (q3 - q1)
+
+
+def _numeric(series):
+    if pd.api.types.is_bool_dtype(series.dtype) or not pd.api.types.is_numeric_dtype(series.dtype):
+        return None
+    return series.to_numpy(dtype="float64", na_value=np.nan)
+
+
+class OutlierDetector:
+    """mergeable outlier search for chunks and worker processes."""
+
+    def __init__(self, method=None, group_by=None, threshold=None, max_groups=None, buffer_rows=None):
+        self.method = method or config.OUTLIER_METHOD
+        if self.method not in METHODS:
+            raise ValueError(f"unknown outlier method {self.method!r}, use one of {', '.join(METHODS)}")
+        default = config.OUTLIER_MAD_Z if self.method == "mad" else config.OUTLIER_IQR_K
+        self.threshold = threshold or default
+        self.group_by = group_by
+        self.max_groups = max_groups or config.OUTLIER_MAX_GROUPS
+        self.buffer_rows = buffer_rows or config.OUTLIER_BUFFER_ROWS
+        self.groups = {}        # group value -> index
+        self.sketches = {}      # column -> {group index: KLLSketch}
+        self.candidates = {}    # column -> [(rows, values, group indexes), ...]
+        self.buffered = {}      # column -> candidates held
+        self.dropped = {}       # column -> candidates dropped (and counted) when the buffer was full
+        self.cut_at = {}        # column -> fewest values seen when candidates were cut with the fences so far
+        self.skipped_rows = 0   # rows whose group was missing or over max_groups
+        self.done = None
+
+    def spec(self):
+        """arguments for a detector in a worker process."""
+        return {"method": self.method, "group_by": self.group_by, "threshold": self.threshold,
+                "max_groups": self.max_groups, "buffer_rows": self.buffer_rows}
+
+    def _group_index(self, key):
+        if key not in self.groups:
+            if len(self.groups) >= self.max_groups:
+                return -1
+            self.groups[key] = len(self.groups)
+        return self.groups[key]
+
+    def _group_codes(self, df):
+        if not self.group_by:
+            return np.zeros(len(df), dtype=np.int64)
+        if self.group_by not in df.columns:
+            raise ValueError(f"group-by column not in the file: {self.group_by}")
+        codes, uniques = pd.factorize(df[self.group_by])
+        mapping = np.array([self._group_index(key) for key in uniques] + [-1], dtype=np.int64)
+        # factorize marks missing values with -1, which picks the trailing -1 above
+        return mapping[codes]
+
+    def _sketch(self, col, group):
+        sketches = self.sketches.setdefault(col, {})
+        if group not in sketches:
+            sketches[group] = KLLSketch(k=GROUP_SKETCH_K) if self.group_by else KLLSketch()
+        return sketches[group]
+
+    def _seen(self, col):
+        return sum(sketch.n for sketch in self.sketches.get(col, {}).values())
+
+    def _cut(self, col):
+        # candidates were left out with the fences so far, later values can still move the fences
+        self.cut_at[col] = min(self.cut_at.get(col, np.inf), self._seen(col))
+
+    def _fence_arrays(self, col, final=False):
+        """low / high fence per group index. final=False gives the looser candidate fences."""
+        size = max(len(self.groups), 1)
+        low, high = np.full(size, -np.inf), np.full(size, np.inf)
+        for group, sketch in self.sketches.get(col, {}).items():
+            found = fences(sketch, self.method, self.threshold * (1 if final else SLACK))
+            if found is not None:
+                low[group], high[group] = found
+            elif not final:
+                # no fence yet (few values or no spread): keep anything off the median
+                median = sketch.quantiles([0.5])[0] if sketch.n >= config.OUTLIER_MIN_ROWS else None
+                low[group], high[group] = (median, median) if median is not None else (np.inf, -np.inf)
+        return low, high
+
+    def update(self, df):
+        if self.done is not None:
+            raise RuntimeError("outlier check already finished")
+        codes = self._group_codes(df)
+        self.skipped_rows += int((codes < 0).sum())
+        rows = df.index.to_numpy()
+        for col in df.columns:
+            values = _numeric(df[col]) if col != self.group_by else None
+            if values is None:
+                continue
+            ok = ~np.isnan(values) & (codes >= 0)
+            values, row_numbers, groups = values[ok], rows[ok], codes[ok]
+            if not len(values):
+                continue
+            if self.group_by:
+                order = np.argsort(groups, kind="stable")
+                sorted_groups = groups[order]
+                starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+                for group, part in zip(sorted_groups[starts], np.split(values[order], starts[1:])):
+                    self._sketch(col, int(group)).update(part)
+            else:
+                self._sketch(col, 0).update(values)
+            low, high = self._fence_arrays(col)
+            out = (values < low[groups]) | (values > high[groups])
+            if not out.all():
+                self._cut(col)
+            self._keep(col, row_numbers[out], values[out], groups[out])
+        return self
+
+    def _keep(self, col, rows, values, groups):
+        if not len(rows):
+            self.candidates.setdefault(col, [])
+            return
+        self.candidates.setdefault(col, []).append((rows, values, groups))
+        self.buffered[col] = self.buffered.get(col, 0) + len(rows)
+        if self.buffered[col] > self.buffer_rows:
+            self._prune(col)
+
+    def _prune(self, col):
+        rows, values, groups = (np.concatenate(parts) for parts in zip(*self.candidates[col]))
+        low, high = self._fence_arrays(col)
+        out = (values < low[groups]) | (values > high[groups])
+        if not out.all():
+            self._cut(col)
+        rows, values, groups = rows[out], values[out], groups[out]
+        if len(rows) > self.buffer_rows:
+            # still too many: keep the most extreme, count the rest as outliers
+            center, half = (low + high) / 2, np.maximum((high - low) / 2, 1e-12)
+            extreme = np.abs(values - center[groups]) / half[groups]
+            keep = np.argsort(-extreme, kind="stable")[:self.buffer_rows]
+            self.dropped[col] = self.dropped.get(col, 0) + len(rows) - len(keep)
+            keep.sort()
+            rows, values, groups = rows[keep], values[keep], groups[keep]
+        self.candidates[col] = [(rows, values, groups)]
+        self.buffered[col] = len(rows)
+
+    def merge(self, other, offset=0):
+        """fold in another detector. offset shifts its row numbers (for file ranges)."""
+        remap = np.array([self._group_index(key) for key in other.groups] + [-1], dtype=np.int64)
+        if not other.group_by:
+            remap = np.array([0, -1], dtype=np.int64)
+        self.skipped_rows += other.skipped_rows
+        for col, sketches in other.sketches.items():
+            for group, sketch in sketches.items():
+                if remap[group] >= 0:
+                    self._sketch(col, int(remap[group])).merge(sketch)
+        for col, parts in other.candidates.items():
+            for rows, values, groups in parts:
+                groups = remap[groups]
+                ok = groups >= 0
+                self._keep(col, rows[ok] + offset, values[ok], groups[ok])
+            self.dropped[col] = self.dropped.get(col, 0) + other.dropped.get(col, 0)
+        for col, seen in other.cut_at.items():
+            self.cut_at[col] = min(self.cut_at.get(col, np.inf), seen)
+        return self
+
+    def finish(self):
+        """{column: {"count", "approximate", "rows", "low", "high", "groups"}} for columns with outliers."""
+        if self.done is not None:
+            return self.done
+        names = {index: key for key, index in self.groups.items()}
+        self.done = {}
+        for col, parts in self.candidates.items():
+            if not parts:
+                continue
+            rows, values, groups = (np.concatenate(items) for items in zip(*parts))
+            low, high = self._fence_arrays(col, final=True)
+            out = (values < low[groups]) | (values > high[groups])
+            count = int(out.sum()) + self.dropped.get(col, 0)
+            if not count:
+                continue
+            sketches = self.sketches.get(col, {}).values()
+            approximate = (bool(self.dropped.get(col)) or self.cut_at.get(col, np.inf) < self._seen(col)
+                           or not all(sketch.exact for sketch in sketches))
+            found = {
+                "count": count,
+                "approximate": approximate,
+                "rows": [int(row) for row in np.sort(rows[out])[:EXAMPLE_ROWS]],
+                "low": None, "high": None, "groups": {},
+            }
+            if self.group_by:
+                per_group = pd.Series(groups[out]).value_counts()
+                found["groups"] = {names[int(group)]: int(n) for group, n in per_group.items()}
+            elif np.isfinite(low[0]):
+                found["low"], found["high"] = float(low[0]), float(high[0])
+            self.done[col] = found
+        self.candidates = {}
+        return self.done
@@ -0,0 +1,162 @@
+import io
+import os
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core.data_processor import DEFAULT_CHUNKSIZE, MetadataAccumulator
+from core.duplicates import DuplicateFinder
+from core.outliers import OutlierDetector
+from core.readers import csv_separator
+from core.rules import RuleEngine
+from core.semantic import file_types
+
+# more partitions than workers so a slow partition does not hold up the rest
+PARTITIONS_PER_WORKER = 4
+# finished ranges waiting to be merged (in file order) per worker. the duplicate
+# checks get 1 / (workers * this) of their memory per range, so everything
+# waiting in the parent stays within one DUPLICATE_MEMORY_MB
+WINDOW_PER_WORKER = 2
+
+
+class _RangeReader(io.RawIOBase):
+    """file-like view over bytes [start, end) of a file."""
+
+    def __init__(self, path, start, end):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if self._left <= 0:
+            return 0
+        data = self._f.read(min(len(buf), self._left))
+        buf[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def split_byte_ranges(csv_file, parts):
+    """
+    cut the data part of a csv (everything after the header) into byte ranges.
+    every range starts right after a newline, so no row is split in two.
+    note: rows with quoted newlines inside them can still be cut.
+    """
+    size = os.path.getsize(csv_file)
+    with open(csv_file, "rb") as f:
+        f.readline()
+        data_start = f.tell()
+        cuts = [data_start]
+        for i in range(1, parts):
+            pos = data_start + (size - data_start) * i // parts
+            if pos <= cuts[-1]:
+                continue
+            f.seek(pos - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > cuts[-1]:
+                cuts.append(f.tell())
+    cuts.append(size)
+    return [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+def read_header(csv_file):
+    return list(pd.read_csv(csv_file, nrows=0, sep=csv_separator(csv_file)).columns)
+
+
+def profile_range(csv_file, start, end, columns, chunksize=DEFAULT_CHUNKSIZE, rules=None, duplicates=None,
+                  outliers=None, types=None, memory_share=1):
+    """
+    profile one byte range and return its partial accumulator.
+    with a list of rule names, also return a RuleEngine run over the same rows.
+    duplicates = DuplicateFinder.spec() to look for repeated rows too,
+    outliers = OutlierDetector.spec() to look for outliers,
+    types = semantic types of the whole file (core.semantic.file_types),
+    memory_share = rules with a memory cap use 1/memory_share of it.
+    """
+    acc = MetadataAccumulator()
+    finder = DuplicateFinder(**duplicates) if duplicates is not None else None
+    detector = OutlierDetector(**outliers) if outliers is not None else None
+    engine = RuleEngine(rules, finder, detector, types, memory_share) if rules is not None else None
+    with io.BufferedReader(_RangeReader(csv_file, start, end)) as f:
+        for chunk in pd.read_csv(f, header=None, names=columns, chunksize=chunksize, sep=csv_separator(csv_file)):
+            acc.update(chunk)
+            if engine is not None:
+                engine.update(chunk)
+    if acc.columns is None:
+        acc.update(pd.DataFrame(columns=columns))
+    return acc, engine
+
+
+def _profile_range_args(args):
+    return profile_range(*args)
+
+
+def _in_order(pool, jobs, window):
+    """results of jobs in job order, with at most `window` jobs submitted and not yet consumed."""
+    jobs = iter(jobs)
+    pending = deque(pool.submit(_profile_range_args, job) for job in islice(jobs, window))
+    while pending:
+        result = pending.popleft().result()
+        job = next(jobs, None)
+        if job is not None:
+            pending.append(pool.submit(_profile_range_args, job))
+        yield result
+
+
+def merge_accumulators(partials, engine=None):
+    """merge per-range (accumulator, engine) pairs in file order into one accumulator."""
+    total = MetadataAccumulator()
+    for part, part_engine in partials:
+        # each range numbers its rows from 0, shift them to file positions
+        if part_engine is not None:
+            engine.merge(part_engine, offset=total.row_count)
+        if part.head is not None:
+            part.head.index = part.head.index + total.row_count
+        total.merge(part)
+    return total
+
+
+def merge_partials(partials, engine=None):
+    """merge per-range results in file order into one metadata dict."""
+    return merge_accumulators(partials, engine).result()
+
+
+def profile_file_parallel(csv_file, workers=None, chunksize=DEFAULT_CHUNKSIZE, engine=None):
+    """
+    build the same metadata as get_metadata(pd.read_csv(csv_file)),
+    but profile byte ranges of the file in a process pool.
+    if a RuleEngine is passed, the workers run the same rules and their
+    results are merged into it. its semantic types (found on the file head
+    if it has none yet) go to every worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    columns = read_header(csv_file)
+    ranges = split_byte_ranges(csv_file, workers * PARTITIONS_PER_WORKER)
+    rules = [rule.name for rule in engine.rules] if engine is not None else None
+    window = workers * WINDOW_PER_WORKER
+    duplicates = engine.duplicates.spec(window) if engine is not None and engine.duplicates is not None else None
+    outliers = engine.outliers.spec() if engine is not None and engine.outliers is not None else None
+    if engine is not None and engine.types is None:
+        engine.set_types(file_types(csv_file))
+    types = engine.types if engine is not None else None
+    jobs = [(csv_file, start, end, columns, chunksize, rules, duplicates, outliers, types, window)
+            for start, end in ranges]
+    if not jobs:
+        return merge_partials([(MetadataAccumulator().update(pd.DataFrame(columns=columns)), None)], engine)
+    if workers == 1 or len(jobs) <= 1:
+        # one range at a time, each merged before the next is read
+        return merge_partials((_profile_range_args(job) for job in jobs), engine)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # merged as they come back in file order, so only a window of ranges is held at once
+        return merge_partials(_in_order(pool, jobs, window), engine)
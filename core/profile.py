@@ -0,0 +1,288 @@
+"""
+compact table profile, what get_metadata returns.
+
+the per-column numbers live in numpy arrays (one slot per column) instead
+of a few nested dicts per column, so a table with 10k+ columns is a handful
+of arrays: quick to build, pickle and scan. the serializer and the rule
+pass read the arrays directly.
+
+for everyone else a TableProfile still looks like the old metadata dict:
+
+    profile["null_counts"]["age"], profile["stats"]["age"]["min"]
+    profile["row_count"] = 10          # row_count, null_counts and extra keys can be set
+    profile.to_dict()                  # the plain nested dicts
+    profile.column("age").nulls        # one column, no dicts
+
+the dict views are built on first use and are read-only. it is a dict
+subclass, so json.dumps(profile) and isinstance(profile, dict) work too.
+"""
+
+from collections.abc import ItemsView, KeysView, Mapping, ValuesView
+
+import numpy as np
+import pandas as pd
+
+# quantiles reported per numeric column, read from a kll sketch
+QUANTILES = {"p1": 0.01, "p25": 0.25, "p50": 0.5, "p75": 0.75, "p99": 0.99}
+KEYS = ("columns", "null_counts", "head", "row_count", "stats")
+
+
+class ColumnProfile:
+    """one column of a TableProfile (a view, nothing is copied)."""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    name = property(lambda self: self.table.columns[self.index])
+    dtype = property(lambda self: self.table.dtypes[self.index])
+    nulls = property(lambda self: int(self.table.nulls[self.index]))
+    count = property(lambda self: int(self.table.counts[self.index]))
+    min = property(lambda self: self.table.mins[self.index])
+    max = property(lambda self: self.table.maxs[self.index])
+
+    @property
+    def distinct(self):
+        value = int(self.table.distinct[self.index])
+        return value if value >= 0 else None
+
+    @property
+    def mean(self):
+        value = self.table.means[self.index]
+        return None if np.isnan(value) else float(value)
+
+    @property
+    def quantiles(self):
+        if not self.table.has_quantiles[self.index]:
+            return None
+        return dict(zip(QUANTILES, self.table.quantiles[self.index].tolist()))
+
+    def stats(self):
+        """the old per-column stats dict."""
+        if self.dtype is None:
+            return {}
+        stat = {"dtype": self.dtype, "count": self.count}
+        if self.distinct is not None:
+            stat["distinct"] = self.distinct
+        if self.table.has_range[self.index]:
+            stat.update(min=self.min, max=self.max)
+            if self.mean is not None:
+                stat["mean"] = self.mean
+        if self.table.has_quantiles[self.index]:
+            stat["quantiles"] = self.quantiles
+        return stat
+
+    def __repr__(self):
+        return f"ColumnProfile({self.name!r}, {self.stats()})"
+
+
+class TableProfile(dict):
+    """
+    column profiles of a whole table in arrays, readable like the old metadata dict.
+    the dict storage only mirrors columns, row_count, the extra keys and the
+    views built so far, every read goes through __getitem__.
+    """
+
+    def __init__(self, columns, dtypes=None, nulls=None, counts=None, distinct=None, row_count=0, head=None):
+        self.columns = list(columns)
+        n = len(self.columns)
+        self.dtypes = list(dtypes) if dtypes is not None else [None] * n
+        self.nulls = np.asarray(nulls if nulls is not None else np.zeros(n), dtype=np.int64)
+        self.counts = np.asarray(counts if counts is not None else np.zeros(n), dtype=np.int64)
+        # -1 = unknown
+        self.distinct = np.asarray(distinct if distinct is not None else np.full(n, -1), dtype=np.int64)
+        self.has_range = np.zeros(n, dtype=bool)
+        self.mins = np.full(n, None, dtype=object)
+        self.maxs = np.full(n, None, dtype=object)
+        self.means = np.full(n, np.nan)
+        self.has_quantiles = np.zeros(n, dtype=bool)
+        self.quantiles = np.full((n, len(QUANTILES)), np.nan)
+        self.row_count = row_count
+        self.head = head if head is not None else pd.DataFrame()
+        self.extra = {}
+        self._positions = None
+        self._views = {}
+        self._sync()
+
+    def set_range(self, index, lo, hi, mean=None):
+        self.has_range[index] = True
+        self.mins[index], self.maxs[index] = lo, hi
+        self.means[index] = np.nan if mean is None else mean
+
+    def set_quantiles(self, index, values):
+        self.has_quantiles[index] = True
+        self.quantiles[index] = values
+
+    def add_columns(self, names, dtypes, nulls, counts, mins=None, maxs=None):
+        """append columns known only from elsewhere (e.g. parquet footer statistics)."""
+        start, extra = len(self.columns), len(names)
+        self.columns.extend(names)
+        self.dtypes.extend(dtypes)
+        self.nulls = np.concatenate([self.nulls, np.asarray(nulls, dtype=np.int64)])
+        self.counts = np.concatenate([self.counts, np.asarray(counts, dtype=np.int64)])
+        self.distinct = np.concatenate([self.distinct, np.full(extra, -1, dtype=np.int64)])
+        self.has_range = np.concatenate([self.has_range, np.zeros(extra, dtype=bool)])
+        self.mins = np.concatenate([self.mins, np.full(extra, None, dtype=object)])
+        self.maxs = np.concatenate([self.maxs, np.full(extra, None, dtype=object)])
+        self.means = np.concatenate([self.means, np.full(extra, np.nan)])
+        self.has_quantiles = np.concatenate([self.has_quantiles, np.zeros(extra, dtype=bool)])
+        self.quantiles = np.concatenate([self.quantiles, np.full((extra, len(QUANTILES)), np.nan)])
+        for i, (lo, hi) in enumerate(zip(mins or [None] * extra, maxs or [None] * extra)):
+            if lo is not None:
+                self.set_range(start + i, lo, hi)
+        self._changed()
+        return self
+
+    def _changed(self):
+        self._positions = None
+        self._views = {}
+        self._sync()
+
+    def _sync(self):
+        # json skips an empty dict without asking for its items, so keep the storage filled
+        dict.clear(self)
+        dict.update(self, {"columns": self.columns, "row_count": self.row_count, **self.extra, **self._views})
+
+    @classmethod
+    def from_dict(cls, metadata):
+        """a profile from an old style metadata dict (missing parts stay unknown)."""
+        stats = metadata.get("stats") or {}
+        null_counts = metadata.get("null_counts") or {}
+        columns = list(metadata.get("columns") or dict.fromkeys([*null_counts, *stats]))
+        profile = cls(
+            columns,
+            [stats.get(col, {}).get("dtype") for col in columns],
+            [null_counts.get(col, 0) for col in columns],
+            [stats.get(col, {}).get("count", 0) for col in columns],
+            [-1 if stats.get(col, {}).get("distinct") is None else stats[col]["distinct"] for col in columns],
+            metadata.get("row_count"),
+            pd.DataFrame(metadata.get("head") or {}),
+        )
+        for i, col in enumerate(columns):
+            stat = stats.get(col, {})
+            if "min" in stat:
+                profile.set_range(i, stat["min"], stat.get("max"), stat.get("mean"))
+            if stat.get("quantiles"):
+                profile.set_quantiles(i, [stat["quantiles"].get(q, np.nan) for q in QUANTILES])
+        profile.extra = {key: value for key, value in metadata.items() if key not in KEYS}
+        profile._sync()
+        return profile
+
+    def position(self, name):
+        if self._positions is None:
+            self._positions = {col: i for i, col in enumerate(self.columns)}
+        return self._positions[name]
+
+    def column(self, name):
+        return ColumnProfile(self, self.position(name))
+
+    def head_values(self, columns):
+        """{column: [values of the head rows]} for a few columns."""
+        return {col: self.head[col].tolist() for col in columns if col in self.head.columns}
+
+    def _view(self, key):
+        if key not in self._views:
+            if key == "null_counts":
+                self._views[key] = dict(zip(self.columns, self.nulls.tolist()))
+            elif key == "stats":
+                self._views[key] = {col: ColumnProfile(self, i).stats() for i, col in enumerate(self.columns)
+                                    if self.dtypes[i] is not None}
+            else:
+                self._views[key] = self.head.to_dict() if len(self.head.columns) else {}
+            dict.__setitem__(self, key, self._views[key])
+        return self._views[key]
+
+    def __getitem__(self, key):
+        if key == "columns":
+            return self.columns
+        if key == "row_count":
+            return self.row_count
+        if key in ("null_counts", "stats", "head"):
+            return self._view(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key == "row_count":
+            self.row_count = value
+        elif key == "null_counts":
+            self.nulls = np.array([value.get(col, 0) for col in self.columns], dtype=np.int64)
+            self._changed()
+        elif key in KEYS:
+            raise TypeError(f"'{key}' of a TableProfile cannot be replaced, use its methods")
+        else:
+            self.extra[key] = value
+        self._sync()
+
+    def __delitem__(self, key):
+        if key in KEYS:
+            raise TypeError(f"'{key}' of a TableProfile cannot be removed")
+        del self.extra[key]
+        self._sync()
+
+    def __iter__(self):
+        return iter((*KEYS, *self.extra))
+
+    def __len__(self):
+        return len(KEYS) + len(self.extra)
+
+    def __contains__(self, key):
+        return key in KEYS or key in self.extra
+
+    def __eq__(self, other):
+        return isinstance(other, Mapping) and dict(self.items()) == dict(other.items())
+
+    __hash__ = None
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def copy(self):
+        return self.to_dict()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def to_dict(self):
+        """plain nested dicts, like get_metadata used to return."""
+        return {
+            "columns": list(self.columns),
+            "null_counts": dict(self._view("null_counts")),
+            "head": self._view("head"),
+            "row_count": self.row_count,
+            "stats": {col: dict(stat) for col, stat in self._view("stats").items()},
+            **self.extra,
+        }
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        # the dict views are rebuilt on demand, do not ship them to other processes
+        state = dict(self.__dict__)
+        state["_views"], state["_positions"] = {}, None
+        return _empty_profile, (), state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sync()
+
+
+def _empty_profile():
+    return TableProfile.__new__(TableProfile)
+
+
+def as_profile(metadata):
+    """a TableProfile for either a profile or an old style metadata dict."""
+    return metadata if isinstance(metadata, TableProfile) else TableProfile.from_dict(metadata or {})
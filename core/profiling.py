@@ -0,0 +1,136 @@
+"""
+per-stage timing for an audit.
+
+    profiler = StageProfiler()
+    with profiler.stage("read_csv") as rec:
+        df = pd.read_csv(path)
+        rec["rows"] = len(df)
+    profiler.write("profile.json")            # plain json
+    profiler.write("profile.trace.json", "chrome")  # open in chrome://tracing or perfetto
+
+each stage records wall time, cpu time, peak rss (of the whole process so
+far) and rss growth, rows per second if rows were set, and bytes read
+(from /proc/self/io on linux, or whatever the caller sets). hooks get every
+finished stage record, e.g. for the scheduler to collect metrics.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# hooks called with every finished stage record, from any profiler
+HOOKS = []
+
+
+def add_hook(hook):
+    HOOKS.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in HOOKS:
+        HOOKS.remove(hook)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def bytes_read_so_far():
+    """bytes this process has read through read() calls, or None where unknown."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class StageProfiler:
+    def __init__(self, hooks=None):
+        self.hooks = list(hooks or [])
+        self.stages = []
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """time a block. set rec["rows"] / rec["bytes_read"] inside it if you know them."""
+        rec = {"stage": name, **fields}
+        rss_before = current_rss_mb()
+        read_before = bytes_read_so_far()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield rec
+        finally:
+            rec["start_s"] = round(wall - self.started, 6)
+            rec["wall_s"] = round(time.perf_counter() - wall, 6)
+            rec["cpu_s"] = round(time.process_time() - cpu, 6)
+            rec["peak_rss_mb"] = peak_rss_mb()
+            rss_after = current_rss_mb()
+            rec["rss_growth_mb"] = round(rss_after - rss_before, 2) if rss_after is not None and rss_before is not None else None
+            if "bytes_read" not in rec:
+                read_after = bytes_read_so_far()
+                rec["bytes_read"] = read_after - read_before if read_after is not None and read_before is not None else None
+            rows = rec.get("rows")
+            rec["rows_per_s"] = round(rows / rec["wall_s"]) if rows and rec["wall_s"] else None
+            with self.lock:
+                self.stages.append(rec)
+            for hook in self.hooks + HOOKS:
+                hook(rec)
+
+    def summary(self):
+        return {
+            "stages": self.stages,
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 6),
+            "total_cpu_s": round(sum(s["cpu_s"] for s in self.stages), 6),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def chrome_trace(self):
+        """stages as chrome trace 'complete' events (microseconds)."""
+        pid = os.getpid()
+        events = []
+        for s in self.stages:
+            args = {k: v for k, v in s.items() if k not in ("stage", "start_s", "wall_s")}
+            events.append({
+                "name": s["stage"], "cat": "audit", "ph": "X", "pid": pid, "tid": 0,
+                "ts": round(s["start_s"] * 1e6), "dur": round(s["wall_s"] * 1e6), "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path, fmt="json"):
+        data = self.chrome_trace() if fmt == "chrome" else self.summary()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+        return path
+
+
+def stage(profiler, name, **fields):
+    """profiler.stage(...) if there is a profiler, else a do-nothing block."""
+    if profiler is None:
+        return nullcontext({})
+    return profiler.stage(name, **fields)
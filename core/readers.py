@@ -0,0 +1,180 @@
+"""
+file format detection and readers.
+
+csv goes through pandas, with the delimiter from csv_separator (tab for
+.tsv, otherwise sniffed from the header line). parquet, arrow ipc and feather go through pyarrow
+(optional dependency): files are memory mapped, only the requested columns
+are decoded, and parquet footers give row counts, null counts and min/max
+per column without reading any data pages.
+"""
+
+import os
+
+import pandas as pd
+
+CSV, PARQUET, ARROW, FEATHER = "csv", "parquet", "arrow", "feather"
+COLUMNAR = (PARQUET, ARROW, FEATHER)
+
+EXTENSIONS = {
+    ".csv": CSV, ".tsv": CSV, ".txt": CSV,
+    ".parquet": PARQUET, ".pq": PARQUET,
+    ".arrow": ARROW, ".ipc": ARROW,
+    ".feather": FEATHER,
+}
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".zip", ".xz", ".zst")
+SEPARATORS = (",", "\t", ";", "|")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("reading parquet/arrow/feather needs pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def _plain_name(path):
+    """lowercase path without a compression suffix."""
+    name = path.lower()
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def is_compressed(path):
+    """true for .gz / .bz2 / .zip / .xz / .zst files, whose bytes cannot be split or seeked into."""
+    return _plain_name(path) != path.lower()
+
+
+def csv_separator(path):
+    """
+    delimiter of a csv-like file: tab for .tsv, otherwise whichever of
+    SEPARATORS the header line has most of (comma if none, or if the file
+    is compressed and cannot be peeked at cheaply).
+    """
+    name = _plain_name(path)
+    if name.endswith(".tsv"):
+        return "\t"
+    if is_compressed(path):
+        return ","
+    try:
+        with open(path, "rb") as f:
+            header = f.readline(64 * 1024).decode("utf-8", "replace")
+    except OSError:
+        return ","
+    best = max(SEPARATORS, key=header.count)
+    return best if header.count(best) else ","
+
+
+def detect_format(path):
+    """guess the format from the extension, then from the magic bytes."""
+    ext = os.path.splitext(_plain_name(path))[1]
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext]
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic[:4] == b"PAR1":
+        return PARQUET
+    if magic == b"ARROW1":
+        return ARROW
+    return CSV
+
+
+def read_frame(path, columns=None, fmt=None):
+    """read a whole file into a dataframe, decoding only `columns` if given."""
+    fmt = fmt or detect_format(path)
+    if fmt == CSV:
+        return pd.read_csv(path, usecols=columns, sep=csv_separator(path))
+    pa = _pyarrow()
+    if fmt == PARQUET:
+        table = pa.parquet.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pa.feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def iter_frames(path, chunksize, columns=None, fmt=None):
+    """yield dataframes of about `chunksize` rows. row index keeps counting across chunks."""
+    fmt = fmt or detect_format(path)
+    if fmt == CSV:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns, sep=csv_separator(path))
+        return
+    pa = _pyarrow()
+    start = 0
+    if fmt == PARQUET:
+        batches = pa.parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        if columns:
+            batches = (batch.select(columns) for batch in batches)
+    for batch in batches:
+        # arrow batches can be any size, re-slice so chunks stay bounded
+        for offset in range(0, batch.num_rows, chunksize):
+            df = batch.slice(offset, chunksize).to_pandas()
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+
+
+def write_frame(df, path, fmt):
+    """write a dataframe back out in the given format."""
+    if fmt == CSV:
+        df.to_csv(path, index=False, sep="\t" if _plain_name(path).endswith(".tsv") else ",")
+        return path
+    pa = _pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == PARQUET:
+        pa.parquet.write_table(table, path)
+    else:
+        pa.feather.write_feather(table, path)
+    return path
+
+
+def read_columns(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    if fmt == CSV:
+        return list(pd.read_csv(path, nrows=0, sep=csv_separator(path)).columns)
+    pa = _pyarrow()
+    if fmt == PARQUET:
+        return list(pa.parquet.read_schema(path, memory_map=True).names)
+    return list(pa.ipc.open_file(pa.memory_map(path, "r")).schema.names)
+
+
+def parquet_footer_stats(path):
+    """
+    row count and per-column null counts / min / max from the parquet footer.
+    returns {"row_count": n, "columns": {name: {"dtype", "nulls", "min", "max"}}}.
+    nulls is None for a column if any row group has no null_count statistic.
+    """
+    pa = _pyarrow()
+    meta = pa.parquet.ParquetFile(path, memory_map=True).metadata
+    schema = meta.schema.to_arrow_schema()
+    columns = {}
+    for i, field in enumerate(schema):
+        try:
+            dtype = str(pd.Series([], dtype=field.type.to_pandas_dtype()).dtype)
+        except (NotImplementedError, TypeError):
+            dtype = "object"
+        columns[field.name] = {"dtype": dtype, "nulls": 0, "min": None, "max": None}
+    numeric = {name for name, col in columns.items() if pd.api.types.is_numeric_dtype(col["dtype"])}
+    for rg in range(meta.num_row_groups):
+        group = meta.row_group(rg)
+        for i in range(group.num_columns):
+            chunk = group.column(i)
+            name = chunk.path_in_schema
+            if name not in columns:
+                continue  # nested column, not a top-level field
+            col = columns[name]
+            stats = chunk.statistics
+            if stats is None or not getattr(stats, "has_null_count", True) or stats.null_count is None:
+                col["nulls"] = None
+            elif col["nulls"] is not None:
+                col["nulls"] += stats.null_count
+            if name in numeric and stats is not None and stats.has_min_max:
+                col["min"] = stats.min if col["min"] is None else min(col["min"], stats.min)
+                col["max"] = stats.max if col["max"] is None else max(col["max"], stats.max)
+    return {"row_count": meta.num_rows, "columns": columns}
@@ -0,0 +1,484 @@
+"""
+rule engine for the audit trail.
+
+each rule looks at a whole chunk at once and returns a boolean mask per
+column (true = problem row). the engine sums the masks, keeps a few example
+rows, times every rule, and turns the totals into audit_trail items.
+chunks can be fed one by one, and two engines can be merged.
+
+the email / date / phone / id rules check the columns core/semantic.py
+finds on the head of the file (by name or by content), so a column called
+"contact" full of emails is checked too.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from core.duplicates import DuplicateFinder, FingerprintIndex
+from core.fixes import fill_with_mode
+from core.profile import as_profile
+from core.semantic import detect_types, invalid_mask, words as _words
+
+EXAMPLE_ROWS = 5
+
+# column name words -> (lowest ok value, highest ok value)
+NUMERIC_BOUNDS = {
+    ("age",): (0, 120),
+    ("salary", "spend", "price", "amount", "cost", "revenue", "quantity", "qty"): (0, None),
+}
+KEY_WORDS = {"id", "key", "uuid", "email"}
+# not registered rules: whole-row duplicates come from core/duplicates.py,
+# statistical outliers from core/outliers.py
+DUPLICATE_ROWS = "duplicate_rows"
+OUTLIERS = "outliers"
+
+RULES = {}
+
+
+def register_rule(cls):
+    """add a rule class to the registry (usable as a decorator)."""
+    RULES[cls.name] = cls
+    return cls
+
+
+class Rule:
+    name = ""
+
+    def check(self, df):
+        """return a boolean dataframe (or dict of column -> mask) of bad cells."""
+        raise NotImplementedError
+
+    def finding(self, col, count, rows):
+        raise NotImplementedError
+
+    def merge(self, other, offset=0):
+        """fold in another copy of this rule; return extra counts per column."""
+        # rules with state across chunks override this
+        return {}
+
+    def finish(self):
+        """{column: (count, example rows)} only known once every chunk is in."""
+        return {}
+
+    def share_memory(self, share):
+        """rules with a memory cap use 1/share of it (one of several workers)."""
+
+
+@register_rule
+class MissingValues(Rule):
+    name = "missing_values"
+
+    def check(self, df):
+        return df.isna()
+
+    def finding(self, col, count, rows):
+        return {
+            'description': f"Column '{col}' has {count} missing values.",
+            'suggested_fix': f"Fill or drop missing values in '{col}'",
+            'fix': {'action': 'fill', 'column': col, 'strategy': 'mode'},
+            'fix_function': lambda df, c=col: fill_with_mode(df, c),
+        }
+
+
+@register_rule
+class ImpossibleNumbers(Rule):
+    name = "impossible_numbers"
+
+    def check(self, df):
+        masks = {}
+        for col in df.columns:
+            bounds = _bounds_for(col)
+            if bounds is None:
+                continue
+            values = pd.to_numeric(df[col], errors="coerce")
+            lo, hi = bounds
+            bad = values < lo if lo is not None else pd.Series(False, index=df.index)
+            if hi is not None:
+                bad |= values > hi
+            masks[col] = bad
+        return masks
+
+    def finding(self, col, count, rows):
+        lo, hi = _bounds_for(col)
+        allowed = f"between {lo} and {hi}" if hi is not None else f"at least {lo}"
+        return {
+            'description': f"Column '{col}' has {count} impossible values (should be {allowed}){_rows_note(rows)}.",
+            'suggested_fix': f"Check the source of '{col}' or set those values to missing",
+        }
+
+
+class SemanticRule(Rule):
+    """invalid values in the columns of one semantic type (core/semantic.py)."""
+    semantic = ""
+
+    def __init__(self):
+        # {column: type}, set by the engine so all semantic rules share one detection
+        self.types = None
+        # a few distinct bad values per column, for the finding
+        self.offenders = {}
+
+    def check(self, df):
+        if self.types is None:
+            self.types = detect_types(df)
+        masks = {}
+        for col, kind in self.types.items():
+            if kind["type"] != self.semantic or col not in df.columns:
+                continue
+            bad = invalid_mask(df[col], kind)
+            masks[col] = bad
+            seen = self.offenders.setdefault(col, [])
+            if len(seen) < EXAMPLE_ROWS and bad.any():
+                values = df[col][bad.to_numpy()].drop_duplicates().head(EXAMPLE_ROWS).astype(str).tolist()
+                seen.extend([v for v in values if v not in seen][:EXAMPLE_ROWS - len(seen)])
+        return masks
+
+    def merge(self, other, offset=0):
+        if self.types is None:
+            self.types = other.types
+        for col, values in other.offenders.items():
+            seen = self.offenders.setdefault(col, [])
+            seen.extend([v for v in values if v not in seen][:EXAMPLE_ROWS - len(seen)])
+        return {}
+
+    def _finding(self, col, description, fix):
+        values = self.offenders.get(col, [])
+        shown = f" ({', '.join(repr(v) for v in values)})" if values else ""
+        return {
+            'description': description.rstrip(".") + shown + ".",
+            'suggested_fix': fix,
+            'semantic_type': self.semantic,
+            'examples': values,
+        }
+
+
+@register_rule
+class InvalidEmails(SemanticRule):
+    name = "invalid_emails"
+    semantic = "email"
+
+    def finding(self, col, count, rows):
+        return self._finding(col, f"Column '{col}' has {count} invalid email addresses{_rows_note(rows)}.",
+                             f"Correct or remove the malformed values in '{col}'")
+
+
+@register_rule
+class ImpossibleDates(SemanticRule):
+    name = "impossible_dates"
+    semantic = "date"
+
+    def finding(self, col, count, rows):
+        return self._finding(col, f"Column '{col}' has {count} impossible or unreadable dates{_rows_note(rows)}.",
+                             f"Fix the dates in '{col}' (check day/month ranges)")
+
+
+@register_rule
+class InvalidPhones(SemanticRule):
+    name = "invalid_phones"
+    semantic = "phone"
+
+    def finding(self, col, count, rows):
+        return self._finding(col, f"Column '{col}' has {count} invalid phone numbers{_rows_note(rows)}.",
+                             f"Check the phone numbers in '{col}' (7 to 15 digits, +, spaces, dashes, brackets)")
+
+
+@register_rule
+class InvalidIds(SemanticRule):
+    name = "invalid_ids"
+    semantic = "id"
+
+    def finding(self, col, count, rows):
+        return self._finding(col, f"Column '{col}' has {count} ids that do not match the usual format{_rows_note(rows)}.",
+                             f"Check the odd ids in '{col}' (typos, placeholders or a second id scheme)")
+
+
+@register_rule
+class DuplicateKeys(Rule):
+    """
+    repeated values in id-like columns (ids, keys, emails), across chunks.
+    every key column gets a core.duplicates.DuplicateFinder, so the memory
+    is capped (config.DUPLICATE_MEMORY_MB shared by the columns) and spills
+    to disk. the counts are only known at the end (finish).
+
+    for incremental runs (core/checkpoint.py) keep_index moves the key
+    fingerprints to FingerprintIndex files and keeps just the counts, so the
+    pickled rule stays small; rows added later are checked against the files.
+    """
+    name = "duplicate_keys"
+
+    def __init__(self, memory_mb=None):
+        self.memory_mb = config.DUPLICATE_MEMORY_MB if memory_mb is None else memory_mb
+        self.finders = None
+        # columns the engine's own DuplicateFinder already checks (--dup-keys)
+        self.skip = set()
+        # {column: FingerprintIndex} of the rows before the finders' rows,
+        # and {column: (count, example rows)} found in those rows
+        self.seen = {}
+        self.prior = {}
+
+    def share_memory(self, share):
+        self.memory_mb /= share
+
+    def _finder(self, col, columns):
+        return DuplicateFinder([col], memory_mb=self.memory_mb / max(columns, 1))
+
+    def check(self, df):
+        if self.finders is None:
+            keys = [col for col in df.columns if _words(col) & KEY_WORDS and col not in self.skip]
+            self.finders = {col: self._finder(col, len(keys)) for col in keys}
+        for finder in self.finders.values():
+            finder.update(df)
+        return {}
+
+    def merge(self, other, offset=0):
+        if self.finders is None:
+            self.finders = {}
+        # only the first part merged in (the checkpoint) has these
+        self.seen.update(other.seen)
+        self.prior.update(other.prior)
+        theirs = other.finders or {}
+        for col, finder in theirs.items():
+            if col not in self.finders:
+                self.finders[col] = self._finder(col, len(theirs))
+            self.finders[col].merge(finder, offset)
+        return {}
+
+    def finish(self, distinct=False):
+        found = dict(self.prior)
+        for col, finder in (self.finders or {}).items():
+            done = finder.finish(self.seen.get(col), distinct)
+            count, rows = found.get(col, (0, []))
+            found[col] = (count + done["duplicates"], sorted(rows + done["examples"])[:EXAMPLE_ROWS])
+        return found
+
+    def keep_index(self, folder):
+        """
+        finish, add the fingerprints of the finders' rows to the indexes in
+        folder and drop the finders: only counts and file names are left.
+        returns the indexes.
+        """
+        found = self.finish(distinct=True)
+        for col, finder in (self.finders or {}).items():
+            seen = self.seen.get(col, FingerprintIndex(folder))
+            self.seen[col] = seen.add(finder.done["distinct"])
+        self.prior, self.finders = found, {}
+        return list(self.seen.values())
+
+    def finding(self, col, count, rows):
+        return {
+            'description': f"Column '{col}' has {count} duplicate values{_rows_note(rows)}.",
+            'suggested_fix': f"Remove or merge the duplicated records in '{col}'",
+        }
+
+
+def _rows_note(rows):
+    return f", e.g. rows {rows}" if rows else ""
+
+
+def _bounds_for(col):
+    words = _words(col)
+    for names, bounds in NUMERIC_BOUNDS.items():
+        if words.intersection(names):
+            return bounds
+    return None
+
+
+class RuleEngine:
+    """runs every registered rule over chunks and builds the audit_trail."""
+
+    def __init__(self, rules=None, duplicates=None, outliers=None, types=None, memory_share=1):
+        names = list(rules) if rules is not None else list(RULES)
+        self.rules = [RULES[name]() for name in names]
+        for rule in self.rules:
+            if memory_share != 1:
+                rule.share_memory(memory_share)
+            if isinstance(rule, DuplicateKeys) and duplicates is not None and len(duplicates.keys or []) == 1:
+                # a key the duplicate check already covers is not counted twice
+                rule.skip = set(duplicates.keys)
+        self.counts = {rule.name: {} for rule in self.rules}
+        self.examples = {rule.name: {} for rule in self.rules}
+        self.timings = {rule.name: 0.0 for rule in self.rules}
+        self.columns = []
+        # semantic types of the columns (core/semantic.py). pass the types of the
+        # file head when the file is split up, so every part is checked alike;
+        # otherwise they are found on the first chunk
+        self.types = None
+        if types is not None:
+            self.set_types(types)
+        # a core.duplicates.DuplicateFinder for whole-row (or key) duplicates
+        self.duplicates = duplicates
+        if duplicates is not None:
+            self.timings[DUPLICATE_ROWS] = 0.0
+        # a core.outliers.OutlierDetector
+        self.outliers = outliers
+        if outliers is not None:
+            self.timings[OUTLIERS] = 0.0
+
+    def update(self, df):
+        if not self.columns:
+            self.columns = list(df.columns)
+        if self.types is None and any(isinstance(rule, SemanticRule) for rule in self.rules):
+            self.set_types(detect_types(df))
+        for rule in self.rules:
+            start = time.perf_counter()
+            masks = rule.check(df)
+            if isinstance(masks, pd.DataFrame):
+                totals = masks.sum()
+            else:
+                totals = pd.Series({col: mask.sum() for col, mask in masks.items()}, dtype="int64")
+            counts, examples = self.counts[rule.name], self.examples[rule.name]
+            for col, total in totals[totals > 0].items():
+                counts[col] = counts.get(col, 0) + int(total)
+                rows = examples.setdefault(col, [])
+                if len(rows) < EXAMPLE_ROWS:
+                    rows.extend(df.index[masks[col].to_numpy()][:EXAMPLE_ROWS - len(rows)].tolist())
+            self.timings[rule.name] += time.perf_counter() - start
+        if self.duplicates is not None:
+            start = time.perf_counter()
+            self.duplicates.update(df)
+            self.timings[DUPLICATE_ROWS] += time.perf_counter() - start
+        if self.outliers is not None:
+            start = time.perf_counter()
+            self.outliers.update(df)
+            self.timings[OUTLIERS] += time.perf_counter() - start
+        return self
+
+    def set_types(self, types):
+        """check every chunk against these semantic types ({column: type})."""
+        self.types = types
+        for rule in self.rules:
+            if isinstance(rule, SemanticRule):
+                rule.types = types
+        return self
+
+    def merge(self, other, offset=0):
+        """fold another engine in. offset shifts its row numbers (for file ranges)."""
+        if not self.columns:
+            self.columns = list(other.columns)
+        if self.types is None and other.types is not None:
+            self.set_types(other.types)
+        for mine, theirs in zip(self.rules, other.rules):
+            counts, examples = self.counts[mine.name], self.examples[mine.name]
+            for col, total in other.counts[mine.name].items():
+                counts[col] = counts.get(col, 0) + total
+                rows = examples.setdefault(col, [])
+                rows.extend(r + offset for r in other.examples[mine.name][col][:EXAMPLE_ROWS - len(rows)])
+            for col, total in mine.merge(theirs, offset).items():
+                if total:
+                    counts[col] = counts.get(col, 0) + total
+            self.timings[mine.name] += other.timings[theirs.name]
+        if self.duplicates is not None and other.duplicates is not None:
+            start = time.perf_counter()
+            self.duplicates.merge(other.duplicates, offset)
+            self.timings[DUPLICATE_ROWS] += other.timings[DUPLICATE_ROWS] + time.perf_counter() - start
+        if self.outliers is not None and other.outliers is not None:
+            start = time.perf_counter()
+            self.outliers.merge(other.outliers, offset)
+            self.timings[OUTLIERS] += other.timings[OUTLIERS] + time.perf_counter() - start
+        return self
+
+    def add_count(self, rule_name, col, count):
+        """record a count worked out elsewhere, e.g. parquet footer null counts."""
+        if col not in self.columns:
+            self.columns.append(col)
+        if rule_name in self.counts and count:
+            self.counts[rule_name][col] = self.counts[rule_name].get(col, 0) + int(count)
+        return self
+
+    def audit_trail(self):
+        trail = []
+        for rule in self.rules:
+            counts, examples = dict(self.counts[rule.name]), dict(self.examples[rule.name])
+            start = time.perf_counter()
+            for col, (count, rows) in rule.finish().items():
+                if count:
+                    counts[col] = counts.get(col, 0) + count
+                    examples[col] = sorted(examples.get(col, []) + rows)[:EXAMPLE_ROWS]
+            self.timings[rule.name] += time.perf_counter() - start
+            for col in self.columns:
+                if counts.get(col):
+                    item = rule.finding(col, counts[col], examples.get(col, []))
+                    item.update(rule=rule.name, column=col, count=counts[col])
+                    trail.append(item)
+        if self.duplicates is not None:
+            start = time.perf_counter()
+            found = self.duplicates.finish()
+            self.timings[DUPLICATE_ROWS] += time.perf_counter() - start
+            if found["duplicates"]:
+                trail.append(duplicate_finding(found))
+        if self.outliers is not None:
+            start = time.perf_counter()
+            found = self.outliers.finish()
+            self.timings[OUTLIERS] += time.perf_counter() - start
+            for col in self.columns:
+                if col in found:
+                    trail.append(outlier_finding(col, found[col], self.outliers))
+        return trail
+
+
+def duplicate_finding(found):
+    """audit_trail item for a DuplicateFinder result."""
+    keys = found["keys"]
+    what = f"key ({', '.join(keys)})" if keys else "row"
+    return {
+        'description': f"{found['duplicates']} rows repeat an earlier {what} "
+                       f"({found['groups']} distinct values repeated){_rows_note(found['examples'])}.",
+        'suggested_fix': "Drop the repeated rows or merge them with the first one",
+        'rule': DUPLICATE_ROWS,
+        'column': keys[0] if keys and len(keys) == 1 else None,
+        'columns': keys,
+        'count': found['duplicates'],
+    }
+
+
+def outlier_finding(col, found, detector):
+    """audit_trail item for one column of an OutlierDetector result."""
+    if detector.method == "mad":
+        how = f"robust z-score over {detector.threshold:g}"
+    else:
+        how = f"more than {detector.threshold:g} × iqr past the quartiles"
+    count = f"about {found['count']}" if found["approximate"] else str(found["count"])
+    if detector.group_by:
+        top = sorted(found["groups"].items(), key=lambda kv: -kv[1])[:3]
+        where = f" within their {detector.group_by} group ({how}), most in " + ", ".join(f"{g} ({n})" for g, n in top)
+    elif found["low"] is not None:
+        where = f" (outside {found['low']:.4g} to {found['high']:.4g}, {how})"
+    else:
+        where = f" ({how})"
+    return {
+        'description': f"Column '{col}' has {count} outliers{where}{_rows_note(found['rows'])}.",
+        'suggested_fix': f"Check the extreme values in '{col}' (typos, wrong units or test data)",
+        'rule': OUTLIERS,
+        'column': col,
+        'count': found['count'],
+        'group_by': detector.group_by,
+        'groups': found['groups'],
+    }
+
+
+def rules_summary(audit_trail):
+    """one-line text summary of the findings, used when there is no ai summary."""
+    if not audit_trail:
+        return "rule-based findings: no issues found."
+    return "rule-based findings: " + "; ".join(item["description"] for item in audit_trail)
+
+
+def run_rules(df, rules=None):
+    """one-shot helper: (audit_trail, timings) for a whole dataframe."""
+    engine = RuleEngine(rules).update(df)
+    return engine.audit_trail(), engine.timings
+
+
+def metadata_findings(metadata):
+    """missing-value findings straight from get_metadata output (no data needed)."""
+    profile = as_profile(metadata)
+    rule = MissingValues()
+    trail = []
+    for i in np.flatnonzero(profile.nulls > 0):
+        col, count = profile.columns[i], profile.nulls[i]
+        item = rule.finding(col, int(count), [])
+        item.update(rule=rule.name, column=col, count=int(count))
+        trail.append(item)
+    return trail
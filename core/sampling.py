@@ -0,0 +1,276 @@
+"""
+sampling mode: audit a random sample of a huge file and report rates with
+confidence intervals instead of exact counts.
+
+two ways to draw the sample:
+- reservoir: one pass over the file. every row gets a random key and the
+  rows with the smallest keys are kept, so every row is equally likely to
+  be picked. the whole file is read (and the row count is exact), but only
+  the sample is profiled and checked.
+- blocks: seek to random offsets (one in each equal slice of the file) and
+  read a run of rows at each. only those blocks are read, so it takes
+  seconds whatever the file size. rows next to each other tend to be alike,
+  so the intervals are widened by how much the blocks disagree (cluster
+  sampling). for csv the row count is estimated from the bytes per row and
+  there are no row numbers; parquet / arrow pick random row groups /
+  batches and stay exact. compressed csv cannot seek and uses reservoir.
+
+rates get wilson score intervals, with a finite population correction when
+the sample is a big share of the file.
+
+    frames, info = draw_sample("big.csv", rows=50_000, mode="blocks")
+    estimate = SampleEstimate(frames, info)
+    estimate.audit_trail()   # items with an estimated count, rate, rate_low, rate_high
+"""
+
+import io
+import math
+import os
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import config
+from core.data_processor import DEFAULT_CHUNKSIZE, get_metadata
+from core.readers import (ARROW, CSV, FEATHER, PARQUET, _pyarrow, csv_separator, detect_format, iter_frames,
+                          read_columns)
+from core.rules import RULES, RuleEngine
+from core.semantic import detect_types
+
+MODES = ("reservoir", "blocks")
+# a repeat only shows up if both rows are in the sample, so these counts do not scale
+UNSCALED_RULES = ("duplicate_keys",)
+
+
+def wilson_interval(rate, n, confidence=None, population=None):
+    """
+    (low, high) for a rate seen in a sample of n rows (n can be an effective,
+    fractional size). population = rows in the whole file, if known.
+    """
+    if n <= 0:
+        return 0.0, 1.0
+    if population and n >= population:
+        return rate, rate
+    if population and population > 1:
+        # finite population correction: a sample of most of the file is worth more
+        n = n * (population - 1) / (population - n)
+    z = NormalDist().inv_cdf(0.5 + (confidence or config.SAMPLE_CONFIDENCE) / 2)
+    z2 = z * z
+    center = (rate + z2 / (2 * n)) / (1 + z2 / n)
+    half = z * math.sqrt(rate * (1 - rate) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def effective_size(hits, sizes):
+    """sample size after the design effect of block sampling (hits and rows per block)."""
+    hits, sizes = np.asarray(hits, dtype="float64"), np.asarray(sizes, dtype="float64")
+    n, k = sizes.sum(), len(sizes)
+    rate = hits.sum() / n if n else 0.0
+    if k < 2 or rate in (0.0, 1.0):
+        return float(n)
+    # variance of a ratio estimate over k clusters
+    var = ((hits - rate * sizes) ** 2).sum() / (k * (k - 1) * (n / k) ** 2)
+    if var <= 0:
+        return float(n)
+    return float(min(n, max(1.0, rate * (1 - rate) / var)))
+
+
+def reservoir_sample(path, rows, chunksize=None, seed=None, columns=None, fmt=None):
+    """(sample in file order, total rows). one pass, at most rows + one chunk in memory."""
+    rng = np.random.default_rng(seed)
+    kept, keys, total = None, np.empty(0), 0
+    for chunk in iter_frames(path, chunksize or DEFAULT_CHUNKSIZE, columns=columns, fmt=fmt):
+        total += len(chunk)
+        chunk_keys = rng.random(len(chunk))
+        if len(keys) >= rows:
+            # only rows with a smaller key than the largest kept one can get in
+            low = chunk_keys < keys.max()
+            chunk, chunk_keys = chunk[low], chunk_keys[low]
+            if not len(chunk):
+                continue
+        kept = chunk if kept is None else pd.concat([kept, chunk])
+        keys = np.concatenate([keys, chunk_keys])
+        if len(keys) > rows:
+            best = np.argpartition(keys, rows - 1)[:rows]
+            kept, keys = kept.iloc[best], keys[best]
+    if kept is None:
+        names = read_columns(path, fmt)
+        return pd.DataFrame(columns=[c for c in names if not columns or c in columns]), 0
+    return kept.sort_index(), total
+
+
+def _csv_blocks(path, rows, blocks, rng, columns):
+    """
+    random runs of lines from a plain csv: (frames, total rows, exact).
+    the total is estimated from the bytes per row, unless the blocks ran into
+    each other and covered the whole file (a small file).
+    """
+    size = os.path.getsize(path)
+    sep = csv_separator(path)
+    frames, rows_read, bytes_read = [], 0, 0
+    whole = True
+    per_block = -(-rows // blocks)
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = f.tell()
+        span = (size - start) / blocks
+        last_end = start
+        for i in range(blocks):
+            offset = max(int(start + (i + rng.random()) * span), last_end)
+            if offset >= size:
+                break
+            whole = whole and offset == last_end
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                f.readline()  # landed mid line, start at the next one
+            lines = []
+            for _ in range(per_block):
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+            last_end = f.tell()
+            if not lines:
+                continue
+            data = b"".join(lines)
+            try:
+                df = pd.read_csv(io.BytesIO(header + data), usecols=columns, sep=sep)
+            except (pd.errors.ParserError, UnicodeDecodeError):
+                # a quoted field with a line break can cut a block badly, skip it
+                whole = False
+                continue
+            df.index = pd.RangeIndex(rows_read, rows_read + len(df))
+            frames.append(df)
+            rows_read += len(df)
+            bytes_read += len(data)
+    if whole and last_end >= size:
+        return frames, rows_read, True
+    total = round((size - start) * rows_read / bytes_read) if bytes_read else 0
+    return frames, total, False
+
+
+def _columnar_blocks(path, rows, blocks, rng, columns, fmt):
+    """random slices of random row groups (parquet) or record batches (arrow)."""
+    pa = _pyarrow()
+    if fmt == PARQUET:
+        source = pa.parquet.ParquetFile(path, memory_map=True)
+        sizes = [source.metadata.row_group(i).num_rows for i in range(source.num_row_groups)]
+        read = lambda i: source.read_row_group(i, columns=columns)
+    else:
+        source = pa.ipc.open_file(pa.memory_map(path, "r"))
+        sizes = [source.get_batch(i).num_rows for i in range(source.num_record_batches)]
+        read = lambda i: source.get_batch(i).select(columns) if columns else source.get_batch(i)
+    if len(sizes) < 2:
+        return None, sum(sizes)
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    picked = np.sort(rng.choice(len(sizes), min(blocks, len(sizes)), replace=False))
+    per_block = -(-rows // len(picked))
+    frames = []
+    for group in picked:
+        size = sizes[group]
+        take = min(per_block, size)
+        offset = int(rng.integers(0, size - take + 1))
+        df = read(group).slice(offset, take).to_pandas()
+        df.index = pd.RangeIndex(starts[group] + offset, starts[group] + offset + len(df))
+        frames.append(df)
+    return frames, int(starts[-1])
+
+
+def draw_sample(path, rows=None, mode=None, blocks=None, seed=None, chunksize=None, columns=None):
+    """
+    returns (frames, info). frames is one dataframe for reservoir, one per block
+    for blocks. info = {"mode", "rows", "total_rows", "total_exact", "blocks",
+    "row_numbers", "seconds"}.
+    """
+    rows = rows or config.SAMPLE_ROWS
+    mode = mode or config.SAMPLE_MODE
+    if mode not in MODES:
+        raise ValueError(f"unknown sample mode {mode!r}, use one of {', '.join(MODES)}")
+    blocks = blocks or config.SAMPLE_BLOCKS
+    rng = np.random.default_rng(seed)
+    fmt = detect_format(path)
+    start = time.perf_counter()
+    frames, total, exact = None, 0, True
+    if mode == "blocks":
+        if fmt in (PARQUET, ARROW, FEATHER):
+            frames, total = _columnar_blocks(path, rows, blocks, rng, columns, fmt)
+        elif fmt == CSV and os.path.splitext(path.lower())[1] in (".csv", ".tsv", ".txt"):
+            frames, total, exact = _csv_blocks(path, rows, blocks, rng, columns)
+    if not frames:
+        # reservoir, or a file that cannot be sampled in blocks
+        mode, exact = "reservoir", True
+        sample, total = reservoir_sample(path, rows, chunksize, rng, columns, fmt)
+        frames = [sample]
+    info = {
+        "mode": mode,
+        "rows": sum(len(frame) for frame in frames),
+        "total_rows": total,
+        "total_exact": exact,
+        "blocks": len(frames) if mode == "blocks" else None,
+        "row_numbers": exact,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    return frames, info
+
+
+def sample_metadata(frames, info, confidence=None):
+    """get_metadata of the sample, with row and null counts scaled up to the whole file."""
+    metadata = get_metadata(pd.concat(frames) if len(frames) > 1 else frames[0])
+    n, total = info["rows"], info["total_rows"]
+    metadata["row_count"] = total
+    if n:
+        metadata["null_counts"] = {col: round(count / n * total) for col, count in metadata["null_counts"].items()}
+    metadata["sample"] = dict(info, confidence=confidence or config.SAMPLE_CONFIDENCE)
+    return metadata
+
+
+class SampleEstimate:
+    """
+    rule findings of a sample, scaled up to the whole file.
+    has audit_trail() and timings like a RuleEngine, so main.py can use either.
+    """
+
+    def __init__(self, frames, info, confidence=None, types=None):
+        self.info = info
+        self.confidence = confidence or config.SAMPLE_CONFIDENCE
+        names = [name for name in RULES if name not in UNSCALED_RULES]
+        # one set of semantic types for every block (pass core.semantic.file_types)
+        types = detect_types(frames[0]) if types is None else types
+        self.blocks = [RuleEngine(names, types=types).update(frame) for frame in frames]
+        self.sizes = [len(frame) for frame in frames]
+        self.engine = RuleEngine(names, types=types)
+        for engine in self.blocks:
+            self.engine.merge(engine)
+        self.timings = self.engine.timings
+        self.types = self.engine.types
+
+    def estimate(self, rule_name, col):
+        """(sample count, rate, low, high) for one rule and column."""
+        hits = [engine.counts[rule_name].get(col, 0) for engine in self.blocks]
+        n = sum(self.sizes)
+        rate = sum(hits) / n if n else 0.0
+        population = self.info["total_rows"] if self.info["total_exact"] else None
+        low, high = wilson_interval(rate, effective_size(hits, self.sizes), self.confidence, population)
+        return sum(hits), rate, low, high
+
+    def audit_trail(self):
+        trail = []
+        n, total = sum(self.sizes), self.info["total_rows"]
+        for rule in self.engine.rules:
+            counts = self.engine.counts[rule.name]
+            for col in self.engine.columns:
+                if not counts.get(col):
+                    continue
+                hits, rate, low, high = self.estimate(rule.name, col)
+                count = round(rate * total)
+                rows = self.engine.examples[rule.name].get(col, []) if self.info["row_numbers"] else []
+                item = rule.finding(col, count, rows)
+                note = (f"about {rate:.2%} of a {n:,} row sample, "
+                        f"{self.confidence:.0%} interval {low:.2%} to {high:.2%}")
+                item["description"] = f"{item['description'].rstrip('.')} ({note})."
+                item.update(rule=rule.name, column=col, count=count, estimated=True, sample_count=hits,
+                            rate=rate, rate_low=low, rate_high=high)
+                trail.append(item)
+        return trail
@@ -0,0 +1,247 @@
+"""
+async gemini scheduler for auditing many files at once.
+
+- a token bucket keeps us under the requests-per-minute limit
+- a semaphore caps how many calls are in flight
+- 429 / RESOURCE_EXHAUSTED and other transient errors are retried with
+  jittered exponential backoff, waiting at least as long as the server's
+  retry hint ("retryDelay": "12s" / "retry in 12s")
+- small files can be packed into one prompt and the answer split back up
+- a model that is slower than usual is hedged with the next candidate
+"""
+
+import asyncio
+import random
+import re
+import time
+from contextlib import nullcontext
+
+import config
+from core.cache import cache_key
+from core.hedging import HedgeFailed, hedged_call
+from core.interpreter import build_prompt, describe_error, make_client
+from core.serializer import serialize_metadata
+
+RETRY_HINT = re.compile(r"retry(?:Delay)?['\"]?\s*(?:in|:)?\s*['\"]?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+SECTION = re.compile(r"^===\s*FILE:\s*(.+?)\s*===\s*$", re.MULTILINE)
+TRANSIENT = ("RESOURCE_EXHAUSTED", "429", "UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED", "Timeout")
+
+
+class TokenBucket:
+    """allows `rate` acquisitions per second on average, with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    async def acquire(self):
+        while True:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_hint(error):
+    """seconds the server asked us to wait, or None."""
+    match = RETRY_HINT.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def is_transient(error):
+    msg = f"{type(error).__name__} {error}"
+    return any(mark in msg for mark in TRANSIENT)
+
+
+class AuditScheduler:
+    """
+    generate: async (model_name, prompt) -> text, e.g. gemini_generate(api_key).
+    run() takes {name: metadata} and returns {name: summary}; a file whose
+    calls all failed gets an "ai summary unavailable" line with the reasons.
+    """
+
+    def __init__(self, generate, models=None, concurrency=None, requests_per_minute=None,
+                 max_retries=None, base_delay=1.0, max_delay=60.0, pack_max_chars=0,
+                 pack_max_files=20, cache=None, rng=None):
+        self.generate = generate
+        self.models = models or config.get_model_candidates()
+        self.semaphore = asyncio.Semaphore(concurrency or config.SCHEDULER_CONCURRENCY)
+        rpm = requests_per_minute or config.SCHEDULER_REQUESTS_PER_MINUTE
+        self.bucket = TokenBucket(rpm / 60.0, burst=max(1, min(rpm, concurrency or config.SCHEDULER_CONCURRENCY)))
+        self.max_retries = config.SCHEDULER_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pack_max_chars = pack_max_chars
+        self.pack_max_files = pack_max_files
+        self.cache = cache
+        self.rng = rng or random.Random()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "cache_hits": 0, "packed_calls": 0}
+
+    def _backoff(self, attempt, error):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * self.rng.uniform(0.5, 1.0)
+        hint = retry_hint(error)
+        if hint is not None:
+            # never retry sooner than the server asked, plus a little jitter
+            delay = max(delay, hint * self.rng.uniform(1.0, 1.2))
+        return delay
+
+    async def call_model(self, model_name, prompt, clock=None):
+        """
+        one model with retries. raises RuntimeError with the reason it gave up.
+        clock (core.hedging.Clock) times only the request, not the waits around it.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            async with self.semaphore:
+                self.stats["calls"] += 1
+                try:
+                    with clock or nullcontext():
+                        return await self.generate(model_name, prompt)
+                except Exception as e:
+                    error = e
+            if "RESOURCE_EXHAUSTED" in str(error) or "429" in str(error):
+                self.stats["rate_limited"] += 1
+            if attempt < self.max_retries and is_transient(error):
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, error))
+                continue
+            raise RuntimeError(describe_error(model_name, error))
+
+    async def call(self, prompt):
+        """(model_name, text) from the first model that answers. raises RuntimeError with reasons."""
+        # slow models are hedged with the next candidate, see core/hedging.py. the hedge
+        # timer starts when the request is sent, not while it waits for the rate limit
+        try:
+            return await hedged_call(lambda model_name, clock: self.call_model(model_name, prompt, clock),
+                                     self.models, clocked=True)
+        except HedgeFailed as e:
+            raise RuntimeError("\n".join(str(err) for _, err in e.errors) or "no models to try")
+
+    def _cached(self, metadata):
+        if not self.cache:
+            return None
+        # one lookup per file, so the cache's hit / miss counters mean something
+        _, text = self.cache.get_first(cache_key(metadata, model_name, prompt)
+                                       for model_name in self.models for prompt in cache_prompts(metadata))
+        if text:
+            self.stats["cache_hits"] += 1
+        return text
+
+    def _store(self, metadata, model_name, prompt, text):
+        if self.cache and text:
+            self.cache.put(cache_key(metadata, model_name, prompt), text, model_name)
+
+    async def audit_one(self, name, metadata):
+        prompt = build_prompt(metadata)
+        try:
+            model_name, text = await self.call(prompt)
+        except RuntimeError as e:
+            return name, "ai summary unavailable.\nreasons:\n" + "\n".join(f"- {r}" for r in str(e).splitlines())
+        self._store(metadata, model_name, prompt, text)
+        return name, text
+
+    async def audit_pack(self, pack):
+        """one request for several small files; files missing from the answer are retried alone."""
+        files = "\n".join(f"{config.FILE_HEADING.format(name=name)}\n{serialize_metadata(metadata)[0]}\n"
+                          for name, metadata in pack)
+        self.stats["packed_calls"] += 1
+        try:
+            model_name, text = await self.call(config.BATCH_AUDIT_PROMPT.format(files=files))
+            sections = split_sections(text, [name for name, _ in pack])
+        except RuntimeError:
+            sections, model_name = {}, None
+        results = []
+        for name, metadata in pack:
+            if name in sections:
+                self._store(metadata, model_name, cache_prompts(metadata)[1], sections[name])
+                results.append((name, sections[name]))
+            else:
+                results.append(await self.audit_one(name, metadata))
+        return results
+
+    def make_packs(self, jobs):
+        """split jobs into (single jobs, packs of small jobs)."""
+        singles, packs, current, size = [], [], [], 0
+        for name, metadata in jobs.items():
+            length = len(serialize_metadata(metadata)[0])
+            if not self.pack_max_chars or length > self.pack_max_chars:
+                singles.append((name, metadata))
+                continue
+            if current and (size + length > self.pack_max_chars or len(current) >= self.pack_max_files):
+                packs.append(current)
+                current, size = [], 0
+            current.append((name, metadata))
+            size += length
+        if len(current) == 1:
+            singles.extend(current)
+        elif current:
+            packs.append(current)
+        return singles, packs
+
+    async def run(self, jobs):
+        uncached = {}
+        results = {}
+        for name, metadata in jobs.items():
+            cached = self._cached(metadata)
+            if cached:
+                results[name] = cached
+            else:
+                uncached[name] = metadata
+        singles, packs = self.make_packs(uncached)
+        tasks = [self.audit_one(name, metadata) for name, metadata in singles]
+        tasks += [self.audit_pack(pack) for pack in packs]
+        for done in await asyncio.gather(*tasks):
+            for name, text in (done if isinstance(done, list) else [done]):
+                results[name] = text
+        return {name: results[name] for name in jobs}
+
+
+def cache_prompts(metadata):
+    """
+    prompt texts a file's answer is cached under: its own prompt, and the
+    packed prompt with only this file in it (a pack's prompt depends on the
+    other files, so each section is stored as if it had been asked alone).
+    """
+    return build_prompt(metadata), config.BATCH_AUDIT_PROMPT.format(files=serialize_metadata(metadata)[0])
+
+
+def split_sections(text, names):
+    """
+    '=== FILE: name ===' headed answer -> {name: section text}. only headings
+    of the given names split the text, any other heading stays in its section.
+    """
+    names = set(names)
+    starts = [match for match in SECTION.finditer(text) if match.group(1) in names]
+    ends = [match.start() for match in starts[1:]] + [len(text)]
+    return {match.group(1): text[match.end():end].strip() for match, end in zip(starts, ends)}
+
+
+def gemini_generate(api_key):
+    """async generate function backed by one shared gemini client."""
+    client = make_client(api_key)
+
+    async def generate(model_name, prompt):
+        response = await client.aio.models.generate_content(model=model_name, contents=prompt)
+        return response.text
+
+    return generate
+
+
+def audit_many(jobs, api_key, pack=True, cache=None, **options):
+    """
+    audit {name: metadata} concurrently. returns ({name: summary}, stats).
+    pack=True packs files whose metadata is under config.PACK_MAX_CHARS.
+    """
+    async def main():
+        scheduler = AuditScheduler(
+            gemini_generate(api_key), cache=cache,
+            pack_max_chars=config.PACK_MAX_CHARS if pack else 0, **options,
+        )
+        return await scheduler.run(jobs), scheduler.stats
+    return asyncio.run(main())
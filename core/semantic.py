@@ -0,0 +1,199 @@
+"""
+semantic types: which columns hold emails, dates, phone numbers or ids, and
+which of their values are not valid ones.
+
+a column gets its type from its values: when at least
+config.SEMANTIC_MIN_SHARE of the first config.SEMANTIC_SAMPLE_ROWS non-null
+values look like one type, the column is that type. the name ("email",
+"start_date", "phone", "customer_id") only says which type to try first
+(and lets a short sample count), so an "order_date" of "01/05/2024" values
+is a slash date and an "email_opt_in" of yes/no is nothing. an id
+column gets the shape most of its sample has ("CUS-0042" -> letters, "-",
+digits, or a uuid) and a value of any other shape is invalid. a date column
+keeps the format its sample has and is parsed with it.
+
+the types are worked out once, from the head of the file (file_types), and
+handed to every chunk, worker range, appended range or sample block, so the
+result does not depend on how the file is split. every chunk is checked
+against the same types with whole-column string kernels (pyarrow
+regex when pyarrow is installed) and to_datetime(errors="coerce"), so there
+are no row loops.
+
+    types = detect_types(df)   # {"email": {"type": "email", "pattern": ...}, ...}
+    bad = invalid_mask(df["email"], types["email"])
+"""
+
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+import config
+from core.readers import iter_frames
+
+EMAIL_WORDS = {"email", "mail"}
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+DATE_WORDS = {"date", "dob", "birthday"}
+# iso dates, maybe with a time. whether the day exists is up to to_datetime
+DATE_SHAPE = r"^\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$"
+SLASH_DATE = r"^\d{1,2}/\d{1,2}/\d{4}$"
+# (shape, to_datetime format) in the order they are tried. the day / month
+# order of slash dates comes from the sample (which part is more often over 12)
+DATE_FORMATS = (
+    (DATE_SHAPE, "ISO8601"),
+    (SLASH_DATE, None),
+    (r"^\d{1,2}\.\d{1,2}\.\d{4}$", "%d.%m.%Y"),
+    (r"^\d{4}/\d{1,2}/\d{1,2}$", "%Y/%m/%d"),
+)
+PHONE_WORDS = {"phone", "tel", "telephone", "mobile", "cell", "fax"}
+# 7 to 15 digits (e.164 allows at most 15) with spaces, dots, dashes or brackets
+PHONE_PATTERN = r"^\+?[\s().\-]*(\d[\s().\-]*){7,15}$"
+# a phone number without a telling column name: digit groups with separators
+# or a leading +, so plain numbers and decimals are not taken for phones
+PHONE_SHAPE = r"^(\+|\(?\d{1,4}\)?[\s.\-])[\d\s().\-]+$"
+ID_WORDS = {"id", "uuid", "guid", "sku"}
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+# words that can give a number column a type
+NAMED_NUMBERS = PHONE_WORDS
+# checked in this order, the first that fits wins
+TYPES = ("email", "date", "id", "phone")
+
+
+@lru_cache(maxsize=None)
+def _text_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.StringDtype()
+    return pd.StringDtype("pyarrow")
+
+
+def as_text(series):
+    """series as strings (pyarrow backed if possible, so .str runs in c++)."""
+    return series if series.dtype == _text_dtype() else series.astype(_text_dtype())
+
+
+@lru_cache(maxsize=65536)
+def words(name):
+    # "Customer_ID" -> {"customer", "id"}
+    return frozenset(re.findall(r"[a-z]+", str(name).lower()))
+
+
+@lru_cache(maxsize=None)
+def _is_text(dtype):
+    return not (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)
+                or isinstance(dtype, pd.PeriodDtype) or pd.api.types.is_timedelta64_dtype(dtype))
+
+
+def _share(mask):
+    return mask.fillna(False).astype(bool).mean() if len(mask) else 0.0
+
+
+def id_pattern(sample, share=None):
+    """regex for the shape most of the sample has (runs of letters / digits), or None."""
+    share = share or config.SEMANTIC_MIN_SHARE
+    if len(sample) < config.SEMANTIC_MIN_VALUES:
+        return None
+    if _share(sample.str.match(UUID_PATTERN)) >= share:
+        return UUID_PATTERN
+    shapes = sample.str.replace(r"[A-Za-z]+", "a", regex=True).str.replace(r"\d+", "0", regex=True)
+    counts = shapes.value_counts()
+    if not len(counts) or counts.iloc[0] / len(sample) < share:
+        return None
+    parts = {"a": "[A-Za-z]+", "0": r"\d+"}
+    return "^" + "".join(parts.get(ch) or (ch if ch.isalnum() else "\\" + ch) for ch in counts.index[0]) + "$"
+
+
+def date_type(sample, share=None):
+    """{"type": "date", "pattern", "format"} for the date format most of the sample has, or None."""
+    share = share or config.SEMANTIC_MIN_SHARE
+    for pattern, fmt in DATE_FORMATS:
+        fits = sample.str.match(pattern).fillna(False).astype(bool)
+        if _share(fits) < share:
+            continue
+        if fmt is None:
+            parts = sample[fits].str.extract(r"^(\d+)/(\d+)").apply(pd.to_numeric)
+            day_first = (parts[0] > 12).sum() > (parts[1] > 12).sum()
+            fmt = "%d/%m/%Y" if day_first else "%m/%d/%Y"
+        return {"type": "date", "pattern": pattern, "format": fmt}
+    return None
+
+
+def _fit(kind, sample, share, named):
+    """{"type", "pattern"} if at least share of the sample looks like kind, else None."""
+    if kind == "date":
+        return date_type(sample, share)
+    if kind == "id":
+        # a named id column gets its own shape, otherwise only uuids count
+        pattern = id_pattern(sample, share) if named else UUID_PATTERN
+        looks_like = sample.str.match(pattern) if pattern else None
+    elif kind == "phone":
+        # without the name, plain numbers and decimals should not pass for phones
+        looks_like = sample.str.match(PHONE_PATTERN) & (True if named else sample.str.match(PHONE_SHAPE))
+        pattern = PHONE_PATTERN
+    else:
+        pattern, looks_like = EMAIL_PATTERN, sample.str.match(EMAIL_PATTERN)
+    return {"type": kind, "pattern": pattern} if looks_like is not None and _share(looks_like) >= share else None
+
+
+def infer_type(series, rows=None, share=None):
+    """{"type", "pattern"} (and "format" for dates) of one column, or None if it is none of the types."""
+    share = share or config.SEMANTIC_MIN_SHARE
+    named, dtype = words(series.name), series.dtype
+    if not _is_text(dtype):
+        # numbers can only be phone numbers, and only if the name says so
+        if named & PHONE_WORDS and pd.api.types.is_integer_dtype(dtype):
+            return {"type": "phone", "pattern": PHONE_PATTERN}
+        return None
+    head = series.head(rows or config.SEMANTIC_SAMPLE_ROWS)
+    sample = as_text(head[head.notna()])
+    # the name says which type to try first, the values still have to fit it
+    hinted = [kind for kind, vocab in (("email", EMAIL_WORDS), ("date", DATE_WORDS), ("id", ID_WORDS),
+                                       ("phone", PHONE_WORDS)) if named & vocab]
+    for kind in hinted if len(sample) else []:
+        found = _fit(kind, sample, share, named=True)
+        if found:
+            return found
+    if "id" in hinted or len(sample) < config.SEMANTIC_MIN_VALUES:
+        return None
+    for kind in TYPES:
+        found = _fit(kind, sample, share, named=False) if kind not in hinted else None
+        if found:
+            return found
+    return None
+
+
+def detect_types(df, rows=None, share=None):
+    """{column: {"type", "pattern"}} for the columns that have a semantic type."""
+    found = {}
+    for col, dtype in zip(df.columns, df.dtypes):
+        if not _is_text(dtype) and not words(col) & NAMED_NUMBERS:
+            # a number column only gets a type from its name, skip the rest quickly (wide tables)
+            continue
+        kind = infer_type(df[col], rows, share)
+        if kind:
+            found[col] = kind
+    return found
+
+
+def file_types(path, columns=None, fmt=None, rows=None):
+    """detect_types on the first rows of a file."""
+    frames = iter_frames(path, rows or config.SEMANTIC_SAMPLE_ROWS, columns=columns, fmt=fmt)
+    try:
+        head = next(frames, None)
+    finally:
+        frames.close()
+    return detect_types(head, rows) if head is not None else {}
+
+
+def invalid_mask(series, kind):
+    """boolean series, true where a non-null value is not a valid value of its type."""
+    if kind["type"] == "date":
+        parsed = pd.to_datetime(series, errors="coerce", format=kind.get("format", "ISO8601"))
+        return (series.notna() & parsed.isna()).astype(bool)
+    if kind["type"] == "phone" and pd.api.types.is_integer_dtype(series.dtype):
+        # phone numbers read as integers: just count the digits, no strings
+        return (series.notna() & ~series.between(10 ** 6, 10 ** 15 - 1)).astype(bool)
+    values = as_text(series)
+    ok = values.str.match(kind["pattern"])
+    return (values.notna() & ~ok.fillna(False).astype(bool)).astype(bool)
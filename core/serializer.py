@@ -0,0 +1,125 @@
+"""
+compact, token-budgeted text form of the metadata for the gemini prompt.
+
+instead of the python repr of nested dicts, columns are written one per
+line as a small table. columns with identical stats are folded into one
+line, the noisiest columns (nulls, flagged by rules) come first, and once
+the budget runs out the rest are summarized in a single line. the head
+preview is added last, only for columns that made it in, if it still fits.
+"""
+
+import numpy as np
+
+import config
+from core.profile import as_profile
+
+CHARS_PER_TOKEN = 4
+MAX_VALUE_CHARS = 24
+MAX_NAMES_PER_LINE = 8
+
+
+def estimate_tokens(text):
+    # rough but stable: ~4 chars per token for english/code-ish text
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _short(value):
+    text = "" if value is None else str(value)
+    if isinstance(value, float):
+        text = f"{value:.6g}"
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 1] + "…"
+
+
+def _profiles(table):
+    """the fields that go on one line (without the name), for every column, straight from the arrays."""
+    blank = lambda values, has: [_short(v) if ok else "" for v, ok in zip(values, has)]
+    has_range = table.has_range.tolist()
+    spreads = ["/".join(_short(v) for v in row) if ok else ""
+               for row, ok in zip(table.quantiles.tolist(), table.has_quantiles.tolist())]
+    return list(zip(
+        ["" if dtype is None else dtype for dtype in table.dtypes],
+        table.nulls.tolist(),
+        ["" if d < 0 else d for d in table.distinct.tolist()],
+        blank(table.mins, has_range), blank(table.maxs, has_range),
+        blank(table.means.tolist(), (~np.isnan(table.means)).tolist()),
+        spreads,
+    ))
+
+
+def _names(names, flagged):
+    # flagged names go first so they are never hidden behind "+n same"
+    names = sorted(names, key=lambda n: n not in flagged)
+    if len(names) <= MAX_NAMES_PER_LINE:
+        return ",".join(str(n) for n in names)
+    shown = ",".join(str(n) for n in names[:MAX_NAMES_PER_LINE])
+    return f"{shown},…(+{len(names) - MAX_NAMES_PER_LINE} same)"
+
+
+def serialize_metadata(metadata, token_budget=None, flagged=()):
+    """
+    returns (text, info). info has estimated_tokens, columns_detailed,
+    columns_summarized and head_included. flagged = column names that the
+    rule pass already found problems in; they are kept first.
+    """
+    if token_budget is None:
+        token_budget = config.PROMPT_TOKEN_BUDGET
+    table = as_profile(metadata)
+    columns = table.columns
+    rows = "?" if table.row_count is None else table.row_count
+    flagged = set(flagged)
+
+    # fold columns with identical profiles into one group, keep first-seen order
+    groups = {}
+    for col, fields in zip(columns, _profiles(table)):
+        groups.setdefault(fields, []).append(col)
+
+    def signal(item):
+        profile, names = item
+        nulls = profile[1] or 0
+        return (any(n in flagged for n in names), nulls > 0, profile[6] != "")
+    ordered = sorted(groups.items(), key=signal, reverse=True)
+
+    lines = [
+        f"rows={rows} columns={len(columns)}",
+        "columns (name|dtype|nulls|distinct|min|max|mean|p1/p25/p50/p75/p99):",
+    ]
+    used = estimate_tokens("\n".join(lines)) + 40  # room for the summary line
+    detailed, skipped = [], []
+    for profile, names in ordered:
+        line = "|".join([_names(names, flagged)] + [str(v) for v in profile])
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            skipped.extend(names)
+            continue
+        lines.append(line)
+        used += cost
+        detailed.extend(names)
+    if skipped:
+        dtypes = {}
+        for col in skipped:
+            dtype = table.dtypes[table.position(col)] or "?"
+            dtypes[dtype] = dtypes.get(dtype, 0) + 1
+        kinds = ", ".join(f"{d}×{n}" for d, n in sorted(dtypes.items(), key=lambda kv: -kv[1]))
+        lines.append(f"+{len(skipped)} more columns not shown ({kinds})")
+
+    head_included = False
+    shown = set(detailed)
+    head = table.head_values([c for c in columns if c in shown])
+    head_cols = [c for c in columns if c in head]
+    if head_cols:
+        head_lines = ["head (first rows, csv):", ",".join(str(c) for c in head_cols)]
+        for values in zip(*(head[c] for c in head_cols)):
+            head_lines.append(",".join(_short(v) for v in values))
+        cost = estimate_tokens("\n".join(head_lines)) + 1
+        if used + cost <= token_budget:
+            lines.extend(head_lines)
+            used += cost
+            head_included = True
+
+    text = "\n".join(lines)
+    return text, {
+        "estimated_tokens": estimate_tokens(text),
+        "columns_detailed": len(detailed),
+        "columns_summarized": len(skipped),
+        "head_included": head_included,
+    }
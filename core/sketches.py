@@ -0,0 +1,183 @@
+"""
+small fixed-memory sketches for the metadata pass.
+
+both sketches take a whole chunk at a time (numpy, no python loop per value)
+and merge with another sketch of the same kind, so chunks and worker
+processes can each build their own and combine them at the end.
+"""
+
+import numpy as np
+import pandas as pd
+
+_U64 = np.uint64
+
+
+def hash_series(series):
+    """64-bit hash per value, same index. numbers hash the same whatever their int/float dtype."""
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        series = series.astype("float64")
+    return pd.util.hash_pandas_object(series, index=False)
+
+
+def hash_values(series):
+    """64-bit hashes of the non-null values as a numpy array."""
+    return hash_series(series.dropna()).to_numpy(dtype=np.uint64)
+
+
+def _bit_length(x):
+    # vectorized int.bit_length() for uint64 arrays. each 32 bit half is exact
+    # as a float64, and frexp's exponent of a positive float is its bit length
+    hi = (x >> _U64(32)).astype(np.float64)
+    lo = (x & _U64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1]).astype(np.uint8)
+
+
+class HyperLogLog:
+    """distinct count estimate. 2**p one-byte registers, about 1.04/sqrt(2**p) relative error."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update_hashes(self, hashes):
+        if not len(hashes):
+            return self
+        tail_bits = 64 - self.p
+        idx = (hashes >> _U64(tail_bits)).astype(np.int64)
+        tail = hashes & ((_U64(1) << _U64(tail_bits)) - _U64(1))
+        rank = (tail_bits - _bit_length(tail).astype(np.int64) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def update(self, series):
+        return self.update_hashes(hash_values(series))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+class KLLSketch:
+    """
+    quantile sketch (kll). keeps roughly 3k numbers no matter how many go in.
+    rank error is about 1.7/k. exact until the first compaction.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item stays behind so weights stay exact
+                keep = items[:len(items) % 2]
+                items = items[len(items) % 2:]
+                promoted = items[int(self._rng.integers(2))::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    @property
+    def exact(self):
+        """true until the first compaction (every value is still kept)."""
+        return len(self.levels[0]) == self.n
+
+    def weighted(self):
+        """(sorted items, weight of each item). the weights add up to n."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lvl), 2 ** h, dtype=np.int64) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        items, weights = self.weighted()
+        if not len(items):
+            return [None for _ in qs]
+        cum = np.cumsum(weights)
+        total = cum[-1]
+        out = []
+        for q in qs:
+            pos = int(np.searchsorted(cum, q * total, side="left"))
+            out.append(float(items[min(pos, len(items) - 1)]))
+        return out
+
+
+class FrequentItems:
+    """
+    most frequent values (misra-gries). keeps at most `capacity` counters.
+    counts are exact while a column has fewer distinct values than that,
+    otherwise they are lower bounds and only the heavy hitters survive.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, series):
+        return self._fold(series.value_counts(dropna=True))
+
+    def merge(self, other):
+        return self._fold(other.counts)
+
+    def _fold(self, counts):
+        if not len(counts):
+            return self
+        merged = self.counts.add(counts, fill_value=0) if len(self.counts) else counts
+        merged = merged.astype("int64")
+        if len(merged) > self.capacity:
+            cut = merged.nlargest(self.capacity + 1).iloc[-1]
+            merged = merged - cut
+            merged = merged[merged > 0]
+        self.counts = merged
+        return self
+
+    def top(self):
+        """the most frequent value (smallest one on ties, like Series.mode), or None."""
+        if not len(self.counts):
+            return None
+        best = self.counts[self.counts == self.counts.max()].index
+        try:
+            return sorted(best)[0]
+        except TypeError:
+            return best[0]
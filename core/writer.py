@@ -0,0 +1,213 @@
+"""
+output layer for fixed data.
+
+    with FrameWriter("fixed_big.csv.gz") as out:
+        for chunk in chunks:
+            out.write(chunk)
+    out.stats  # rows, bytes, seconds, mb_per_s, rows_per_s
+
+chunks go to a temp file next to the target and are renamed over it only
+when everything was written, so a crash never leaves half a file under the
+real name. csv can be gzip (stdlib) or zstd (through pyarrow) compressed,
+picked from the .gz / .zst suffix or `compression`. parquet, arrow and
+feather are written batch by batch with pyarrow. the actual writing happens
+in a background thread, so formatting / compressing one chunk overlaps
+with fixing the next.
+"""
+
+import gzip
+import io
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+
+import config
+from core.readers import ARROW, CSV, EXTENSIONS, FEATHER, PARQUET
+
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+FORMAT_EXTENSIONS = {CSV: ".csv", PARQUET: ".parquet", ARROW: ".arrow", FEATHER: ".feather"}
+_DONE = object()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("writing parquet/arrow/feather or zstd needs pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def split_name(path):
+    """(path without compression suffix, compression or None)."""
+    for suffix, compression in COMPRESSIONS.items():
+        if path.lower().endswith(suffix):
+            return path[:-len(suffix)], compression
+    return path, None
+
+
+def output_path(path, fmt=None, compression=None):
+    """path with the extension for fmt (and compression), e.g. fixed_x.csv -> fixed_x.parquet."""
+    base, old = split_name(path)
+    if fmt:
+        base = os.path.splitext(base)[0] + FORMAT_EXTENSIONS[fmt]
+    compression = compression if compression is not None else old
+    if compression and (fmt or CSV) == CSV and EXTENSIONS.get(os.path.splitext(base)[1].lower(), CSV) == CSV:
+        return base + SUFFIXES[compression]
+    return base
+
+
+class FrameWriter:
+    def __init__(self, path, fmt=None, compression=None, background=True):
+        base, suffix_compression = split_name(path)
+        self.path = path
+        self.fmt = fmt or EXTENSIONS.get(os.path.splitext(base)[1].lower(), CSV)
+        self.sep = "\t" if base.lower().endswith(".tsv") else ","
+        self.compression = compression or suffix_compression
+        if self.compression and self.fmt != CSV:
+            raise ValueError(f"{self.compression} compression is for csv output, not {self.fmt}")
+        if self.compression not in (None, "gzip", "zstd"):
+            raise ValueError(f"unknown compression {self.compression!r}, use gzip or zstd")
+        folder = os.path.dirname(os.path.abspath(path))
+        self.tmp = os.path.join(folder, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        self.handle = None
+        self.sink = None
+        self.rows = 0
+        self.busy = 0.0
+        self.started = time.perf_counter()
+        self.stats = None
+        self.error = None
+        self.queue = None
+        if background:
+            self.queue = queue.Queue(maxsize=2)
+            self.thread = threading.Thread(target=self._drain, daemon=True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, tb):
+        if kind is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, df):
+        """queue one chunk (or write it now without a background thread)."""
+        if self.error is not None:
+            raise self.error
+        if self.queue is None:
+            self._write(df)
+        else:
+            self.queue.put(df)
+        return self
+
+    def _drain(self):
+        while True:
+            df = self.queue.get()
+            if df is _DONE:
+                return
+            if self.error is None:
+                try:
+                    self._write(df)
+                except Exception as e:
+                    # keep draining so write() never blocks, the error is raised from there
+                    self.error = e
+
+    def _open(self, df):
+        if self.fmt == CSV:
+            if self.compression == "gzip":
+                self.handle = gzip.open(self.tmp, "wt", encoding="utf-8", newline="",
+                                        compresslevel=config.WRITE_GZIP_LEVEL)
+            elif self.compression == "zstd":
+                self.sink = _pyarrow().CompressedOutputStream(self.tmp, "zstd")
+                self.handle = io.TextIOWrapper(self.sink, encoding="utf-8", newline="")
+            else:
+                self.handle = open(self.tmp, "w", encoding="utf-8", newline="")
+            return
+        pa = _pyarrow()
+        self.schema = pa.Schema.from_pandas(df, preserve_index=False)
+        if self.fmt == PARQUET:
+            self.handle = pa.parquet.ParquetWriter(self.tmp, self.schema, compression=config.WRITE_PARQUET_CODEC)
+        else:
+            self.sink = pa.OSFile(self.tmp, "wb")
+            self.handle = pa.ipc.new_file(self.sink, self.schema)
+
+    def _write(self, df):
+        start = time.perf_counter()
+        first = self.handle is None
+        if first:
+            self._open(df)
+        if self.fmt == CSV:
+            df.to_csv(self.handle, index=False, header=first, sep=self.sep)
+        else:
+            pa = _pyarrow()
+            try:
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(f"chunk does not match the first chunk's column types: {e}") from None
+            self.handle.write_table(table)
+        self.rows += len(df)
+        self.busy += time.perf_counter() - start
+
+    def _finish_thread(self):
+        if self.queue is not None:
+            self.queue.put(_DONE)
+            self.thread.join()
+            self.queue = None
+
+    def _close_handles(self):
+        for handle in (self.handle, self.sink):
+            if handle is not None and not getattr(handle, "closed", False):
+                handle.close()
+        self.handle = self.sink = None
+
+    def close(self):
+        """finish the file and move it into place. returns the stats."""
+        if self.stats is not None:
+            return self.stats
+        self._finish_thread()
+        if self.error is not None:
+            self.abort()
+            raise self.error
+        if self.handle is None:
+            # nothing was written: still leave a valid (empty) file
+            if self.fmt == CSV:
+                open(self.tmp, "w").close()
+            else:
+                self._write(pd.DataFrame())
+        self._close_handles()
+        os.replace(self.tmp, self.path)
+        seconds = time.perf_counter() - self.started
+        size = os.path.getsize(self.path)
+        self.stats = {
+            "path": self.path, "format": self.fmt, "compression": self.compression,
+            "rows": self.rows, "bytes": size, "seconds": round(seconds, 6),
+            "write_seconds": round(self.busy, 6),
+            "mb_per_s": round(size / 1e6 / seconds, 2) if seconds else None,
+            "rows_per_s": round(self.rows / seconds) if seconds else None,
+        }
+        return self.stats
+
+    def abort(self):
+        """stop and delete the temp file. the target is left as it was."""
+        # anything still queued is skipped
+        self.error = self.error or RuntimeError("write aborted")
+        self._finish_thread()
+        try:
+            self._close_handles()
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+
+def write_chunks(chunks, path, fmt=None, compression=None):
+    """write an iterable of dataframes to path. returns the writer stats."""
+    with FrameWriter(path, fmt, compression) as out:
+        for chunk in chunks:
+            out.write(chunk)
+    return out.stats
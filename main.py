@@ -1,11 +1,15 @@
-import pandas as pd
 import os
 import sys
 import traceback
 from datetime import datetime
-from dotenv import load_dotenv
-from core.interpreter import get_ai_audit
-from core.data_processor import get_metadata
+
+# pandas, the core modules and the gemini sdk are imported inside run_audit,
+# so --help and rules-only (--offline) runs start fast
+
+def load_env():
+    # load .env so GEMINI_API_KEY is available
+    from dotenv import load_dotenv
+    load_dotenv()
 
 def log_error(e):
     # write a simple error report so debugging is easy later
@@ -19,6 +23,7 @@ def log_error(e):
         pass
 
 def ensure_api_key():
+    load_env()
     api_key = os.getenv("GEMINI_API_KEY")
     if api_key:
         return api_key
@@ -32,6 +37,7 @@ def ensure_api_key():
         return None
     try:
         write_env_value("GEMINI_API_KEY", key)
+        from dotenv import load_dotenv
         load_dotenv(override=True)
         print("✅ .env saved.")
         return os.getenv("GEMINI_API_KEY")
@@ -58,36 +64,116 @@ def write_env_value(key, value):
     with open(".env", "w", encoding="utf-8") as f:
         f.write("\n".join(new_lines) + "\n")
 
-# load .env so GEMINI_API_KEY is available
-load_dotenv()
+def print_memory(report):
+    # how much the compact dtypes saved, biggest wins first
+    mb = 1024 * 1024
+    memory = report["memory"]
+    before = sum(m["before"] for m in memory.values())
+    after = sum(m["after"] for m in memory.values())
+    print(f"memory: {after / mb:.1f} MB (about {before / mb:.1f} MB with default dtypes)")
+    top = sorted(memory.items(), key=lambda kv: kv[1]["after"] - kv[1]["before"])[:3]
+    for col, m in top:
+        if m["before"] > m["after"]:
+            print(f"  {col}: {report['schema'][col]}, saved {(m['before'] - m['after']) / mb:.1f} MB")
+    if report["widened"]:
+        print(f"  widened after the sample: {', '.join(report['widened'])}")
 
-def run_audit(csv_file="dirty_data.csv", auto_fix=False):
+def run_audit(csv_file="dirty_data.csv", auto_fix=False, chunksize=None, workers=None, columns=None, lean=False,
+              incremental=False, profile=None, profile_format="json", profiler=None, offline=False,
+              stream=False, duplicates=None, dup_keys=None, outliers=None, group_by=None,
+              output_format=None, compress=None, sample=None, sample_mode=None):
     """
-    run a datasight audit on a csv.
-    csv_file: path to the csv (default: dirty_data.csv)
-    auto_fix: if true, apply suggested fixes and save fixed_<file>.csv
+    run a datasight audit on a csv, parquet, arrow or feather file.
+    csv_file: path to the file (default: dirty_data.csv), format is detected
+    auto_fix: if true, apply suggested fixes and save fixed_<file> in the same format
+    chunksize: if set, stream the file this many rows at a time instead of loading it all
+    workers: if more than 1, profile the csv in that many processes
+    columns: only read these columns (parquet still reports nulls for the rest)
+    lean: load the csv with compact dtypes and print the memory saved
+    incremental: for append-only csvs, only profile rows added since the last run
+    profile: write per-stage timings to this path ("json" or "chrome" trace format)
+    profiler: your own core.profiling.StageProfiler (e.g. with hooks) to collect the stages
+    offline: rule findings only. no api key needed and the gemini sdk is never loaded
+    stream: print the gemini summary as it arrives instead of waiting for all of it
+    duplicates: look for repeated rows (default on, see config.DUPLICATE_CHECK)
+    dup_keys: only compare these columns when looking for repeats, e.g. ["email"]
+    outliers: "mad" (robust z-score) or "iqr", False to skip (default config.OUTLIER_METHOD)
+    group_by: judge outliers within each value of this column, e.g. "department"
+    output_format: write the fixed file as csv, parquet, arrow or feather (default: same as the input)
+    compress: gzip or zstd for a csv output (default: same as the input)
+    sample: audit a random sample of this many rows and estimate the rates (core/sampling.py)
+    sample_mode: "reservoir" (one pass over the file) or "blocks" (random seeks, seconds on any size)
     """
+    import pandas as pd
+    import config
+    from core.audit import scan_file, write_fixed
+    from core.checkpoint import incremental_scan
+    from core.profiling import StageProfiler, stage
+    from core.readers import detect_format, is_compressed
+    from core.serializer import serialize_metadata
+    if profile and profiler is None:
+        profiler = StageProfiler()
     try:
-        api_key = ensure_api_key()
-        if not api_key:
+        api_key = None if offline else ensure_api_key()
+        if not api_key and not offline:
             print("📝 you can also create it manually:")
             print("   cp .env.example .env")
             print("   # then edit .env and add your actual api key")
+            print("   or run with --offline for rule findings only")
             return
         if not os.path.exists(csv_file):
             print(f"❌ Error: File '{csv_file}' not found")
             print(f"   Make sure the file is in the same folder as main.py")
             return
-        df = pd.read_csv(csv_file)
-        if df.empty:
+        # the rule engine sees the same rows as the metadata pass
+        checkpoint = None
+        if incremental and is_compressed(csv_file):
+            # appended bytes of a compressed file cannot be read on their own
+            print("note: --incremental needs an uncompressed csv, doing a full scan")
+            incremental = False
+        if incremental and detect_format(csv_file) == "csv":
+            df = None
+            # the checkpoint only holds what can be merged with the new rows
+            ignored = [flag for flag, used in (("--workers", workers and workers > 1), ("--columns", columns),
+                                               ("--lean", lean), ("--sample", sample), ("--dup-keys", dup_keys))
+                       if used]
+            if ignored:
+                print(f"note: {', '.join(ignored)} ignored with --incremental (the new rows are streamed, every column)")
+            if duplicates or (duplicates is None and config.DUPLICATE_CHECK):
+                print("note: repeated whole rows are not checked with --incremental (repeated keys still are)")
+            with stage(profiler, "scan") as rec:
+                metadata, engine, checkpoint = incremental_scan(csv_file, chunksize, outliers=outliers,
+                                                                group_by=group_by)
+                rec.update(rows=checkpoint["new_rows"], bytes_read=checkpoint["new_bytes"])
+        else:
+            df, metadata, engine = scan_file(csv_file, chunksize, workers, columns, lean, profiler,
+                                             duplicates=duplicates, dup_keys=dup_keys, outliers=outliers,
+                                             group_by=group_by, sample=sample, sample_mode=sample_mode)
+        if metadata["row_count"] == 0:
             print(f"❌ Error: The file '{csv_file}' is empty (no data rows)")
             return
-        metadata = get_metadata(df)
         print("datasight audit")
-        print(f"file: {csv_file}")
-        print(f"size: {len(df)} rows × {len(df.columns)} columns")
-        # ask gemini for a summary + trail
-        audit_trail, summary = get_ai_audit(metadata, api_key, return_trail=True)
+        print(f"file: {csv_file} ({detect_format(csv_file)})")
+        print(f"size: {metadata['row_count']} rows × {len(metadata['columns'])} columns")
+        if "sample" in metadata:
+            info = metadata["sample"]
+            total = f"{info['total_rows']:,}" if info["total_exact"] else f"about {info['total_rows']:,}"
+            print(f"sample: {info['rows']:,} of {total} rows ({info['mode']}, {info['seconds']:.2f}s), "
+                  f"counts are estimates with {info['confidence']:.0%} intervals")
+        types = getattr(engine, "types", None)
+        if types:
+            print("types: " + ", ".join(f"{col} ({kind['type']})" for col, kind in types.items()))
+        if checkpoint:
+            if checkpoint["mode"] == "incremental":
+                print(f"checkpoint: read only {checkpoint['new_rows']} new rows ({checkpoint['new_bytes']} bytes)")
+                # the prefix check is sampled, so say what it can miss
+                print("   (already audited rows are compared by sampled blocks and their last MB: "
+                      "a same-size edit elsewhere is not noticed, delete the checkpoint after one)")
+            else:
+                print(f"checkpoint: full pass ({checkpoint['reason']})")
+        if df is not None and "memory" in df.attrs:
+            print_memory(df.attrs["memory"])
+        audit_trail = engine.audit_trail()
         print("\nfindings")
         if audit_trail:
             for idx, item in enumerate(audit_trail, 1):
@@ -96,18 +182,51 @@ def run_audit(csv_file="dirty_data.csv", auto_fix=False):
                     print(f"  fix: {item['suggested_fix']}")
         else:
             print("- no rule-based issues found")
-        # if auto_fix is on, apply any fix functions
+        timings = ", ".join(f"{name} {secs * 1000:.1f}ms" for name, secs in engine.timings.items())
+        print(f"  (rule pass: {timings})")
+        with stage(profiler, "prompt"):
+            _, prompt_info = serialize_metadata(metadata, flagged=[item.get('column') for item in audit_trail])
+        print(f"  (prompt: ~{prompt_info['estimated_tokens']} tokens, "
+              f"{prompt_info['columns_detailed']} of {len(metadata['columns'])} columns in detail)")
+        if offline:
+            from core.rules import rules_summary
+            summary = "offline mode, no ai summary. " + rules_summary(audit_trail)
+        else:
+            # ask gemini for a summary of the same findings
+            from core.interpreter import get_ai_audit
+            shown = []
+            if stream:
+                print("\nsummary")
+            def show(text):
+                print(text, end="", flush=True)
+                shown.append(text)
+            with stage(profiler, "gemini") as rec:
+                audit_trail, summary = get_ai_audit(metadata, api_key, return_trail=True, audit_trail=audit_trail,
+                                                    on_text=show if stream else None, metrics=rec)
+            if stream:
+                if "".join(shown) != summary:
+                    # the call failed (maybe half way), show the fallback
+                    print(("\n" if shown else "") + summary, end="")
+                print()
+                if rec.get("ttft_s") is not None:
+                    print(f"  (gemini: first token after {rec['ttft_s']:.2f}s, done after {rec['total_s']:.2f}s)")
+        # if auto_fix is on, apply the fixes in one pass
         if auto_fix:
-            for item in audit_trail:
-                if 'fix_function' in item and callable(item['fix_function']):
-                    df = item['fix_function'](df)
-            print(f"\nauto-fix: saved fixed_{csv_file}")
-            df.to_csv("fixed_" + csv_file, index=False)
-        print("\nsummary")
-        print(summary)
+            written = {}
+            out_file = write_fixed(csv_file, audit_trail, df, chunksize, profiler=profiler,
+                                   out_format=output_format, compression=compress, stats=written)
+            speed = f" at {written['mb_per_s']} MB/s" if written["mb_per_s"] else ""
+            print(f"\nauto-fix: saved {out_file} ({written['rows']} rows, {written['bytes'] / 1e6:.1f} MB{speed})")
+        if not (stream and not offline):
+            print("\nsummary")
+            print(summary)
         # npc-style hints
         lower_summary = summary.lower()
-        if "quota exhausted" in lower_summary or "resource_exhausted" in lower_summary:
+        if offline:
+            print("\nwhat next (npc)")
+            print("you walked in without the ai map. rule checks only.")
+            print("drop --offline when you want a gemini summary too.")
+        elif "quota exhausted" in lower_summary or "resource_exhausted" in lower_summary:
             print("\nwhat next (npc)")
             print("hey, traveler. your ai quota is empty right now.")
             print("come back after it resets, or enable billing.")
@@ -121,6 +240,8 @@ def run_audit(csv_file="dirty_data.csv", auto_fix=False):
             print("\nwhat next (npc)")
             print("looks like the path is clear.")
             print("try a different csv or turn on --auto-fix.")
+    except ImportError as e:
+        print(f"❌ Error: {e}")
     except pd.errors.ParserError:
         print(f"❌ Error: Could not read '{csv_file}'")
         print("   Make sure it's a valid CSV file")
@@ -128,12 +249,40 @@ def run_audit(csv_file="dirty_data.csv", auto_fix=False):
         print(f"❌ Error: {type(e).__name__}: {e}")
         print("   See README.md for help")
         log_error(e)
+    finally:
+        if profile and profiler is not None:
+            profiler.write(profile, profile_format)
+            print(f"\nprofile: {len(profiler.stages)} stages saved to {profile}")
 
 if __name__ == "__main__":
     # run: python main.py --file your_file.csv --auto-fix
     import argparse
     parser = argparse.ArgumentParser(description="run a datasight audit")
-    parser.add_argument("--file", default="dirty_data.csv", help="csv file to audit")
+    parser.add_argument("--file", default="dirty_data.csv", help="csv, parquet, arrow or feather file to audit")
     parser.add_argument("--auto-fix", action="store_true", help="apply fix functions and save fixed_<file>.csv")
+    parser.add_argument("--chunksize", type=int, default=None, help="stream the csv this many rows at a time (for files bigger than memory)")
+    parser.add_argument("--workers", type=int, default=None, help="profile the csv in this many processes")
+    parser.add_argument("--lean", action="store_true", help="load the csv with compact dtypes (less memory)")
+    parser.add_argument("--incremental", action="store_true", help="append-only csv: only audit rows added since the last run")
+    parser.add_argument("--profile", default=None, help="write per-stage timings (wall, cpu, memory, rows/s) to this file")
+    parser.add_argument("--profile-format", choices=["json", "chrome"], default="json", help="chrome = trace for chrome://tracing / perfetto")
+    parser.add_argument("--stream", action="store_true", help="print the ai summary as it arrives")
+    parser.add_argument("--offline", action="store_true", help="rule findings only, no gemini call or api key needed")
+    parser.add_argument("--columns", default=None, help="comma separated columns to read (others are skipped)")
+    parser.add_argument("--dup-keys", default=None, help="comma separated columns that should be unique together (default: whole rows)")
+    parser.add_argument("--no-duplicates", action="store_true", help="skip the duplicate row check")
+    parser.add_argument("--outliers", choices=["mad", "iqr", "off"], default=None, help="outlier method (default mad), off to skip")
+    parser.add_argument("--group-by", default=None, help="look for outliers within each value of this column")
+    parser.add_argument("--output-format", choices=["csv", "parquet", "arrow", "feather"], default=None, help="format of the auto-fix output (default: same as the input)")
+    parser.add_argument("--sample", type=int, default=None, help="audit a random sample of this many rows and estimate the rest")
+    parser.add_argument("--sample-mode", choices=["reservoir", "blocks"], default=None, help="reservoir = one pass over the file, blocks = random seeks (fastest)")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], default=None, help="compress a csv auto-fix output")
     args = parser.parse_args()
-    run_audit(args.file, auto_fix=args.auto_fix)
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    dup_keys = [c.strip() for c in args.dup_keys.split(",")] if args.dup_keys else None
+    run_audit(args.file, auto_fix=args.auto_fix, chunksize=args.chunksize, workers=args.workers, columns=columns, lean=args.lean,
+              incremental=args.incremental, profile=args.profile, profile_format=args.profile_format,
+              offline=args.offline, stream=args.stream, duplicates=False if args.no_duplicates else None, dup_keys=dup_keys,
+              outliers=False if args.outliers == "off" else args.outliers, group_by=args.group_by,
+              output_format=args.output_format, compress=args.compress, sample=args.sample,
+              sample_mode=args.sample_mode)
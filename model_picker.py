@@ -2,34 +2,30 @@
 """
 list available gemini models for this key and suggest a default.
 optionally writes GEMINI_MODEL to .env.
+
+--probe sends a small audit prompt to every model a few times (concurrently),
+measures p50/p95 latency, throughput and error rate, and saves a ranked list
+that config.get_model_candidates() uses until it expires.
+
+run:
+    python model_picker.py
+    python model_picker.py --probe --rounds 5 --concurrency 4
 """
 
+import asyncio
+import json
 import os
 import re
-from dotenv import load_dotenv
-from google import genai
-
-load_dotenv()
-
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    print("no GEMINI_API_KEY found. add it to .env first.")
-    raise SystemExit(1)
+import time
 
-client = genai.Client(api_key=api_key)
+import config
 
-models = []
-for m in client.models.list():
-    if "generateContent" in m.supported_actions:
-        models.append(m.name)
 
-if not models:
-    print("no models returned for this key.")
-    raise SystemExit(1)
+def list_models(client):
+    """names of models that support generateContent, without the models/ prefix."""
+    return [m.name.replace("models/", "") for m in client.models.list()
+            if "generateContent" in (m.supported_actions or [])]
 
-print("models that support generateContent:")
-for name in models:
-    print(f"- {name}")
 
 # pick a best model by simple heuristic
 # prefer latest flash (2.5 > 2.0 > 1.5) then any gemini flash
@@ -52,14 +48,89 @@ def score(name: str) -> tuple:
         return (1, 0, 0)
     return (0, 0, 0)
 
-recommended = sorted(models, key=score, reverse=True)[0]
-print(f"\nrecommended: {recommended}")
 
-# map models/<name> to plain name
-plain = recommended.replace("models/", "")
+def probe_prompt():
+    """a small but realistic audit prompt (the example data's metadata)."""
+    import pandas as pd
+    from core.data_processor import get_metadata
+    from core.interpreter import build_prompt
+    from core.rules import run_rules
+    df = pd.read_csv("dirty_data.csv") if os.path.exists("dirty_data.csv") else pd.DataFrame(
+        {"id": [1, 2, 2], "age": [30, None, 200], "email": ["a@x.com", "bad", None]})
+    return build_prompt(get_metadata(df), run_rules(df)[0])
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def probe_models(models, generate, prompt, rounds=3, concurrency=4, clock=time.perf_counter):
+    """
+    call every model `rounds` times, at most `concurrency` calls at once.
+    generate: async (model_name, prompt) -> text, e.g. scheduler.gemini_generate(key).
+    returns one result dict per model, ranked best first.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    calls = {name: [] for name in models}
+
+    async def one(name):
+        async with semaphore:
+            start = clock()
+            try:
+                text = await generate(name, prompt)
+                calls[name].append({"ok": True, "latency": clock() - start, "chars": len(text or "")})
+            except Exception as e:
+                calls[name].append({"ok": False, "latency": clock() - start, "error": f"{type(e).__name__}: {e}"})
+
+    await asyncio.gather(*(one(name) for name in models for _ in range(rounds)))
+    return rank_results([summarize(name, calls[name]) for name in models])
+
+
+def summarize(name, calls):
+    ok = [c for c in calls if c["ok"]]
+    latencies = [c["latency"] for c in ok]
+    busy = sum(latencies)
+    return {
+        "model": name,
+        "calls": len(calls),
+        "errors": len(calls) - len(ok),
+        "error_rate": round((len(calls) - len(ok)) / len(calls), 3) if calls else 1.0,
+        "p50_s": round(percentile(latencies, 0.5), 4) if ok else None,
+        "p95_s": round(percentile(latencies, 0.95), 4) if ok else None,
+        # output tokens per second of call time (~4 chars per token)
+        "tokens_per_s": round(sum(c["chars"] for c in ok) / 4 / busy, 1) if busy else None,
+        "last_error": next((c["error"] for c in reversed(calls) if not c["ok"]), None),
+    }
+
+
+def rank_results(results):
+    # fewest errors first, then lowest typical latency, then the tail
+    return sorted(results, key=lambda r: (r["error_rate"], r["p50_s"] is None, r["p50_s"] or 0, r["p95_s"] or 0))
+
 
-resp = input("write this to .env as GEMINI_MODEL? (y/n): ").strip().lower()
-if resp == "y":
+def save_ranking(results, path=None, ttl_seconds=None):
+    path = path or config.get_model_ranking_path()
+    ttl = config.MODEL_RANKING_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    now = time.time()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": now, "expires": now + ttl, "models": results}, f, indent=2)
+    return path
+
+
+def print_ranking(results):
+    print(f"{'model':<32} {'p50':>7} {'p95':>7} {'tok/s':>8} {'errors':>7}")
+    for r in results:
+        p50 = f"{r['p50_s']:.2f}s" if r["p50_s"] is not None else "-"
+        p95 = f"{r['p95_s']:.2f}s" if r["p95_s"] is not None else "-"
+        tps = f"{r['tokens_per_s']:.0f}" if r["tokens_per_s"] is not None else "-"
+        print(f"{r['model']:<32} {p50:>7} {p95:>7} {tps:>8} {r['errors']:>3}/{r['calls']:<3}")
+
+
+def write_env_model(plain):
     # append or update .env
     lines = []
     if os.path.exists(".env"):
@@ -77,6 +148,66 @@ if resp == "y":
         new_lines.append(f"GEMINI_MODEL={plain}")
     with open(".env", "w", encoding="utf-8") as f:
         f.write("\n".join(new_lines) + "\n")
-    print("saved GEMINI_MODEL to .env")
-else:
-    print("ok, not writing .env")
+
+
+def run_probe(api_key, models, rounds, concurrency, force=False):
+    ranking = config.load_model_ranking()
+    if ranking and not force:
+        print("using the saved probe results (still fresh, --force to probe again):")
+        print_ranking(ranking)
+        return ranking
+    from core.scheduler import gemini_generate
+    prompt = probe_prompt()
+    print(f"probing {len(models)} models × {rounds} calls ({len(prompt)} char prompt)...")
+    results = asyncio.run(probe_models(models, gemini_generate(api_key), prompt, rounds, concurrency))
+    print_ranking(results)
+    print(f"\nsaved ranking to {save_ranking(results)}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from google import genai
+
+    parser = argparse.ArgumentParser(description="list gemini models and pick a default")
+    parser.add_argument("--probe", action="store_true", help="time each model with a small audit prompt")
+    parser.add_argument("--rounds", type=int, default=3, help="calls per model when probing")
+    parser.add_argument("--concurrency", type=int, default=4, help="probe calls in flight at once")
+    parser.add_argument("--models", default=None, help="comma separated models to probe (default: all)")
+    parser.add_argument("--force", action="store_true", help="probe even if saved results are still fresh")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("no GEMINI_API_KEY found. add it to .env first.")
+        raise SystemExit(1)
+
+    client = genai.Client(api_key=api_key, http_options=config.get_http_options())
+    models = [m.strip() for m in args.models.split(",")] if args.models else list_models(client)
+    if not models:
+        print("no models returned for this key.")
+        raise SystemExit(1)
+
+    print("models that support generateContent:")
+    for name in models:
+        print(f"- {name}")
+
+    if args.probe:
+        ranked = run_probe(api_key, models, args.rounds, args.concurrency, args.force)
+        usable = [r for r in ranked if r["error_rate"] <= config.MODEL_MAX_ERROR_RATE]
+        recommended = usable[0]["model"] if usable else sorted(models, key=score, reverse=True)[0]
+    else:
+        recommended = sorted(models, key=score, reverse=True)[0]
+    print(f"\nrecommended: {recommended}")
+
+    # map models/<name> to plain name
+    plain = recommended.replace("models/", "")
+
+    resp = input("write this to .env as GEMINI_MODEL? (y/n): ").strip().lower()
+    if resp == "y":
+        write_env_model(plain)
+        print("saved GEMINI_MODEL to .env")
+    else:
+        print("ok, not writing .env")
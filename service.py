@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+long-running datasight audit service.
+
+pandas, google-genai and the gemini client are loaded once and kept warm.
+the read/profile/rule work runs in a process pool, gemini calls share one
+client, and a bounded queue turns extra requests away with 503 instead of
+piling them up.
+
+run:
+    python service.py --port 8765 --workers 4
+    python service.py --socket /tmp/datasight.sock
+
+use:
+    curl -s localhost:8765/audit -d '{"file": "dirty_data.csv"}'
+    curl -s --unix-socket /tmp/datasight.sock http://x/audit -d '{"file": "dirty_data.csv"}'
+
+POST /audit body: {"file": path, "auto_fix": false, "chunksize": null, "ai": true,
+                  "columns": null, "lean": false, "duplicates": null, "dup_keys": null,
+                  "outliers": null, "group_by": null, "output_format": null, "compress": null,
+                  "sample": null, "sample_mode": null}
+GET /health
+"""
+
+import json
+import os
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from core.audit import audit_local
+from core.hedging import latency_report
+from core.interpreter import get_ai_audit
+
+load_dotenv()
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class AuditService:
+    def __init__(self, workers=None, max_queue=64, api_key=None):
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.slots = threading.BoundedSemaphore(max_queue)
+        self.max_queue = max_queue
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+
+    def audit(self, request):
+        """run one audit request. returns (http status, json body)."""
+        path = request.get("file")
+        if not path or not os.path.exists(path):
+            return 404, {"error": f"file not found: {path}"}
+        if not self.slots.acquire(blocking=False):
+            return 503, {"error": "queue full, try again later"}
+        start = time.perf_counter()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            result = self.pool.submit(
+                audit_local, path, bool(request.get("auto_fix")), request.get("chunksize"),
+                None, request.get("columns"), bool(request.get("lean")),
+                request.get("duplicates"), request.get("dup_keys"), request.get("outliers"), request.get("group_by"),
+                request.get("output_format"), request.get("compress"),
+                request.get("sample"), request.get("sample_mode"),
+            ).result()
+            summary = None
+            if request.get("ai", True) and result["rows"]:
+                if self.api_key:
+                    _, summary = get_ai_audit(result["metadata"], self.api_key, return_trail=True,
+                                              audit_trail=result["audit_trail"])
+                else:
+                    summary = "ai summary unavailable. no GEMINI_API_KEY set for the service."
+            if request.get("metadata"):
+                result["metadata"] = result["metadata"].to_dict()
+            else:
+                result.pop("metadata")
+            result["summary"] = summary
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            return 200, result
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.served += 1
+            self.slots.release()
+
+    def health(self):
+        return {"ok": True, "in_flight": self.in_flight, "served": self.served, "max_queue": self.max_queue,
+                "models": latency_report()}
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, body):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, service.health())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/audit":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send(400, {"error": "body must be json"})
+                return
+            self._send(*service.audit(request))
+
+    return Handler
+
+
+def make_server(service, host="127.0.0.1", port=8765, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, make_handler(service))
+        # BaseHTTPRequestHandler expects (host, port) style client addresses
+        server.get_request = lambda: (server.socket.accept()[0], ("unix", 0))
+        return server
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="run datasight as a local audit service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="listen on a unix socket instead of tcp")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the pandas work")
+    parser.add_argument("--max-queue", type=int, default=64, help="requests allowed in flight before 503")
+    args = parser.parse_args()
+    service = AuditService(args.workers, args.max_queue)
+    server = make_server(service, args.host, args.port, args.socket)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"datasight service on {where} (ctrl+c to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
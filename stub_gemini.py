@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+tiny local stand-in for the gemini api, for tests and benchmarks.
+it answers generateContent calls with a canned summary, and can be told to
+be slow or to send 429 (RESOURCE_EXHAUSTED) for the first few calls.
+streamGenerateContent (?alt=sse) sends the summary a few words at a time.
+
+run: python stub_gemini.py --port 8089 --fail-first 3
+then: GEMINI_BASE_URL=http://127.0.0.1:8089 python main.py
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH = re.compile(r"/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)")
+SECTION = re.compile(r"^===\s*FILE:\s*(.+?)\s*===\s*$", re.MULTILINE)
+
+
+class StubState:
+    def __init__(self, fail_first=0, fail_every=0, latency=0.0, retry_delay=0.05, chunk_delay=0.0, chunk_words=3,
+                 model_latency=None):
+        self.fail_first = fail_first    # 429 for the first n calls
+        self.fail_every = fail_every    # then 429 for every n-th call (0 = never)
+        self.latency = latency          # seconds per call (before the first chunk when streaming)
+        self.retry_delay = retry_delay  # hint sent back with a 429
+        self.chunk_delay = chunk_delay  # seconds between streamed chunks
+        self.chunk_words = chunk_words  # words per streamed chunk
+        self.model_latency = model_latency or {}  # {model: seconds}, instead of latency for those models
+        self.calls = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+            fail = n <= self.fail_first or (self.fail_every and n % self.fail_every == 0)
+            if fail:
+                self.rate_limited += 1
+            return fail
+
+
+def summary_for(prompt, model):
+    # packed prompts get one section back per file
+    names = SECTION.findall(prompt)
+    if names:
+        return "\n".join(f"=== FILE: {name} ===\nstub audit for {name} by {model}." for name in names)
+    return f"stub audit by {model}: {len(prompt)} prompt chars, no real model was called."
+
+
+def response_body(text, prompt_tokens, finish_reason="STOP"):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {"candidates": [candidate], "usageMetadata": {"promptTokenCount": prompt_tokens}}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            match = PATH.match(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not match:
+                self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+                return
+            latency = state.model_latency.get(match.group(1), state.latency)
+            if latency:
+                time.sleep(latency)
+            if state.should_fail():
+                self._send(429, {"error": {
+                    "code": 429,
+                    "message": f"Resource has been exhausted. Please retry in {state.retry_delay}s.",
+                    "status": "RESOURCE_EXHAUSTED",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                 "retryDelay": f"{state.retry_delay}s"}],
+                }})
+                return
+            prompt = "".join(
+                part.get("text", "")
+                for content in request.get("contents", [])
+                for part in content.get("parts", [])
+            )
+            text = summary_for(prompt, match.group(1))
+            if match.group(2) == "streamGenerateContent":
+                self._stream(text, len(prompt) // 4)
+                return
+            self._send(200, response_body(text, len(prompt) // 4))
+
+        def _stream(self, text, prompt_tokens):
+            # server-sent events, one small response per few words
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split(" ")
+            pieces = [" ".join(words[i:i + state.chunk_words]) for i in range(0, len(words), state.chunk_words)]
+            for i, piece in enumerate(pieces):
+                if i and state.chunk_delay:
+                    time.sleep(state.chunk_delay)
+                piece += " " if i < len(pieces) - 1 else ""
+                body = response_body(piece, prompt_tokens, "STOP" if i == len(pieces) - 1 else None)
+                self.wfile.write(b"data: " + json.dumps(body).encode("utf-8") + b"\r\n\r\n")
+                self.wfile.flush()
+
+    return Handler
+
+
+def start_stub(port=0, **options):
+    """start the stub in a background thread. returns (server, state, base_url)."""
+    state = StubState(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="local stub gemini endpoint")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-first", type=int, default=0, help="send 429 for the first n calls")
+    parser.add_argument("--fail-every", type=int, default=0, help="send 429 for every n-th call")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait per call")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="latency for one model (repeatable)")
+    args = parser.parse_args()
+    model_latency = {name: float(seconds) for name, seconds in (item.split("=", 1) for item in args.model_latency)}
+    server, _, url = start_stub(args.port, fail_first=args.fail_first, fail_every=args.fail_every,
+                                latency=args.latency, chunk_delay=args.chunk_delay, model_latency=model_latency)
+    print(f"stub gemini on {url} (ctrl+c to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
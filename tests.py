@@ -5,11 +5,54 @@ run: python tests.py
 or: pytest tests.py -v
 """
 
-import pandas as pd
-import sys
+import asyncio
+import contextlib
+import io
+import json
 import os
-from core.data_processor import get_metadata
-from core.interpreter import get_ai_audit
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+import batch
+import config
+import model_picker
+from benchmarks.generate import make_messy, write_messy
+from benchmarks.run import run_benchmark
+from core.audit import audit_local, scan_file, write_fixed
+from core.cache import ResponseCache, cache_key
+from core.checkpoint import checkpoint_path, incremental_scan, index_folder
+from core.data_processor import MetadataAccumulator, get_metadata, stream_metadata
+from core.duplicates import DuplicateFinder
+from core.fixes import build_fix_plan
+from core.hedging import HedgeBudget, HedgeFailed, LatencyStats, hedged_call, hedged_call_sync, latency_report
+from core.ingest import infer_schema, read_lean
+from core.interpreter import build_prompt, get_ai_audit
+from core.outliers import OutlierDetector
+from core.parallel import profile_file_parallel, split_byte_ranges
+from core.profile import TableProfile
+from core.profiling import StageProfiler, add_hook, remove_hook
+from core.readers import csv_separator, detect_format, parquet_footer_stats, read_frame
+from core.rules import RULES, RuleEngine, metadata_findings, run_rules
+from core.sampling import SampleEstimate, draw_sample, effective_size, reservoir_sample, wilson_interval
+from core.scheduler import AuditScheduler, TokenBucket, gemini_generate, retry_hint, split_sections
+from core.semantic import PHONE_PATTERN, detect_types, invalid_mask
+from core.serializer import serialize_metadata
+from core.sketches import FrequentItems, HyperLogLog, KLLSketch
+from core.writer import FrameWriter, write_chunks
+from stub_gemini import start_stub
 
 # colors for terminal output
 GREEN = '\033[92m'
@@ -225,8 +268,1473 @@ def test_workflow_dirty_data():
     
     print_test_result("Integration - Dirty data workflow", True)
 
+# ==================== streaming tests ====================
+
+def assert_same_metadata(a, b, label=""):
+    """compare metadata dicts (head goes through a dataframe so nan == nan)"""
+    assert a.keys() == b.keys(), f"{label}: different keys"
+    for key in a:
+        if key == 'head':
+            assert pd.DataFrame(a[key]).equals(pd.DataFrame(b[key])), f"{label}: head differs"
+        elif key == 'stats':
+            assert a[key].keys() == b[key].keys(), f"{label}: stats columns differ"
+            for col, stat in a[key].items():
+                other = b[key][col]
+                exact = {k: v for k, v in stat.items() if k != 'quantiles'}
+                assert exact == {k: v for k, v in other.items() if k != 'quantiles'}, \
+                    f"{label}: stats for '{col}' differ"
+                # quantiles are sketch estimates, so only check they are close
+                assert stat.keys() == other.keys(), f"{label}: stats keys for '{col}' differ"
+                spread = (stat.get('max', 0) - stat.get('min', 0)) or 1
+                for q, value in stat.get('quantiles', {}).items():
+                    assert abs(value - other['quantiles'][q]) <= 0.05 * spread, \
+                        f"{label}: quantile {q} of '{col}' too far off"
+        else:
+            assert a[key] == b[key], f"{label}: '{key}' differs"
+
+def test_stream_metadata_matches_full():
+    """streamed metadata should match the one-shot version"""
+    full = get_metadata(pd.read_csv("messy_sample.csv"))
+    for chunksize in (1, 2, 3, 100):
+        streamed = stream_metadata("messy_sample.csv", chunksize)
+        assert_same_metadata(streamed, full, f"chunksize={chunksize}")
+
+    print_test_result("stream_metadata() - Matches get_metadata", True)
+
+def test_accumulator_merge():
+    """merging two accumulators should equal one pass over all rows"""
+    df = pd.DataFrame({
+        'Age': [25, None, -5, 200],
+        'Email': ['a@x.com', None, None, 'b@x.com']
+    })
+    left = MetadataAccumulator().update(df.iloc[:2])
+    right = MetadataAccumulator().update(df.iloc[2:])
+    merged = left.merge(right).result()
+
+    assert_same_metadata(merged, get_metadata(df), "merge")
+    assert merged['row_count'] == 4
+    assert merged['stats']['Age']['min'] == -5
+    assert merged['stats']['Age']['max'] == 200
+
+    print_test_result("MetadataAccumulator - Merge", True)
+
+def test_stream_metadata_header_only():
+    """a csv with only a header has zero rows"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "empty.csv")
+        with open(path, "w") as f:
+            f.write("A,B\n")
+        meta = stream_metadata(path, 10)
+    assert meta['row_count'] == 0, "Header-only file should have 0 rows"
+
+    print_test_result("stream_metadata() - Header only", True)
+
+# ==================== parallel tests ====================
+
+def write_sample_csv(folder, rows=2000):
+    """write a mid-sized csv with nulls, negatives and text"""
+    df = pd.DataFrame({
+        'id': range(rows),
+        'age': [None if i % 7 == 0 else (i % 90) - 5 for i in range(rows)],
+        'spend': [i * 0.5 for i in range(rows)],
+        'email': [None if i % 11 == 0 else f"user{i}@x.com" for i in range(rows)],
+    })
+    path = os.path.join(folder, "sample.csv")
+    df.to_csv(path, index=False)
+    return path
+
+def test_split_byte_ranges_aligned():
+    """byte ranges should start on a line and cover the whole file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp)
+        ranges = split_byte_ranges(path, 8)
+        with open(path, "rb") as f:
+            data = f.read()
+    assert ranges[0][0] == data.index(b"\n") + 1, "First range should start after the header"
+    assert ranges[-1][1] == len(data), "Last range should end at end of file"
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start, "Ranges should be contiguous"
+        assert data[start - 1:start] == b"\n", "Each range should start on a new line"
+
+    print_test_result("split_byte_ranges() - Line aligned", True)
+
+def test_parallel_matches_serial():
+    """serial and parallel profiling should give identical metadata"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp)
+        serial = get_metadata(pd.read_csv(path))
+        parallel = profile_file_parallel(path, workers=2, chunksize=100)
+    assert_same_metadata(parallel, serial, "parallel")
+
+    print_test_result("profile_file_parallel() - Matches serial", True)
+
+def test_parallel_compressed_streams():
+    """--workers on a .csv.gz streams it instead of splitting compressed bytes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = write_sample_csv(tmp)
+        df = pd.read_csv(plain)
+        path = os.path.join(tmp, "sample.csv.gz")
+        df.to_csv(path, index=False)
+        _, metadata, engine = scan_file(path, workers=4)
+        expected = scan_file(plain)[2].audit_trail()
+    assert_same_metadata(metadata, get_metadata(df), "gzip workers")
+    assert findings_by_rule(engine.audit_trail()) == findings_by_rule(expected)
+
+    print_test_result("scan_file() - Compressed csv with workers", True)
+
+# ==================== sketch tests ====================
+
+def test_hyperloglog_estimate_and_merge():
+    """hll should be within a few percent and merge like a set union"""
+    a = HyperLogLog().update(pd.Series(range(0, 60000)))
+    b = HyperLogLog().update(pd.Series(range(40000, 100000)))
+    assert abs(a.estimate() - 60000) / 60000 < 0.05, f"Estimate too far off: {a.estimate()}"
+    union = HyperLogLog().update(pd.Series(range(0, 100000)))
+    assert np.array_equal(a.merge(b).registers, union.registers), "Merge should equal union"
+    assert HyperLogLog().update(pd.Series(['x', 'y', 'x', None])).estimate() == 2
+
+    print_test_result("HyperLogLog - Estimate and merge", True)
+
+def test_kll_quantiles():
+    """kll should be exact when small and close when big"""
+    small = KLLSketch().update([25, 30, -5, 200, 35, 28])
+    assert small.quantiles([0.0, 1.0]) == [-5.0, 200.0], "Small sketch should be exact"
+
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=200000)
+    sketch = KLLSketch()
+    for part in np.array_split(values, 20):
+        sketch.merge(KLLSketch().update(part))
+    assert sum(len(level) for level in sketch.levels) < 1000, "Sketch should stay small"
+    for q in (0.01, 0.5, 0.99):
+        rank = np.mean(values <= sketch.quantiles([q])[0])
+        assert abs(rank - q) < 0.02, f"Quantile {q} off by rank {rank - q:.3f}"
+
+    print_test_result("KLLSketch - Quantiles", True)
+
+def test_metadata_distribution_stats():
+    """metadata should carry distinct counts and quantiles"""
+    meta = get_metadata(pd.read_csv("dirty_data.csv"))
+    assert meta['stats']['Email']['distinct'] == 5, "alice@gmail.com appears twice"
+    assert meta['stats']['Age']['quantiles']['p99'] == 200.0, "Age=200 should show in p99"
+    assert meta['stats']['Age']['quantiles']['p1'] == -5.0, "Age=-5 should show in p1"
+
+    print_test_result("get_metadata() - Distribution stats", True)
+
+# ==================== rule engine tests ====================
+
+def findings_by_rule(trail):
+    """(rule, column) -> count, to compare audit trails"""
+    return {(item['rule'], item['column']): item['count'] for item in trail}
+
+def test_rules_dirty_data():
+    """the rule engine should catch the known problems in dirty_data.csv"""
+    trail, timings = run_rules(pd.read_csv("dirty_data.csv"))
+    found = findings_by_rule(trail)
+
+    assert found[('impossible_numbers', 'Age')] == 2, "Age=-5 and Age=200 should be flagged"
+    assert found[('invalid_emails', 'Email')] == 1, "bob_at_gmail.com should be flagged"
+    assert found[('duplicate_keys', 'Email')] == 1, "alice@gmail.com appears twice"
+    assert ('impossible_numbers', 'Spend') not in found, "Spend has no negatives"
+    assert set(timings) == set(RULES), "Every rule should report its timing"
+    for item in trail:
+        assert 'description' in item and 'suggested_fix' in item, "Items need description and fix"
+
+    print_test_result("RuleEngine - dirty_data.csv", True)
+
+def test_rules_messy_sample():
+    """impossible dates and missing values in messy_sample.csv"""
+    trail, _ = run_rules(pd.read_csv("messy_sample.csv"))
+    found = findings_by_rule(trail)
+
+    assert found[('impossible_dates', 'start_date')] == 1, "2024-02-30 should be flagged"
+    assert found[('missing_values', 'age')] == 1
+    fix = next(item['fix_function'] for item in trail if item['rule'] == 'missing_values')
+    assert callable(fix), "Missing values should keep a fix_function"
+
+    print_test_result("RuleEngine - messy_sample.csv", True)
+
+def test_rules_chunked_and_parallel():
+    """chunked and parallel rule passes should match a single pass"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp)
+        # repeat some ids so duplicates cross chunk boundaries
+        df = pd.read_csv(path)
+        df.loc[1500:1510, 'id'] = 3
+        df.to_csv(path, index=False)
+        serial = findings_by_rule(run_rules(df)[0])
+
+        chunked = RuleEngine()
+        stream_metadata(path, 128, engine=chunked)
+        parallel = RuleEngine()
+        profile_file_parallel(path, workers=2, chunksize=100, engine=parallel)
+
+    assert serial[('duplicate_keys', 'id')] == 11, "11 repeated ids expected"
+    assert findings_by_rule(chunked.audit_trail()) == serial, "Chunked rules should match"
+    assert findings_by_rule(parallel.audit_trail()) == serial, "Parallel rules should match"
+
+    print_test_result("RuleEngine - Chunked and parallel", True)
+
+def test_metadata_findings():
+    """findings from metadata alone keep the old audit_trail shape"""
+    trail = metadata_findings({'null_counts': {'A': 0, 'B': 2}})
+    assert len(trail) == 1
+    assert trail[0]['description'] == "Column 'B' has 2 missing values."
+    assert trail[0]['suggested_fix'] == "Fill or drop missing values in 'B'"
+
+    print_test_result("metadata_findings() - Old trail shape", True)
+
+# ==================== auto-fix tests ====================
+
+def test_fix_plan_matches_fix_functions():
+    """the fix plan should give the same result as chaining fix_functions"""
+    df = pd.read_csv("messy_sample.csv")
+    trail, _ = run_rules(df)
+    chained = df
+    for item in trail:
+        if callable(item.get('fix_function')):
+            chained = item['fix_function'](chained)
+
+    plan = build_fix_plan(trail)
+    assert plan.columns == ['name', 'age', 'salary'], f"Unexpected plan columns {plan.columns}"
+    fixed = plan.fit(df).apply(df)
+    assert fixed is df, "Plan should update the frame in place"
+    assert fixed.equals(chained), "Plan and fix_functions should agree"
+    assert fixed.isna().sum().sum() == 0, "No missing values should be left"
+
+    print_test_result("FixPlan - Matches fix_functions", True)
+
+def test_fix_plan_streaming():
+    """fill values fitted from chunks should match the in-memory ones"""
+    df = pd.read_csv("messy_sample.csv")
+    plan = build_fix_plan(run_rules(df)[0]).fit(df)
+    streamed = build_fix_plan(run_rules(df)[0])
+    streamed.fit_chunks(pd.read_csv("messy_sample.csv", chunksize=2, usecols=streamed.columns))
+    assert streamed.values == plan.values, f"{streamed.values} != {plan.values}"
+
+    print_test_result("FixPlan - Streaming fit", True)
+
+def test_frequent_items():
+    """frequent items should find the mode, smallest value on ties"""
+    items = FrequentItems(capacity=4)
+    items.update(pd.Series(['b', 'a', 'b', 'a', None]))
+    assert items.top() == 'a', "Ties should go to the smallest value like mode()"
+    for i in range(50):
+        items.update(pd.Series([f'rare{i}', 'hot', 'hot']))
+    assert items.top() == 'hot', "Heavy hitter should survive"
+    assert len(items.counts) <= 4, "Should keep at most capacity counters"
+
+    print_test_result("FrequentItems - Mode", True)
+
+# ==================== cache tests ====================
+
+class FakeClock:
+    """a clock the cache tests can move forward by hand"""
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+def test_cache_key_stable():
+    """same metadata/model/prompt -> same key, any change -> new key"""
+    meta = get_metadata(pd.read_csv("dirty_data.csv"))
+    again = get_metadata(pd.read_csv("dirty_data.csv"))
+    key = cache_key(meta, "m1", config.AUDIT_PROMPT)
+    assert key == cache_key(again, "m1", config.AUDIT_PROMPT), "Key should be stable"
+    assert key != cache_key(meta, "m2", config.AUDIT_PROMPT), "Model should change the key"
+    assert key != cache_key(meta, "m1", config.AUDIT_PROMPT + "!"), "Prompt should change the key"
+
+    print_test_result("cache_key() - Stable", True)
+
+def test_cache_ttl_lru_and_counters():
+    """entries expire, old ones get evicted, hits and misses are counted once per lookup"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clock = FakeClock()
+        cache = ResponseCache(os.path.join(tmp, "c.sqlite"), ttl_seconds=60, max_entries=2, clock=clock)
+        cache.put("a", "summary a")
+        clock.now += 1
+        cache.put("b", "summary b")
+        clock.now += 1
+        assert cache.get("a") == "summary a", "Fresh entry should hit"
+        clock.now += 1
+        cache.put("c", "summary c")  # b is least recently used now
+        assert cache.get("b") is None, "LRU entry should be evicted"
+        clock.now += 120
+        assert cache.get("a") is None, "Expired entry should miss"
+        # several keys for one request (one per model) count once
+        assert cache.get_first(["x", "y", "z"]) == (None, None)
+        cache.put("d", "summary d")
+        assert cache.get_first(["x", "d"]) == ("d", "summary d")
+        stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3, f"Unexpected counters {stats}"
+
+    print_test_result("ResponseCache - TTL, LRU, counters", True)
+
+def test_get_ai_audit_uses_cache():
+    """a cached summary should come back without calling gemini"""
+    meta = get_metadata(pd.read_csv("dirty_data.csv"))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "c.sqlite"))
+        model = config.get_model_candidates()[0]
+        cache.put(cache_key(meta, model, build_prompt(meta)), "cached summary")
+        summary = get_ai_audit(meta, "not-a-real-key", cache=cache)
+        stats = cache.stats()
+        # other findings make another prompt, so the old summary does not fit it
+        trail = run_rules(pd.read_csv("dirty_data.csv"))[0]
+        other = cache.get(cache_key(meta, model, build_prompt(meta, trail)))
+    assert summary == "cached summary", f"Expected the cached summary, got {summary!r}"
+    assert stats["hits"] == 1
+    assert other is None, "Findings are part of the prompt, so of the key"
+
+    print_test_result("get_ai_audit() - Uses cache", True)
+
+# ==================== scheduler tests ====================
+
+def run_scheduler(jobs, base_url, **options):
+    """run an AuditScheduler against the stub server"""
+    os.environ["GEMINI_BASE_URL"] = base_url
+    try:
+        async def go():
+            scheduler = AuditScheduler(gemini_generate("stub-key"), models=["stub-model"],
+                                       base_delay=0.01, **options)
+            return await scheduler.run(jobs), scheduler.stats
+        return asyncio.run(go())
+    finally:
+        del os.environ["GEMINI_BASE_URL"]
+
+def test_retry_hint():
+    """retry hints from 429 messages should be parsed"""
+    assert retry_hint("Please retry in 12.5s.") == 12.5
+    assert retry_hint("{'retryDelay': '3s'}") == 3.0
+    assert retry_hint("some other error") is None
+
+    print_test_result("retry_hint() - Parse hints", True)
+
+def test_token_bucket_rate():
+    """the token bucket should space calls out"""
+    async def go():
+        bucket = TokenBucket(rate=20, burst=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+    elapsed = asyncio.run(go())
+    assert elapsed >= 0.18, f"5 calls at 20/s should take ~0.2s, took {elapsed:.3f}s"
+
+    print_test_result("TokenBucket - Rate", True)
+
+def test_scheduler_retries_429():
+    """429s from the stub should be retried until every file has a summary"""
+    server, state, url = start_stub(fail_first=3, retry_delay=0.02)
+    try:
+        jobs = {f"file{i}.csv": {"columns": [f"c{i}"]} for i in range(6)}
+        results, stats = run_scheduler(jobs, url, concurrency=3, requests_per_minute=6000)
+    finally:
+        server.shutdown()
+    assert set(results) == set(jobs), "Every file should get a result"
+    assert all(text.startswith("stub audit") for text in results.values()), results
+    assert state.rate_limited == 3 and stats["retries"] == 3, f"Expected 3 retries, got {stats}"
+
+    print_test_result("AuditScheduler - Retries 429", True)
+
+def test_scheduler_packs_small_files():
+    """small files should share one request and get their own section back"""
+    server, state, url = start_stub()
+    try:
+        jobs = {f"file{i}.csv": {"columns": [f"c{i}"]} for i in range(5)}
+        results, stats = run_scheduler(jobs, url, pack_max_chars=1000)
+    finally:
+        server.shutdown()
+    assert state.calls == 1, f"Expected 1 packed call, got {state.calls}"
+    for name, text in results.items():
+        assert text == f"stub audit for {name} by stub-model.", f"Wrong section for {name}: {text!r}"
+
+    print_test_result("AuditScheduler - Packs small files", True)
+
+def test_split_sections_known_names():
+    """only file headings of packed names split the answer, markdown headings stay in"""
+    text = ("Here is the audit.\n"
+            "=== FILE: a.csv ===\n### Outliers\nage has 3.\n### Missing values\nnone.\n"
+            "=== FILE: notes.csv ===\nquoted by the model.\n"
+            "=== FILE: b.csv ===\nfine.\n")
+    sections = split_sections(text, ["a.csv", "b.csv"])
+    assert set(sections) == {"a.csv", "b.csv"}, sections
+    assert sections["a.csv"].startswith("### Outliers") and "### Missing values" in sections["a.csv"]
+    assert sections["a.csv"].endswith("=== FILE: notes.csv ===\nquoted by the model."), sections["a.csv"]
+    assert sections["b.csv"] == "fine."
+    assert split_sections("### a.csv\nold style", ["a.csv"]) == {}
+
+    print_test_result("split_sections() - Known file headings only", True)
+
+# ==================== service tests ====================
+
+def post_json(url, body):
+    """post json and return (status, parsed body)"""
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_service_audit():
+    """the service should return findings and a summary as json"""
+    from service import AuditService, make_server
+    stub, _, stub_url = start_stub()
+    os.environ["GEMINI_BASE_URL"] = stub_url
+    os.environ["DATASIGHT_CACHE"] = "off"
+    service = AuditService(workers=1, api_key="stub-key")
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, body = post_json(url + "/audit", {"file": "dirty_data.csv"})
+        again, _ = post_json(url + "/audit", {"file": "dirty_data.csv", "ai": False})
+        missing, _ = post_json(url + "/audit", {"file": "no_such_file.csv"})
+        with urllib.request.urlopen(url + "/health", timeout=10) as response:
+            health = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+        stub.shutdown()
+        del os.environ["GEMINI_BASE_URL"], os.environ["DATASIGHT_CACHE"]
+
+    assert status == 200 and again == 200, f"Expected 200s, got {status}/{again}"
+    assert body["rows"] == 6
+    rules = {(item["rule"], item["column"]) for item in body["audit_trail"]}
+    assert ("impossible_numbers", "Age") in rules, "Rule findings should be in the response"
+    assert body["summary"].startswith("stub audit"), f"Unexpected summary {body['summary']!r}"
+    assert missing == 404, "Missing files should give 404"
+    assert health["served"] == 2, f"Two audits should have been served, got {health}"
+
+    print_test_result("AuditService - Audit over http", True)
+
+# ==================== serializer tests ====================
+
+def test_serializer_small_table():
+    """small tables should keep every column and the head preview"""
+    meta = get_metadata(pd.read_csv("messy_sample.csv"))
+    text, info = serialize_metadata(meta, token_budget=2000)
+    assert info["columns_detailed"] == 6 and info["head_included"], f"Unexpected info {info}"
+    assert "age|float64|1|" in text, "Age stats should be on one line"
+    assert "2024-02-30" in text, "Head values should be included"
+    assert info["estimated_tokens"] < len(repr(meta)) // 4, "Compact form should be smaller than repr"
+    assert "age|float64" in build_prompt(meta), "Prompt should use the compact form"
+
+    print_test_result("serialize_metadata() - Small table", True)
+
+def test_serializer_wide_table_budget():
+    """a 5,000-column table should stay within the token budget"""
+    wide = pd.DataFrame({f"c{i}": [i, None if i % 500 == 0 else 1, i * 2] for i in range(5000)})
+    meta = get_metadata(wide)
+    text, info = serialize_metadata(meta, token_budget=1500, flagged=["c4999"])
+    assert info["estimated_tokens"] <= 1500, f"Over budget: {info['estimated_tokens']}"
+    assert info["columns_detailed"] + info["columns_summarized"] == 5000, "Every column should be counted"
+    assert text.splitlines()[2].startswith("c4999"), "Flagged columns should come first"
+    assert info["columns_summarized"] > 0 and "more columns not shown" in text, "Rest should be summarized"
+
+    print_test_result("serialize_metadata() - Wide table budget", True)
+
 # ==================== run all tests ====================
 
+# ==================== columnar format tests ====================
+
+def test_columnar_matches_csv():
+    """parquet and feather should profile like the same data as csv"""
+    if pyarrow is None:
+        print_test_result("Columnar formats - Matches csv (skipped, no pyarrow)", True)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp)
+        df = pd.read_csv(path)
+        expected = get_metadata(df)
+        for name, write in (("sample.parquet", df.to_parquet), ("sample.feather", df.to_feather)):
+            target = os.path.join(tmp, name)
+            write(target)
+            os.rename(target, target + ".bin")  # no extension: fall back to magic bytes
+            target += ".bin"
+            assert detect_format(target) in ("parquet", "arrow"), f"{name} not detected"
+            _, metadata, _ = scan_file(target)
+            assert_same_metadata(metadata, expected, name)
+            _, streamed, engine = scan_file(target, chunksize=300)
+            assert_same_metadata(streamed, expected, name + " streamed")
+            assert findings_by_rule(engine.audit_trail()) == findings_by_rule(run_rules(df)[0])
+
+    print_test_result("Columnar formats - Matches csv", True)
+
+def test_parquet_projection_footer_nulls():
+    """a projected parquet read still reports nulls for the other columns"""
+    if pyarrow is None:
+        print_test_result("Parquet - Projection + footer nulls (skipped, no pyarrow)", True)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        df = pd.read_csv(write_sample_csv(tmp))
+        path = os.path.join(tmp, "sample.parquet")
+        df.to_parquet(path, row_group_size=500)
+        footer = parquet_footer_stats(path)
+        assert footer["row_count"] == len(df)
+        assert footer["columns"]["age"]["nulls"] == df["age"].isna().sum()
+        assert footer["columns"]["spend"]["max"] == df["spend"].max()
+        assert list(read_frame(path, columns=["id"]).columns) == ["id"]
+
+        loaded, metadata, engine = scan_file(path, columns=["id", "spend"])
+        assert list(loaded.columns) == ["id", "spend"], "Only projected columns should be decoded"
+        assert metadata["null_counts"]["email"] == df["email"].isna().sum()
+        assert metadata["stats"]["age"]["min"] == df["age"].min()
+        missing = {item["column"] for item in engine.audit_trail() if item["rule"] == "missing_values"}
+        assert missing == {"age", "email"}, f"Unexpected missing-value columns {missing}"
+
+        out = write_fixed(path, engine.audit_trail(), loaded, out_file=os.path.join(tmp, "fixed.parquet"))
+        fixed = pd.read_parquet(out)
+        assert list(fixed.columns) == list(df.columns) and fixed.isna().sum().sum() == 0
+
+    print_test_result("Parquet - Projection + footer nulls", True)
+
+def test_tsv_and_semicolon_csv():
+    """tab and semicolon separated files profile like the comma csv in every mode"""
+    with tempfile.TemporaryDirectory() as tmp:
+        df = pd.read_csv(write_sample_csv(tmp))
+        expected = get_metadata(df)
+        for name, sep in (("sample.tsv", "\t"), ("semi.csv", ";")):
+            path = os.path.join(tmp, name)
+            df.to_csv(path, index=False, sep=sep)
+            assert csv_separator(path) == sep
+            for options in ({}, {"chunksize": 300}, {"workers": 2}):
+                _, metadata, engine = scan_file(path, **options)
+                assert_same_metadata(metadata, expected, f"{name} {options}")
+                assert findings_by_rule(engine.audit_trail()) == findings_by_rule(run_rules(df)[0]), options
+            metadata, _, _ = incremental_scan(path, folder=tmp)
+            assert_same_metadata(metadata, expected, name + " incremental")
+            _, lean, _ = scan_file(path, lean=True)
+            assert dict(lean["null_counts"]) == dict(expected["null_counts"]), "Lean reads should split columns too"
+            _, sampled, _ = scan_file(path, sample=200, sample_mode="blocks")
+            assert list(sampled["columns"]) == list(df.columns), "Blocks should split on the same separator"
+
+        loaded, _, engine = scan_file(os.path.join(tmp, "sample.tsv"))
+        out = write_fixed(os.path.join(tmp, "sample.tsv"), engine.audit_trail(), loaded,
+                          out_file=os.path.join(tmp, "fixed.tsv"))
+        assert list(pd.read_csv(out, sep="\t").columns) == list(df.columns), "A .tsv should be written with tabs"
+
+    print_test_result("Delimiters - tsv and semicolon csv", True)
+
+# ==================== lean ingestion tests ====================
+
+def test_lean_read_downcasts_and_widens():
+    """compact dtypes from a sample, widened when later rows do not fit"""
+    n = 3000
+    df = pd.DataFrame({
+        'small': [i % 100 for i in range(n)],
+        'half': [i * 0.5 for i in range(n)],
+        'tenth': [i * 0.1 for i in range(n)],
+        'city': [['oslo', 'lima', 'pune'][i % 3] for i in range(n)],
+        'late_big': [300000 if i == 2500 else 1 for i in range(n)],
+        'late_null': [None if i == 2900 else 5 for i in range(n)],
+        'late_text': ['oops' if i == 2800 else 7 for i in range(n)],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lean.csv")
+        df.to_csv(path, index=False)
+        schema = infer_schema(path, sample_rows=500)
+        lean, report = read_lean(path, sample_rows=500, chunksize=700)
+        full = pd.read_csv(path)
+    assert schema['small'] == 'uint8' and schema['half'] == 'float32' and schema['tenth'] == 'float64'
+    assert str(lean['city'].dtype) == 'category', "Low-cardinality text should be a category"
+    assert str(lean['late_big'].dtype) == 'uint32', f"late_big should widen, got {lean['late_big'].dtype}"
+    assert set(report['widened']) == {'late_big', 'late_text'}, report['widened']
+    for col in ['small', 'half', 'tenth', 'late_big', 'late_null']:
+        assert np.allclose(full[col].to_numpy(float), lean[col].to_numpy(float), equal_nan=True), f"{col} changed"
+    assert lean['late_text'].astype(str).tolist() == full['late_text'].astype(str).tolist()
+    saved = sum(m['before'] - m['after'] for m in report['memory'].values())
+    assert saved > 0, "Lean read should use less memory"
+
+    print_test_result("read_lean() - Downcast + widen", True)
+
+def test_lean_audit_matches_default():
+    """a lean load should give the same findings and fixes as a plain one"""
+    _, plain_meta, plain = scan_file("messy_sample.csv")
+    df, lean_meta, lean = scan_file("messy_sample.csv", lean=True)
+    assert "memory" in df.attrs, "Memory report should be attached to the frame"
+    assert plain_meta['null_counts'] == lean_meta['null_counts']
+    assert findings_by_rule(plain.audit_trail()) == findings_by_rule(lean.audit_trail())
+    plan = build_fix_plan(lean.audit_trail()).fit(df)
+    assert plan.apply(df)[plan.columns].isna().sum().sum() == 0, "Fixes should fill categorical columns too"
+
+    print_test_result("scan_file(lean=True) - Matches default", True)
+
+# ==================== checkpoint tests ====================
+
+def test_incremental_scan_appends():
+    """appended rows are profiled alone and merged; a changed prefix means a full pass"""
+    df = pd.DataFrame({
+        'id': range(3000),
+        'age': [None if i % 7 == 0 else i % 130 for i in range(3000)],
+        'email': [f"u{i % 2500}@x.com" if i % 9 else "bad" for i in range(3000)],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feed.csv")
+        df.iloc[:2000].to_csv(path, index=False)
+        _, _, info = incremental_scan(path, folder=tmp)
+        assert info['mode'] == 'full' and info['reason'] == 'no checkpoint', info
+
+        df.iloc[2000:].to_csv(path, index=False, header=False, mode='a')
+        metadata, engine, info = incremental_scan(path, chunksize=400, folder=tmp)
+        assert info['mode'] == 'incremental' and info['new_rows'] == 1000, info
+        full = pd.read_csv(path)
+        assert_same_metadata(metadata, get_metadata(full), "incremental")
+        assert findings_by_rule(engine.audit_trail()) == findings_by_rule(run_rules(full)[0])
+
+        _, _, info = incremental_scan(path, folder=tmp)
+        assert info['new_bytes'] == 0, "Nothing new should be read"
+
+        df.assign(age=df['age'].fillna(1)).to_csv(path, index=False)
+        metadata, _, info = incremental_scan(path, folder=tmp)
+        assert info['mode'] == 'full' and info['reason'] == 'already audited rows changed', info
+        assert metadata['null_counts']['age'] == 0
+
+    print_test_result("incremental_scan() - Append + changed prefix", True)
+
+def test_incremental_scan_outliers():
+    """outliers in the old and the appended rows are both found; other options mean a full pass"""
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({'id': range(3000), 'score': rng.uniform(-1, 1, 3000).round(3)})
+    df.loc[[5, 2500], 'score'] = [40.0, -50.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feed.csv")
+        df.iloc[:2000].to_csv(path, index=False)
+        incremental_scan(path, folder=tmp, outliers="mad")
+        df.iloc[2000:].to_csv(path, index=False, header=False, mode='a')
+        _, engine, info = incremental_scan(path, folder=tmp, outliers="mad")
+        assert info['mode'] == 'incremental', info
+        found = {item['column']: item for item in engine.audit_trail() if item['rule'] == 'outliers'}
+        assert found['score']['count'] == 2 and "rows [5, 2500]" in found['score']['description'], found
+
+        _, engine, info = incremental_scan(path, folder=tmp, outliers=False)
+        assert info['reason'] == 'outlier options changed', info
+        assert not any(item['rule'] == 'outliers' for item in engine.audit_trail())
+
+    print_test_result("incremental_scan() - Outliers across the append", True)
+
+def test_incremental_scan_key_index():
+    """repeated keys stay exact over many appends while the checkpoint holds no rows"""
+    emails = [f"u{(i * 3) % 3500}@x.com" for i in range(6000)]
+    df = pd.DataFrame({'id': range(6000), 'email': emails})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feed.csv")
+        df.iloc[:1000].to_csv(path, index=False)
+        incremental_scan(path, folder=tmp)
+        for start in range(1000, 6000, 1000):
+            df.iloc[start:start + 1000].to_csv(path, index=False, header=False, mode='a')
+            _, engine, info = incremental_scan(path, folder=tmp)
+            assert info['mode'] == 'incremental', info
+            expected = findings_by_rule(run_rules(df.iloc[:start + 1000])[0])
+            assert findings_by_rule(engine.audit_trail()) == expected, start
+        with open(checkpoint_path(path, tmp), "rb") as f:
+            state = pickle.load(f)
+        rule = next(rule for rule in state["engine"].rules if rule.name == "duplicate_keys")
+        assert not rule.finders and set(rule.seen) == {'id', 'email'}, "Fingerprints belong in the index files"
+        assert len(rule.seen['id']) == 6000 and len(rule.seen['email']) == 3500
+        runs = {name for index in rule.seen.values() for name, _ in index.runs}
+        assert set(os.listdir(index_folder(path, tmp))) == runs, "Old runs should be deleted"
+        assert len(rule.seen['id'].runs) <= 3, rule.seen['id'].runs
+
+    print_test_result("incremental_scan() - Repeated keys from index files", True)
+
+def test_incremental_compressed_full_scan():
+    """--incremental on a .csv.gz says so and does a full scan instead of seeking into it"""
+    from main import run_audit
+    with tempfile.TemporaryDirectory() as tmp:
+        df = pd.read_csv(write_sample_csv(tmp))
+        path = os.path.join(tmp, "feed.csv.gz")
+        df.to_csv(path, index=False)
+        try:
+            incremental_scan(path, folder=tmp)
+            assert False, "Expected a ValueError"
+        except ValueError as e:
+            assert "uncompressed" in str(e)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            run_audit(path, offline=True, incremental=True)
+    printed = out.getvalue()
+    assert "needs an uncompressed csv" in printed and "Error" not in printed, printed
+    assert "missing_values" in printed or "missing values" in printed, printed
+
+    print_test_result("run_audit(incremental=True) - Compressed csv", True)
+
+# ==================== benchmark tests ====================
+
+def test_messy_generator_rates():
+    """generated data should carry the requested kinds of mess"""
+    df = make_messy(20000, columns=12, null_rate=0.1, bad_email_rate=0.05, outlier_rate=0.0, bad_date_rate=0.0)
+    assert df.shape == (20000, 12), f"Unexpected shape {df.shape}"
+    assert abs(df['age'].isna().mean() - 0.1) < 0.02, "Null rate should be close to 10%"
+    found = {rule for rule, _ in findings_by_rule(run_rules(df)[0])}
+    assert 'invalid_emails' in found and 'impossible_numbers' not in found, found
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_messy(os.path.join(tmp, "m.csv"), 2500, columns=8, chunk_rows=1000)
+        written = pd.read_csv(path)
+    assert len(written) == 2500 and written['id'].is_unique, "Chunks should continue the ids"
+
+    print_test_result("benchmarks.generate - Mess rates", True)
+
+def test_benchmark_runner_against_stub():
+    """a tiny benchmark run should time every stage and call the stub"""
+    result = run_benchmark(rows=500, columns=8, mode="both", repeat=1, chunksize=200)
+    stages = [r['stage'] for r in result['results']]
+    assert stages == ['read_csv', 'get_metadata', 'rule_pass', 'ai_audit', 'auto_fix', 'write_csv',
+                      'stream_scan', 'stream_ai_audit', 'stream_fix'], stages
+    assert result['stub_calls'] >= 4, "ai stages should hit the stub, not gemini"
+    assert json.loads(json.dumps(result))['params']['rows'] == 500
+
+    print_test_result("benchmarks.run - Stages + stub", True)
+
+# ==================== profiling tests ====================
+
+def test_run_audit_profile():
+    """--profile should record every stage, as json or a chrome trace"""
+    from main import run_audit
+    stub, _, stub_url = start_stub()
+    os.environ.update(GEMINI_BASE_URL=stub_url, DATASIGHT_CACHE="off", GEMINI_API_KEY="stub-key")
+    seen = []
+    hook = add_hook(seen.append)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "messy.csv")
+            pd.read_csv("messy_sample.csv").to_csv(path, index=False)
+            out = os.path.join(tmp, "profile.json")
+            run_audit(path, auto_fix=True, profile=out)
+            with open(out) as f:
+                profile = json.load(f)
+            assert os.path.exists(os.path.join(tmp, "fixed_messy.csv")), "Fixed file should sit next to the input"
+            trace = os.path.join(tmp, "trace.json")
+            run_audit(path, chunksize=2, profile=trace, profile_format="chrome")
+            with open(trace) as f:
+                events = json.load(f)["traceEvents"]
+    finally:
+        remove_hook(hook)
+        stub.shutdown()
+        for key in ("GEMINI_BASE_URL", "DATASIGHT_CACHE", "GEMINI_API_KEY"):
+            del os.environ[key]
+
+    stages = [s["stage"] for s in profile["stages"]]
+    assert stages == ["read", "metadata", "rules", "prompt", "gemini", "fix", "write"], stages
+    read = profile["stages"][0]
+    assert read["rows"] == len(pd.read_csv("messy_sample.csv")) and read["rows_per_s"] > 0 and read["cpu_s"] >= 0
+    assert profile["total_wall_s"] > 0
+    assert [e["name"] for e in events] == ["scan", "prompt", "gemini"], events
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert [s["stage"] for s in seen] == stages + ["scan", "prompt", "gemini"], "Hooks should see every stage"
+
+    print_test_result("run_audit(profile=...) - Stage timings", True)
+
+# ==================== startup tests ====================
+
+def import_time_us(module):
+    """cumulative import time of a module in a fresh interpreter, from -X importtime."""
+    import subprocess
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True).stderr
+    for line in out.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise AssertionError(f"no importtime line for {module}")
+
+def test_main_imports_fast():
+    """importing main must not pull in pandas or the gemini sdk"""
+    import subprocess
+    check = "import sys, {}; print(sorted(m for m in ('pandas', 'google.genai') if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, "-c", check.format("main")],
+                            capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "[]", f"Heavy modules loaded by main: {loaded}"
+    loaded = subprocess.run([sys.executable, "-c", check.format("core.interpreter")],
+                            capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "['pandas']", f"core.interpreter should load the sdk lazily: {loaded}"
+    micros = min(import_time_us("main") for _ in range(3))
+    assert micros < 200_000, f"import main took {micros / 1000:.0f}ms (pandas alone is ~500ms)"
+
+    print_test_result(f"main - Import time ({micros / 1000:.0f}ms)", True)
+
+def test_offline_never_loads_sdk():
+    """--offline gives rule findings without a key or the gemini sdk"""
+    import subprocess
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    env["DATASIGHT_CACHE"] = "off"
+    out = subprocess.run(
+        [sys.executable, "-c", "import sys, main; main.run_audit('messy_sample.csv', offline=True); "
+         "print('sdk loaded:', 'google.genai' in sys.modules)"],
+        capture_output=True, text=True, env=env, stdin=subprocess.DEVNULL, check=True).stdout
+    assert "offline mode, no ai summary. rule-based findings:" in out, out
+    assert "impossible values" in out, "Rule findings should still be printed"
+    assert "sdk loaded: False" in out, out
+
+    print_test_result("run_audit(offline=True) - Rules only", True)
+
+# ==================== streaming summary tests ====================
+
+def test_get_ai_audit_streams():
+    """summary pieces should arrive one by one, with time to first token recorded"""
+    meta = get_metadata(pd.read_csv("dirty_data.csv"))
+    stub, state, url = start_stub(chunk_delay=0.05)
+    os.environ["GEMINI_BASE_URL"] = url
+    pieces, metrics = [], {}
+    try:
+        summary = get_ai_audit(meta, "stub-key", cache=None, on_text=pieces.append, metrics=metrics)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(os.path.join(tmp, "c.sqlite"))
+            get_ai_audit(meta, "stub-key", cache=cache)
+            cached_pieces, cached_metrics = [], {}
+            cached = get_ai_audit(meta, "stub-key", cache=cache, on_text=cached_pieces.append, metrics=cached_metrics)
+    finally:
+        stub.shutdown()
+        del os.environ["GEMINI_BASE_URL"]
+
+    assert len(pieces) > 1, f"Expected several streamed pieces, got {pieces}"
+    assert "".join(pieces) == summary and summary.startswith("stub audit"), summary
+    assert 0 < metrics["ttft_s"] < metrics["total_s"], metrics
+    assert metrics["model"] == config.get_model_candidates()[0] and not metrics["cached"]
+    assert cached_pieces == [cached] and cached_metrics["cached"], "A cached summary arrives as one piece"
+
+    print_test_result("get_ai_audit(on_text=...) - Streams + ttft", True)
+
+# ==================== model probe tests ====================
+
+def test_probe_ranks_models():
+    """probing should rank by errors then latency, and get_model_candidates should read the saved ranking"""
+    delays = {"slow": 0.04, "fast": 0.005}
+    in_flight, peak = [0], [0]
+
+    async def generate(model_name, prompt):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        try:
+            if model_name == "broken":
+                raise RuntimeError("429 quota")
+            await asyncio.sleep(delays[model_name])
+            return "x" * 400
+        finally:
+            in_flight[0] -= 1
+
+    ranked = asyncio.run(model_picker.probe_models(["slow", "broken", "fast"], generate, "prompt", rounds=4, concurrency=3))
+    assert [r["model"] for r in ranked] == ["fast", "slow", "broken"], ranked
+    assert ranked[0]["calls"] == 4 and ranked[0]["errors"] == 0 and ranked[0]["p50_s"] <= ranked[0]["p95_s"]
+    assert ranked[2]["error_rate"] == 1 and "429" in ranked[2]["last_error"]
+    assert ranked[0]["tokens_per_s"] > ranked[1]["tokens_per_s"]
+    assert 1 < peak[0] <= 3, f"Expected concurrent calls capped at 3, got {peak[0]}"
+
+    old_model = os.environ.pop("GEMINI_MODEL", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATASIGHT_MODEL_RANKING"] = os.path.join(tmp, "ranking.json")
+        try:
+            model_picker.save_ranking(ranked)
+            assert config.get_model_candidates() == ["fast", "slow"], "Broken models are left out"
+            os.environ["GEMINI_MODEL"] = "slow"
+            assert config.get_model_candidates() == ["slow", "fast"], "GEMINI_MODEL still goes first"
+            del os.environ["GEMINI_MODEL"]
+            flaky = [dict(ranked[0], model=f"m{i}", error_rate=rate) for i, rate in enumerate([0, 0.5, 0, 0, 0.1])]
+            model_picker.save_ranking(flaky)
+            assert config.get_model_candidates() == ["m0", "m2", "m3"], "Flaky models are left out, the list is capped"
+            model_picker.save_ranking(ranked, ttl_seconds=-1)
+            assert config.load_model_ranking() == []
+            assert config.get_model_candidates() == ["gemini-2.0-flash"], "Expired rankings are ignored"
+        finally:
+            del os.environ["DATASIGHT_MODEL_RANKING"]
+            os.environ.pop("GEMINI_MODEL", None)
+            if old_model is not None:
+                os.environ["GEMINI_MODEL"] = old_model
+
+    print_test_result("probe_models() - Ranked + cached with expiry", True)
+
+# ==================== hedging tests ====================
+
+def test_hedged_call_races_models():
+    """a slow first model gets hedged, the fast answer wins and the slow call is cancelled"""
+    cancelled = []
+
+    async def call(model_name):
+        try:
+            await asyncio.sleep({"slow": 1.0, "fast": 0.01}[model_name])
+        except asyncio.CancelledError:
+            cancelled.append(model_name)
+            raise
+        return f"answer from {model_name}"
+
+    stats = LatencyStats()
+    for _ in range(5):
+        stats.finished("slow", 0.05, ok=True)  # usually quick, so hedge after ~0.5s (the floor)
+    start = time.perf_counter()
+    model, text = asyncio.run(hedged_call(call, ["slow", "fast"], stats, HedgeBudget(max_extra=0.1, burst=1)))
+    elapsed = time.perf_counter() - start
+    assert (model, text) == ("fast", "answer from fast") and cancelled == ["slow"], (model, cancelled)
+    assert elapsed < 0.9, f"Expected the hedge to answer before the slow model, took {elapsed:.2f}s"
+    report = stats.report()
+    assert report["fast"]["hedges"] == 1 and report["fast"]["wins"] == 1 and report["slow"]["calls"] == 1
+
+    # no budget: wait for the first model instead of spending extra quota
+    model, _ = asyncio.run(hedged_call(call, ["slow", "fast"], stats, HedgeBudget(max_extra=0)))
+    assert model == "slow" and stats.report()["fast"]["calls"] == 1
+
+    # failures still hand over straight away, and all of them are reported
+    async def broken(model_name):
+        raise RuntimeError(f"{model_name} down")
+    try:
+        asyncio.run(hedged_call(broken, ["a", "b"], LatencyStats(), HedgeBudget()))
+        assert False, "Expected HedgeFailed"
+    except HedgeFailed as e:
+        assert [name for name, _ in e.errors] == ["a", "b"]
+
+    print_test_result("hedged_call() - Fastest model wins", True)
+
+def test_hedged_call_clock_and_threads():
+    """waiting to send does not start the hedge timer; thread losers do not hold up the exit"""
+    async def queued(model_name, clock):
+        await asyncio.sleep(0.8)  # e.g. the rate limit, not the model
+        with clock:
+            await asyncio.sleep(0.02)
+        return f"answer from {model_name}"
+
+    stats = LatencyStats()
+    for _ in range(5):
+        stats.finished("a", 0.05, ok=True)
+    model, _ = asyncio.run(hedged_call(queued, ["a", "b"], stats, HedgeBudget(max_extra=1), clocked=True))
+    report = stats.report()
+    assert model == "a" and "b" not in report, "The wait before sending should not trigger a hedge"
+    assert report["a"]["p50_s"] < 0.5, "Only the request itself should be timed"
+
+    reads = []
+    real_ranking = config.load_model_ranking
+    config.load_model_ranking = lambda: reads.append(1) or [{"model": m, "p95_s": 0.1} for m in "abc"]
+    try:
+        def slow(model_name):
+            time.sleep({"a": 3.0, "b": 3.0, "c": 0.01}[model_name])
+            return f"answer from {model_name}"
+        model, _ = hedged_call_sync(slow, ["a", "b", "c"], LatencyStats(), HedgeBudget(max_extra=2))
+    finally:
+        config.load_model_ranking = real_ranking
+    assert model == "c" and len(reads) == 1, (model, reads)
+    losers = [t for t in threading.enumerate() if t.name in ("hedge-a", "hedge-b")]
+    assert losers and all(t.daemon for t in losers), "Losers should not keep the process alive"
+
+    print_test_result("hedged_call() - Request clock, daemon losers", True)
+
+def test_get_ai_audit_hedges_against_stub():
+    """get_ai_audit should answer from the second candidate when the first is slow"""
+    meta = get_metadata(pd.read_csv("dirty_data.csv"))
+    stub, state, url = start_stub(model_latency={"slow-model": 3.0})
+    old_model = os.environ.get("GEMINI_MODEL")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(GEMINI_BASE_URL=url, GEMINI_MODEL="slow-model",
+                          DATASIGHT_MODEL_RANKING=os.path.join(tmp, "ranking.json"))
+        try:
+            model_picker.save_ranking([{"model": "slow-model", "error_rate": 0, "p95_s": 0.1},
+                                       {"model": "fast-model", "error_rate": 0, "p95_s": 0.1}])
+            metrics = {}
+            start = time.perf_counter()
+            summary = get_ai_audit(meta, "stub-key", cache=None, metrics=metrics)
+            elapsed = time.perf_counter() - start
+        finally:
+            stub.shutdown()
+            for name in ("GEMINI_BASE_URL", "DATASIGHT_MODEL_RANKING"):
+                del os.environ[name]
+            if old_model is None:
+                del os.environ["GEMINI_MODEL"]
+            else:
+                os.environ["GEMINI_MODEL"] = old_model
+
+    assert metrics["model"] == "fast-model" and "by fast-model" in summary, summary
+    assert elapsed < 2.0, f"Expected the hedge to beat the slow model, took {elapsed:.2f}s"
+    assert latency_report()["fast-model"]["wins"] >= 1
+
+    print_test_result("get_ai_audit() - Hedged across candidates", True)
+
+# ==================== duplicate tests ====================
+
+def test_duplicate_finder_spills_exactly():
+    """spilled, chunked and merged fingerprints should count the same duplicates as pandas"""
+    base = make_messy(20_000, seed=3)
+    df = pd.concat([base, base.sample(3_000, random_state=1), base.iloc[:10]]).sample(frac=1, random_state=2)
+    df = df.reset_index(drop=True)
+    dup = df.duplicated()
+    expected = {"duplicates": int(dup.sum()), "groups": len(df[df.duplicated(keep=False)].drop_duplicates()),
+                "examples": df.index[dup][:5].tolist()}
+
+    def run(finder, merge_at=None):
+        if merge_at is None:
+            for start in range(0, len(df), 1_000):
+                finder.update(df.iloc[start:start + 1_000])
+            return finder.finish()
+        other = DuplicateFinder(spill_dir=finder.spill_dir, memory_mb=finder.memory_mb)
+        finder.update(df.iloc[:merge_at])
+        other.update(df.iloc[merge_at:].reset_index(drop=True))
+        return finder.merge(other, offset=merge_at).finish()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        in_memory = run(DuplicateFinder(spill_dir=tmp))
+        spilled = run(DuplicateFinder(memory_mb=0.05, partitions=8, spill_dir=tmp))
+        merged = run(DuplicateFinder(memory_mb=0.05, partitions=8, spill_dir=tmp), merge_at=9_000)
+        assert os.listdir(tmp) == [], "Spill folders should be deleted after finish()"
+
+        same = pd.DataFrame({"a": [1] * 50_000, "b": ["x"] * 50_000})
+        collapsed = DuplicateFinder(memory_mb=0.1, spill_dir=tmp).update(same).finish()
+
+        keys = DuplicateFinder(keys=["email"], spill_dir=tmp).update(df).finish()
+
+    for result in (in_memory, spilled, merged):
+        assert {k: result[k] for k in expected} == expected, (result, expected)
+    assert not in_memory["spilled"] and spilled["spilled"] and merged["spilled"]
+    assert collapsed["duplicates"] == 49_999 and not collapsed["spilled"], "Repeats are collapsed before spilling"
+    emails = df["email"].dropna()
+    assert keys["duplicates"] == int(emails.duplicated().sum()), keys
+
+    print_test_result("DuplicateFinder - Exact counts with spilling", True)
+
+def test_scan_file_duplicate_rows():
+    """memory, streaming and parallel scans should report the same duplicate rows"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dups.csv")
+        base = make_messy(3_000, seed=4)
+        full = pd.concat([base, base.iloc[100:160]], ignore_index=True)
+        full.to_csv(path, index=False)
+        trails = [
+            scan_file(path)[2].audit_trail(),
+            scan_file(path, chunksize=500)[2].audit_trail(),
+            scan_file(path, chunksize=500, workers=2)[2].audit_trail(),
+        ]
+        keyed = scan_file(path, dup_keys=["city"])[2].audit_trail()
+        by_email = scan_file(path, dup_keys=["email"], chunksize=500, workers=2)[2].audit_trail()
+        off = scan_file(path, duplicates=False)[2].audit_trail()
+
+    found = [[item for item in trail if item["rule"] == "duplicate_rows"] for trail in trails]
+    assert all(len(items) == 1 for items in found), found
+    assert all(items == found[0] for items in found), found
+    assert found[0][0]["count"] == 60 and "e.g. rows [3000, 3001" in found[0][0]["description"], found[0][0]
+    city = [item for item in keyed if item["rule"] == "duplicate_rows"][0]
+    assert city["column"] == "city" and city["count"] == int(full["city"].dropna().duplicated().sum()), city
+    assert not any(item["rule"] == "duplicate_rows" for item in off)
+    email = [(item["rule"], item["count"]) for item in by_email if item.get("column") == "email"
+             and item["rule"] in ("duplicate_rows", "duplicate_keys")]
+    assert email == [("duplicate_rows", int(full["email"].dropna().duplicated().sum()))], \
+        "A --dup-keys column should not also be counted by the key rule"
+
+    print_test_result("scan_file() - Duplicate rows in every mode", True)
+
+def test_duplicate_keys_rule_bounded():
+    """the key rule counts through capped, spilling fingerprints, chunked or merged"""
+    df = pd.DataFrame({'id': [i % 4_000 for i in range(10_000)],
+                       'email': [f"u{i % 9_000}@x.com" for i in range(10_000)]})
+    expected = {'id': int(df['id'].duplicated().sum()), 'email': int(df['email'].duplicated().sum())}
+    old = os.environ.get("DATASIGHT_SPILL")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATASIGHT_SPILL"] = tmp
+        try:
+            rule = RULES['duplicate_keys'](memory_mb=0.02)
+            for start in range(0, 6_000, 1_000):
+                rule.check(df.iloc[start:start + 1_000])
+            spilled = any(finder.folder for finder in rule.finders.values())
+            other = RULES['duplicate_keys'](memory_mb=0.02)
+            other.check(df.iloc[6_000:].reset_index(drop=True))
+            found = rule.merge(other, offset=6_000) or rule.finish()
+            left = os.listdir(tmp)
+        finally:
+            if old is None:
+                os.environ.pop("DATASIGHT_SPILL")
+            else:
+                os.environ["DATASIGHT_SPILL"] = old
+    assert spilled, "A tiny memory cap should spill to disk"
+    assert {col: count for col, (count, _) in found.items()} == expected, found
+    assert found['id'][1] == [4000, 4001, 4002, 4003, 4004] and left == [], found['id']
+    trail, _ = run_rules(df, ['duplicate_keys'])
+    assert findings_by_rule(trail) == {('duplicate_keys', col): n for col, n in expected.items()}
+
+    print_test_result("DuplicateKeys - Capped and spilled", True)
+
+# ==================== outlier tests ====================
+
+def test_outlier_detector_streams_and_groups():
+    """chunked, merged and grouped outlier search should find the planted values"""
+    rng = np.random.default_rng(7)
+    n = 60_000
+    df = pd.DataFrame({
+        "department": np.where(np.arange(n) % 3 == 0, "exec", "ops"),
+        "salary": rng.normal(50_000, 5_000, n).round(),
+        "score": rng.uniform(-1, 1, n),
+    })
+    # execs earn more, so 150k is normal for them but an outlier for ops
+    execs = df["department"] == "exec"
+    df.loc[execs, "salary"] = rng.normal(150_000, 10_000, execs.sum()).round()
+    planted = [11, 2_000, 37_501, 59_998]
+    df.loc[planted, "score"] = [40.0, -35.0, 60.0, 25.0]
+    df.loc[[1, 2], "salary"] = 150_000.0
+
+    whole = OutlierDetector("mad").update(df).finish()
+    chunked = OutlierDetector("mad")
+    for start in range(0, n, 7_000):
+        chunked.update(df.iloc[start:start + 7_000])
+    chunked = chunked.finish()
+    left, right = OutlierDetector("mad"), OutlierDetector("mad")
+    left.update(df.iloc[:25_000])
+    right.update(df.iloc[25_000:].reset_index(drop=True))
+    merged = left.merge(right, offset=25_000).finish()
+    for result in (whole, chunked, merged):
+        assert result["score"]["rows"] == planted and result["score"]["count"] == 4, result["score"]
+    assert whole["salary"]["count"] > 19_000, "Without groups every exec salary looks odd"
+
+    grouped = OutlierDetector("iqr", group_by="department").update(df).finish()
+    assert grouped["salary"]["rows"] == [1, 2] and grouped["salary"]["groups"] == {"ops": 2}, grouped["salary"]
+
+    capped = OutlierDetector("mad", buffer_rows=2)
+    for start in range(0, n, 7_000):
+        capped.update(df.iloc[start:start + 7_000])
+    capped = capped.finish()["score"]
+    assert capped["approximate"] and capped["count"] >= 4, capped
+
+    print_test_result("OutlierDetector - Streams, merges and groups", True)
+
+def test_scan_file_outliers():
+    """the audit trail should name the outlying rows of dirty_data.csv"""
+    trail = scan_file("dirty_data.csv")[2].audit_trail()
+    found = {item["column"]: item for item in trail if item["rule"] == "outliers"}
+    assert set(found) == {"Age", "Spend"}, found
+    assert found["Age"]["count"] == 2 and "rows [2, 3]" in found["Age"]["description"]
+    assert "rows [4]" in found["Spend"]["description"]
+    off = scan_file("dirty_data.csv", outliers=False)[2].audit_trail()
+    assert not any(item["rule"] == "outliers" for item in off)
+
+    print_test_result("scan_file() - Outlier findings", True)
+
+def test_outlier_counts_marked_approximate():
+    """counts from partial or compacted sketches say "about", exact ones do not"""
+    rng = np.random.default_rng(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "spend.csv")
+        pd.DataFrame({"spend": np.r_[rng.uniform(10, 20, 120), [500, 900]]}).to_csv(path, index=False)
+        memory = [item for item in scan_file(path)[2].audit_trail() if item["rule"] == "outliers"]
+        streamed = [item for item in scan_file(path, chunksize=40)[2].audit_trail() if item["rule"] == "outliers"]
+    assert memory[0]["count"] == 2 and "has 2 outliers" in memory[0]["description"], memory
+    assert "has about" in streamed[0]["description"], streamed
+    big = OutlierDetector("iqr").update(pd.DataFrame({"x": np.r_[rng.uniform(0, 1, 20000), [50.0]]}))
+    assert big.finish()["x"]["approximate"], "A compacted sketch gives approximate fences"
+
+    print_test_result("OutlierDetector - Approximate counts", True)
+
+# ==================== writer tests ====================
+
+def test_frame_writer_formats_and_atomic():
+    """chunks written as gzip / zstd csv and parquet read back the same; a failed write leaves nothing"""
+    df = pd.DataFrame({"id": range(1000), "city": [["oslo", "lima"][i % 2] for i in range(1000)],
+                       "spend": [i * 0.5 for i in range(1000)]})
+    chunks = lambda: (df.iloc[i:i + 300] for i in range(0, len(df), 300))
+    with tempfile.TemporaryDirectory() as tmp:
+        names = ["out.csv.gz"] + (["out.csv.zst", "out.parquet", "out.feather"] if pyarrow is not None else [])
+        for name in names:
+            path = os.path.join(tmp, name)
+            stats = write_chunks(chunks(), path)
+            assert stats["rows"] == len(df) and stats["bytes"] == os.path.getsize(path), stats
+            back = read_frame(path) if not name.endswith(".zst") else pd.read_csv(pyarrow.CompressedInputStream(path, "zstd"))
+            pd.testing.assert_frame_equal(back, df, check_dtype=False)
+
+        target = os.path.join(tmp, "broken.csv")
+        try:
+            with FrameWriter(target) as out:
+                out.write(df)
+                raise KeyError("boom")
+        except KeyError:
+            pass
+        assert not any("broken" in f for f in os.listdir(tmp)), "An aborted write should leave no target and no temp file"
+        if pyarrow is not None:
+            try:
+                write_chunks([df, df.assign(id="text")], os.path.join(tmp, "mixed.parquet"))
+                assert False, "A chunk with other column types should fail"
+            except ValueError:
+                pass
+            assert not any("mixed" in f for f in os.listdir(tmp))
+
+    print_test_result("FrameWriter - Formats and atomic rename", True)
+
+def test_write_fixed_streams_compressed():
+    """a streamed, gzipped auto-fix should match the in-memory one"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.csv")
+        pd.DataFrame({
+            'id': range(2000),
+            'age': [None if i % 7 == 0 else (i % 90) - 5 for i in range(2000)],
+            'email': [None if i % 11 == 0 else f"user{i % 40}@x.com" for i in range(2000)],
+        }).to_csv(path, index=False)
+        df, _, engine = scan_file(path)
+        trail = engine.audit_trail()
+        expected = pd.read_csv(write_fixed(path, trail, df))
+        stats = {}
+        out = write_fixed(path, trail, chunksize=300, compression="gzip", stats=stats)
+        assert out == os.path.join(tmp, "fixed_sample.csv.gz"), out
+        assert stats["rows"] == len(expected) and stats["compression"] == "gzip", stats
+        pd.testing.assert_frame_equal(pd.read_csv(out), expected)
+        if pyarrow is not None:
+            out = write_fixed(path, trail, chunksize=300, out_format="parquet")
+            assert out.endswith("fixed_sample.parquet")
+            pd.testing.assert_frame_equal(pd.read_parquet(out), expected, check_dtype=False)
+
+    print_test_result("write_fixed() - Streamed, compressed, parquet", True)
+
+def test_write_fixed_keeps_function_result():
+    """a fix_function that returns a new frame is written out on the in-memory path"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.csv")
+        pd.DataFrame({'id': [1, 2, 2, 3], 'age': [30, None, None, 41]}).to_csv(path, index=False)
+        df = pd.read_csv(path)
+        trail = [
+            {'rule': 'missing_values', 'fix': {'action': 'fill', 'column': 'age', 'strategy': 'mode'}},
+            {'rule': 'duplicate_rows', 'fix_function': lambda frame: frame.drop_duplicates()},
+        ]
+        fixed = pd.read_csv(write_fixed(path, trail, df))
+        assert fixed['id'].tolist() == [1, 2, 3], fixed
+        assert fixed['age'].isna().sum() == 0
+
+    print_test_result("write_fixed() - fix_function result kept", True)
+
+# ==================== sampling tests ====================
+
+def test_sampling_intervals():
+    """wilson intervals, block design effect and an unbiased reservoir"""
+    low, high = wilson_interval(0.1, 1000)
+    assert 0.08 < low < 0.1 < high < 0.125, (low, high)
+    assert wilson_interval(0.1, 500, population=500) == (0.1, 0.1), "A sample of every row is exact"
+    assert wilson_interval(0.0, 100)[0] == 0.0 and wilson_interval(0.0, 100)[1] > 0.0
+    assert effective_size([10, 10, 10], [100, 100, 100]) == 300, "Blocks that agree keep the full size"
+    assert effective_size([0, 30, 0], [100, 100, 100]) < 30, "Blocks that disagree count for less"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp)
+        sample, total = reservoir_sample(path, 500, chunksize=300, seed=7)
+        assert total == 2000 and len(sample) == 500 and sample.index.is_unique, (total, len(sample))
+        assert sample.index.is_monotonic_increasing, "Sample should come back in file order"
+        assert 850 < sample.index.to_series().mean() < 1150, "Every part of the file should be picked alike"
+        assert (sample["id"] == sample.index).all(), "Index should be the row number in the file"
+
+    print_test_result("Sampling - Intervals and reservoir", True)
+
+def test_scan_file_sample_blocks():
+    """a block sample of a big csv estimates the rates within its intervals"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_sample_csv(tmp, rows=60000)
+        frames, info = draw_sample(path, rows=3000, mode="blocks", blocks=30, seed=3)
+        assert info["mode"] == "blocks" and len(frames) == 30 and not info["total_exact"], info
+        assert abs(info["total_rows"] - 60000) < 3000, info["total_rows"]
+        low, high = SampleEstimate(frames, info).estimate("missing_values", "age")[2:]
+        assert low <= 1 / 7 <= high, (low, high)
+
+        _, metadata, engine = scan_file(path, sample=3000, sample_mode="blocks")
+        assert metadata["sample"]["rows"] >= 3000 and abs(metadata["row_count"] - 60000) < 3000
+        found = {(item["rule"], item["column"]): item for item in engine.audit_trail()}
+        age = found[("missing_values", "age")]
+        assert age["estimated"] and age["rate_low"] < age["rate"] < age["rate_high"], age
+        assert abs(age["count"] - 60000 / 7) < 1500 and "row sample" in age["description"]
+        assert ("duplicate_keys", "email") not in found, "Repeats cannot be scaled up from a sample"
+
+        if pyarrow is not None:
+            parquet = os.path.join(tmp, "sample.parquet")
+            pd.read_csv(path).to_parquet(parquet, row_group_size=2000)
+            frames, info = draw_sample(parquet, rows=3000, mode="blocks", seed=1)
+            assert info["total_exact"] and info["total_rows"] == 60000 and info["row_numbers"], info
+            assert all((frame["id"] == frame.index).all() for frame in frames)
+
+    print_test_result("scan_file() - Block sample estimates", True)
+
+# ==================== batch tests ====================
+
+def test_batch_globs_pool_and_report():
+    """batch mode expands globs and folders, keeps going past a bad file and writes one report"""
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, "drop", "sub"))
+        write_sample_csv(os.path.join(tmp, "drop"))
+        pd.read_csv("messy_sample.csv").to_csv(os.path.join(tmp, "drop", "sub", "messy.csv"), index=False)
+        open(os.path.join(tmp, "drop", "sub", "empty.csv"), "w").close()
+        open(os.path.join(tmp, "drop", "notes.md"), "w").close()
+        open(os.path.join(tmp, "drop", "fixed_sample.csv"), "w").close()
+        with open(os.path.join(tmp, "drop", "readme.txt"), "w") as f:
+            f.write("not, a, table\n")
+        files = batch.collect_files([os.path.join(tmp, "drop"), os.path.join(tmp, "drop", "**", "*.csv")])
+        assert [os.path.basename(f) for f in files] == ["sample.csv", "empty.csv", "messy.csv"], files
+        # a .txt is read as csv only when it is named on its own
+        assert batch.collect_files([os.path.join(tmp, "drop", "*.txt")]) == []
+        assert batch.collect_files([os.path.join(tmp, "drop", "readme.txt")]) == \
+            [os.path.normpath(os.path.join(tmp, "drop", "readme.txt"))]
+        assert os.path.basename(batch.largest_first(files)[0]) == "sample.csv", "Biggest file should go first"
+
+        os.chdir(tmp)
+        try:
+            summary = batch.run_batch(["drop"], workers=2, report="report.json", quiet=True)
+            rows = batch.run_batch(["drop"], workers=1, report="report.csv", quiet=True)
+            with open("datasight_error.log", encoding="utf-8") as f:
+                assert "EmptyDataError" in f.read(), "A bad file should be logged"
+            with open("report.json", encoding="utf-8") as f:
+                saved = json.load(f)
+            table = pd.read_csv("report.csv")
+            # a report written into the scanned folder is not audited by the next run
+            batch.run_batch(["drop"], workers=1, report=os.path.join("drop", "report.csv"), quiet=True)
+            again = batch.run_batch(["drop"], workers=1, report=os.path.join("drop", "report.csv"), quiet=True)
+            assert again["files"] == 3, [r["file"] for r in again["results"]]
+        finally:
+            os.chdir(here)
+    assert summary["files"] == 3 and summary["ok"] == 2 and summary["failed"] == 1, summary
+    assert summary["rows"] == 2000 + 7 and saved["by_rule"] == summary["by_rule"]
+    assert summary["by_rule"]["missing_values"] == sum(
+        r["by_rule"].get("missing_values", 0) for r in summary["results"])
+    assert [r["by_rule"] for r in rows["results"]] == [r["by_rule"] for r in summary["results"]], \
+        "Pool and in-process runs should agree"
+    assert list(table["status"]) == ["ok", "failed", "ok"] and "missing_values" in table.columns
+
+    print_test_result("Batch - Globs, pool and report", True)
+
+def test_batch_ai_summaries():
+    """--ai sends every audited file's metadata to the scheduler and keeps its summary"""
+    stub, state, stub_url = start_stub()
+    os.environ.update(GEMINI_BASE_URL=stub_url, DATASIGHT_CACHE="off")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_sample_csv(tmp)
+            pd.read_csv("messy_sample.csv").to_csv(os.path.join(tmp, "messy.csv"), index=False)
+            open(os.path.join(tmp, "empty.csv"), "w").close()
+            report = os.path.join(tmp, "report.json")
+            summary = batch.run_batch([tmp], workers=2, report=report, quiet=True, ai=True, api_key="stub-key")
+            with open(report, encoding="utf-8") as f:
+                saved = json.load(f)
+    finally:
+        stub.shutdown()
+        del os.environ["GEMINI_BASE_URL"], os.environ["DATASIGHT_CACHE"]
+    by_file = {os.path.basename(r["file"]): r for r in summary["results"]}
+    assert by_file["sample.csv"]["ai_summary"].startswith("stub audit"), by_file["sample.csv"]
+    assert by_file["messy.csv"]["ai_summary"].startswith("stub audit")
+    assert by_file["empty.csv"]["status"] == "failed" and by_file["empty.csv"]["ai_summary"] is None
+    assert state.calls >= 1 and summary["ai"]["calls"] == state.calls, summary["ai"]
+    assert all("metadata" not in r for r in saved["results"]), "Metadata should not end up in the report"
+
+    print_test_result("Batch - AI summaries", True)
+
+# ==================== profile tests ====================
+
+def test_table_profile_wide_table():
+    """a wide table profiles into arrays that still read like the old metadata dict"""
+    rng = np.random.default_rng(5)
+    wide = pd.DataFrame(rng.normal(size=(200, 3000)), columns=[f"c{i}" for i in range(3000)])
+    wide.iloc[::10, 7] = np.nan
+    wide["name"] = ["ann", None] * 100
+    metadata = get_metadata(wide)
+    assert isinstance(metadata, TableProfile) and len(metadata["columns"]) == 3001
+    assert metadata["null_counts"]["c7"] == 20 and metadata["null_counts"]["name"] == 100
+    assert metadata.column("c7").nulls == 20 and metadata.column("name").mean is None
+    assert metadata["stats"]["c3"]["min"] == wide["c3"].min() and "quantiles" in metadata["stats"]["c3"]
+    plain = metadata.to_dict()
+    assert set(plain) == {"columns", "null_counts", "head", "row_count", "stats"} and plain["row_count"] == 200
+    assert json.dumps(TableProfile.from_dict(plain).to_dict(), sort_keys=True, default=str) == \
+        json.dumps(plain, sort_keys=True, default=str), "from_dict should round trip"
+    copy = pickle.loads(pickle.dumps(metadata))
+    assert copy["stats"]["c9"] == metadata["stats"]["c9"] and copy.column("name").distinct == 1
+    metadata["row_count"], metadata["note"] = 10, "x"
+    assert metadata["row_count"] == 10 and metadata["note"] == "x" and "note" in metadata.to_dict()
+    try:
+        metadata["stats"] = {}
+        assert False, "stats should not be replaceable"
+    except TypeError:
+        pass
+    assert cache_key(metadata, "m", "p") == cache_key(metadata.to_dict(), "m", "p")
+    assert [item["column"] for item in metadata_findings(metadata)] == ["c7", "name"]
+
+    print_test_result("TableProfile - Wide table as arrays", True)
+
+def test_table_profile_json():
+    """get_metadata output goes straight into json.dumps, like the old metadata dict"""
+    df = pd.DataFrame({"age": [31, None, 45], "name": ["ann", "bob", None]})
+    metadata = get_metadata(df)
+    metadata["note"] = "x"
+    assert isinstance(metadata, dict)
+    assert json.loads(json.dumps(metadata)) == json.loads(json.dumps(metadata.to_dict()))
+    assert json.loads(json.dumps(metadata))["null_counts"] == {"age": 1, "name": 1}
+    assert json.loads(json.dumps(pickle.loads(pickle.dumps(metadata))))["note"] == "x"
+    assert {**metadata}["row_count"] == 3 and dict(metadata)["stats"]["age"]["count"] == 2
+
+    print_test_result("TableProfile - json.dumps", True)
+
+# ==================== semantic type tests ====================
+
+def semantic_frame(rows=3000):
+    """columns whose names do not give their type away, with a few bad values each"""
+    return pd.DataFrame({
+        'contact': [f"user{i}@x.com" if i % 100 else f"user{i}_at_x.com" for i in range(rows)],
+        'joined': [f"2024-0{1 + i % 9}-{1 + i % 28:02d}" if i % 500 else "2024-02-30" for i in range(rows)],
+        'reach': [f"+1 555-{i % 1000:03d}-{i % 10000:04d}" if i % 250 else "ask bob" for i in range(rows)],
+        'ref': [f"{i:08x}-0000-4000-8000-{i:012x}" if i % 300 else "none" for i in range(rows)],
+        'customer_id': [f"CUS-{i:05d}" if i % 400 else f"cus{i}" for i in range(rows)],
+        'city': ["oslo", "lima", "12345"] * (rows // 3),
+        'score': np.arange(rows) / 7,
+    })
+
+def test_semantic_types_from_values():
+    """types come from the values when the names say nothing, and bad values are reported"""
+    df = semantic_frame()
+    types = {col: kind['type'] for col, kind in detect_types(df).items()}
+    assert types == {'contact': 'email', 'joined': 'date', 'reach': 'phone', 'ref': 'id', 'customer_id': 'id'}, types
+    phones = pd.Series(["+44 20 7946 0958", "555-1234", "12345", "x"])
+    assert invalid_mask(phones, {'type': 'phone', 'pattern': PHONE_PATTERN}).tolist() == [False, False, True, True]
+
+    trail, _ = run_rules(df)
+    found = findings_by_rule(trail)
+    assert found[('invalid_emails', 'contact')] == 30 and found[('impossible_dates', 'joined')] == 6
+    assert found[('invalid_phones', 'reach')] == 12 and found[('invalid_ids', 'ref')] == 10
+    assert found[('invalid_ids', 'customer_id')] == 8 and not any(col in ('city', 'score') for _, col in found)
+    dates = next(item for item in trail if item['rule'] == 'impossible_dates')
+    assert dates['examples'] == ['2024-02-30'] and "'2024-02-30'" in dates['description'], dates
+    ids = next(item for item in trail if item['column'] == 'customer_id')
+    assert ids['semantic_type'] == 'id' and ids['examples'] == ['cus0', 'cus400', 'cus800', 'cus1200', 'cus1600']
+
+    print_test_result("Semantic types - Detected from values", True)
+
+def test_semantic_types_names_need_values():
+    """a telling name alone is not enough, and dates are parsed in the format they have"""
+    df = pd.DataFrame({
+        'order_date': ["01/05/2024", "12/31/2023", "02/28/2024", "07/04/2024", "13/13/2024", "11/11/2024"],
+        'ship_date': ["31.01.2024", "01.02.2024", "15.03.2024", "30.02.2024", "10.10.2024", "01.01.2025"],
+        'email_opt_in': ["yes", "no", "no", "yes", "yes", "no"],
+    })
+    types = detect_types(df)
+    assert types['order_date']['format'] == "%m/%d/%Y" and types['ship_date']['format'] == "%d.%m.%Y", types
+    assert 'email_opt_in' not in types, "A yes/no column is not an email column"
+    found = {key: n for key, n in findings_by_rule(run_rules(df)[0]).items() if key[0] != 'duplicate_keys'}
+    assert found == {('impossible_dates', 'order_date'): 1, ('impossible_dates', 'ship_date'): 1}, found
+
+    print_test_result("Semantic types - Names need matching values", True)
+
+def test_semantic_types_streaming():
+    """chunks, worker ranges and appended ranges all use the types of the file head"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "people.csv")
+        df = semantic_frame(4002)
+        # the id format changes half way: only the head decides what a valid id is
+        df['customer_id'] = [f"CUS-{i:05d}" if i < 2000 else f"cus{i}" for i in range(len(df))]
+        df.to_csv(path, index=False)
+        serial = findings_by_rule(run_rules(pd.read_csv(path))[0])
+        _, _, chunked = scan_file(path, chunksize=700)
+        _, _, parallel = scan_file(path, chunksize=300, workers=4)
+        result = audit_local(path, chunksize=700)
+
+        # a few bad emails appended later are checked like the first rows were
+        incremental_scan(path, folder=tmp)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("x_at_y.com,2024-01-01,+1 555-000-0000,,CUS-99999,oslo,1.0\n" * 2)
+        _, appended, info = incremental_scan(path, folder=tmp)
+
+    rules = ('invalid_emails', 'impossible_dates', 'invalid_phones', 'invalid_ids')
+    semantic = {key: count for key, count in serial.items() if key[0] in rules}
+    assert len(semantic) == 5 and semantic[('invalid_ids', 'customer_id')] == 2002, serial
+    assert {key: findings_by_rule(chunked.audit_trail()).get(key) for key in semantic} == semantic
+    assert {key: findings_by_rule(parallel.audit_trail()).get(key) for key in semantic} == semantic
+    assert result['semantic_types']['contact'] == 'email' and result['semantic_types']['reach'] == 'phone'
+    assert info['mode'] == 'incremental' and info['new_rows'] == 2
+    found = findings_by_rule(appended.audit_trail())
+    assert found[('invalid_emails', 'contact')] == semantic[('invalid_emails', 'contact')] + 2, found
+
+    print_test_result("Semantic types - Streaming, parallel and incremental", True)
+
 def run_all_tests():
     """run the full test suite"""
     print(f"\n{YELLOW}{'='*50}{RESET}")
@@ -256,6 +1764,120 @@ def run_all_tests():
             test_workflow_clean_data,
             test_workflow_dirty_data,
         ]),
+        ("Streaming", [
+            test_stream_metadata_matches_full,
+            test_accumulator_merge,
+            test_stream_metadata_header_only,
+        ]),
+        ("Parallel", [
+            test_split_byte_ranges_aligned,
+            test_parallel_matches_serial,
+            test_parallel_compressed_streams,
+        ]),
+        ("Sketches", [
+            test_hyperloglog_estimate_and_merge,
+            test_kll_quantiles,
+            test_metadata_distribution_stats,
+        ]),
+        ("Rule Engine", [
+            test_rules_dirty_data,
+            test_rules_messy_sample,
+            test_rules_chunked_and_parallel,
+            test_metadata_findings,
+        ]),
+        ("Auto-fix", [
+            test_fix_plan_matches_fix_functions,
+            test_fix_plan_streaming,
+            test_frequent_items,
+        ]),
+        ("Cache", [
+            test_cache_key_stable,
+            test_cache_ttl_lru_and_counters,
+            test_get_ai_audit_uses_cache,
+        ]),
+        ("Scheduler", [
+            test_retry_hint,
+            test_token_bucket_rate,
+            test_scheduler_retries_429,
+            test_scheduler_packs_small_files,
+            test_split_sections_known_names,
+        ]),
+        ("Service", [
+            test_service_audit,
+        ]),
+        ("Serializer", [
+            test_serializer_small_table,
+            test_serializer_wide_table_budget,
+        ]),
+        ("Columnar Formats", [
+            test_columnar_matches_csv,
+            test_parquet_projection_footer_nulls,
+            test_tsv_and_semicolon_csv,
+        ]),
+        ("Lean Ingestion", [
+            test_lean_read_downcasts_and_widens,
+            test_lean_audit_matches_default,
+        ]),
+        ("Checkpoints", [
+            test_incremental_scan_appends,
+            test_incremental_scan_outliers,
+            test_incremental_scan_key_index,
+            test_incremental_compressed_full_scan,
+        ]),
+        ("Benchmarks", [
+            test_messy_generator_rates,
+            test_benchmark_runner_against_stub,
+        ]),
+        ("Profiling", [
+            test_run_audit_profile,
+        ]),
+        ("Startup", [
+            test_main_imports_fast,
+            test_offline_never_loads_sdk,
+        ]),
+        ("Streaming Summary", [
+            test_get_ai_audit_streams,
+        ]),
+        ("Model Probe", [
+            test_probe_ranks_models,
+        ]),
+        ("Hedging", [
+            test_hedged_call_races_models,
+            test_hedged_call_clock_and_threads,
+            test_get_ai_audit_hedges_against_stub,
+        ]),
+        ("Duplicates", [
+            test_duplicate_finder_spills_exactly,
+            test_duplicate_keys_rule_bounded,
+            test_scan_file_duplicate_rows,
+        ]),
+        ("Outliers", [
+            test_outlier_detector_streams_and_groups,
+            test_scan_file_outliers,
+            test_outlier_counts_marked_approximate,
+        ]),
+        ("Writer", [
+            test_frame_writer_formats_and_atomic,
+            test_write_fixed_streams_compressed,
+            test_write_fixed_keeps_function_result,
+        ]),
+        ("Sampling", [
+            test_sampling_intervals,
+            test_scan_file_sample_blocks,
+        ]),
+        ("Batch", [
+            test_batch_globs_pool_and_report,
+            test_batch_ai_summaries,
+        ]),
+        ("Profile", [
+            test_table_profile_wide_table,
+            test_table_profile_json,
+        ]),
+        ("Semantic Types", [
+            test_semantic_types_from_values,
+            test_semantic_types_names_need_values,
+            test_semantic_types_streaming,
+        ]),
     ]
     
     total_passed = 0